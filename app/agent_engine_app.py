@@ -13,34 +13,44 @@
 # limitations under the License.
 
 # mypy: disable-error-code="attr-defined,arg-type"
+import json
 import logging
 import os
+from collections.abc import AsyncIterator, Iterator
 from typing import Any
 
 import click
 import google.auth
 import vertexai
+from google.adk.agents.invocation_context import new_invocation_context_id
 from google.adk.artifacts import GcsArtifactService
+from google.adk.events.event import Event
 from google.cloud import logging as google_cloud_logging
+from google.genai import types
 from opentelemetry import trace
 from opentelemetry.sdk.trace import TracerProvider, export
 from vertexai._genai.types import AgentEngine, AgentEngineConfig
 from vertexai.agent_engines.templates.adk import AdkApp
 
 from app.agent import root_agent
+from app.utils.admission import AdmissionController, AdmissionRejected
+from app.utils.coalescing import Broadcast, StreamFlight, normalize_query
 from app.utils.deployment import (
     parse_env_vars,
     print_deployment_success,
     write_deployment_metadata,
 )
 from app.utils.gcs import create_bucket_if_not_exists
+from app.utils.metrics import cache_hits, set_up_metrics
+from app.utils.sampling import TailSamplingSpanProcessor
+from app.utils.span_store import LocalSpanStore
 from app.utils.tracing import CloudTraceLoggingSpanExporter
 from app.utils.typing import Feedback
 
 
 class AgentEngineApp(AdkApp):
     def set_up(self) -> None:
-        """Set up logging and tracing for the agent engine app."""
+        """Set up logging, tracing and metrics for the agent engine app."""
         import logging
 
         super().set_up()
@@ -48,13 +58,206 @@ class AgentEngineApp(AdkApp):
         logging_client = google_cloud_logging.Client()
         self.logger = logging_client.logger(__name__)
         provider = TracerProvider()
-        processor = export.BatchSpanProcessor(
-            CloudTraceLoggingSpanExporter(
-                project_id=os.environ.get("GOOGLE_CLOUD_PROJECT")
+        processor = TailSamplingSpanProcessor.from_env(
+            export.BatchSpanProcessor(
+                CloudTraceLoggingSpanExporter(
+                    project_id=os.environ.get("GOOGLE_CLOUD_PROJECT")
+                )
             )
         )
         provider.add_span_processor(processor)
+        span_store_size = int(os.environ.get("LOCAL_SPAN_STORE_SIZE", "0"))
+        self.span_store = LocalSpanStore(span_store_size) if span_store_size else None
+        if self.span_store:
+            provider.add_span_processor(self.span_store)
         trace.set_tracer_provider(provider)
+        set_up_metrics()
+        self.admission = AdmissionController.from_env()
+        self.first_turns: StreamFlight[dict[str, Any]] = StreamFlight()
+
+    async def async_stream_query(
+        self, *, message: str | dict[str, Any], user_id: str, **kwargs: Any
+    ) -> AsyncIterator[dict[str, Any]]:
+        """Stream a turn, shedding it with a busy event when over capacity.
+
+        Identical first turns arriving concurrently are coalesced: one leader runs
+        the orchestrator and the others receive its events as they are produced,
+        recording them into their own session without taking an in-flight slot.
+        """
+        if not self._tmpl_attrs.get("runner"):
+            self.set_up()
+        try:
+            self.admission.check_rate(user_id)
+        except AdmissionRejected as e:
+            logging.warning(f"Shedding turn for user {user_id}: {e}")
+            yield self._busy_event(e)
+            return
+
+        key = self._first_turn_key(message, kwargs)
+        stream: Broadcast[dict[str, Any]] | None = None
+        if key is not None:
+            stream, leader = self.first_turns.begin(key)
+            if not leader:
+                cache_hits.add(1, {"component": "first_turn"})
+                replayed = False
+                try:
+                    async for event in self._replay_first_turn(
+                        message=str(message), user_id=user_id, events=stream
+                    ):
+                        replayed = True
+                        yield event
+                    return
+                except Exception:
+                    if replayed:
+                        raise
+                # The leader was shed or failed before its first event, run this
+                # turn on its own.
+                key, stream = None, None
+
+        try:
+            await self.admission.acquire_slot()
+        except AdmissionRejected as e:
+            logging.warning(f"Shedding turn for user {user_id}: {e}")
+            if stream is not None:
+                self.first_turns.finish(key, stream, e)
+            yield self._busy_event(e)
+            return
+        error: BaseException | None = RuntimeError(
+            "Coalesced first turn did not complete"
+        )
+        try:
+            async for event in super().async_stream_query(
+                message=message, user_id=user_id, **kwargs
+            ):
+                if stream is not None:
+                    stream.publish(event)
+                yield event
+            error = None
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.admission.release_slot()
+            if stream is not None:
+                self.first_turns.finish(key, stream, error)
+
+    def stream_query(
+        self, *, message: str | dict[str, Any], user_id: str, **kwargs: Any
+    ) -> Iterator[dict[str, Any]]:
+        """Stream a turn from the sync path, under the same admission control.
+
+        The calling thread waits for its in-flight slot in the shared queue. First
+        turns are not coalesced on this path.
+        """
+        if not self._tmpl_attrs.get("runner"):
+            self.set_up()
+        try:
+            self.admission.check_rate(user_id)
+            self.admission.acquire_slot_blocking()
+        except AdmissionRejected as e:
+            logging.warning(f"Shedding turn for user {user_id}: {e}")
+            yield self._busy_event(e)
+            return
+        try:
+            yield from super().stream_query(message=message, user_id=user_id, **kwargs)
+        finally:
+            self.admission.release_slot()
+
+    @staticmethod
+    def _first_turn_key(
+        message: str | dict[str, Any], kwargs: dict[str, Any]
+    ) -> tuple[str, str] | None:
+        """Return the coalescing key of a first turn, or None if it must run alone.
+
+        Only plain-text messages opening a new session with no prior events are
+        coalesced, as their answer does not depend on any per-user state.
+        """
+        if not isinstance(message, str) or set(kwargs) - {"run_config"}:
+            return None
+        config = json.dumps(kwargs.get("run_config"), sort_keys=True, default=str)
+        return normalize_query(message), config
+
+    async def _replay_first_turn(
+        self, message: str, user_id: str, events: Broadcast[dict[str, Any]]
+    ) -> AsyncIterator[dict[str, Any]]:
+        """Record a leader's first turn in a new session of `user_id` and stream it.
+
+        The session is only created once the leader's first event arrives, so
+        that a follower whose leader fails early can still run the turn itself.
+        """
+        session_service = self._tmpl_attrs.get("session_service")
+        session = None
+        invocation_id = new_invocation_context_id()
+        async for event_dict in events.subscribe():
+            if session is None:
+                session = await session_service.create_session(
+                    app_name=self._app_name(), user_id=user_id
+                )
+                await session_service.append_event(
+                    session=session,
+                    event=Event(
+                        invocation_id=invocation_id,
+                        author="user",
+                        content=types.Content(
+                            role="user", parts=[types.Part(text=message)]
+                        ),
+                    ),
+                )
+            event = Event.model_validate(event_dict).model_copy(
+                update={"id": Event.new_id(), "invocation_id": invocation_id}
+            )
+            if not event.partial:
+                await session_service.append_event(session=session, event=event)
+            yield event.model_dump(mode="json", exclude_none=True)
+
+    def _busy_event(self, rejection: AdmissionRejected) -> dict[str, Any]:
+        """Build the event returned in place of a shed turn."""
+        event = Event(
+            author=root_agent.name,
+            error_code="RESOURCE_EXHAUSTED",
+            error_message=f"429 Too Many Requests: {rejection.reason}",
+            content=types.Content(
+                role="model",
+                parts=[
+                    types.Part(
+                        text=(
+                            "Je reçois beaucoup de questions en ce moment. "
+                            "Réessaie dans quelques secondes !"
+                        )
+                    )
+                ],
+            ),
+            custom_metadata={
+                "admission": {
+                    "status": "busy",
+                    "reason": rejection.reason,
+                    "retry_after_s": round(rejection.retry_after, 1),
+                }
+            },
+            turn_complete=True,
+        )
+        return event.model_dump(mode="json", exclude_none=True)
+
+    def span_report(self, top_n: int = 10) -> dict[str, Any]:
+        """Summarize the spans held by the local span store.
+
+        The store is enabled by setting LOCAL_SPAN_STORE_SIZE to the number of
+        spans to keep.
+        """
+        if not self.span_store:
+            return {"error": "Local span store disabled, set LOCAL_SPAN_STORE_SIZE"}
+        slowest = self.span_store.slowest_traces(top_n)
+        critical_path = (
+            self.span_store.critical_path(slowest[0]["trace_id"]) if slowest else []
+        )
+        return {
+            "slowest_traces": slowest,
+            "latency_percentiles_ms": self.span_store.latency_percentiles(),
+            "slowest_critical_path": [
+                {"name": span.name, "duration_ms": span.duration_ms}
+                for span in critical_path
+            ],
+        }
 
     def register_feedback(self, feedback: dict[str, Any]) -> None:
         """Collect and log feedback."""
@@ -64,10 +267,11 @@ class AgentEngineApp(AdkApp):
     def register_operations(self) -> dict[str, list[str]]:
         """Registers the operations of the Agent.
 
-        Extends the base operations to include feedback registration functionality.
+        Extends the base operations to include feedback registration and the local
+        span store report.
         """
         operations = super().register_operations()
-        operations[""] = operations.get("", []) + ["register_feedback"]
+        operations[""] = [*operations.get("", []), "register_feedback", "span_report"]
         return operations
 
 
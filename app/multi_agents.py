@@ -23,9 +23,14 @@ import vertexai
 from google.adk.agents import Agent
 from google.adk.tools import AgentTool
 from langchain_google_vertexai import VertexAIEmbeddings
+from opentelemetry import trace
+from opentelemetry.trace import Status, StatusCode
 
-from app.retrievers import get_compressor, get_retriever
+from app.retrievers import get_compressor, get_retriever, with_depth, with_top_n
 from app.templates import format_docs
+from app.utils.coalescing import SingleFlight, normalize_query
+from app.utils.metrics import agent_callbacks, cache_hits, stage_timer
+from app.utils.retrieval_depth import AdaptiveDepth, RetrievalDepth, first_stage_scores
 
 # Configuration
 EMBEDDING_MODEL = "text-embedding-005"
@@ -39,7 +44,17 @@ os.environ.setdefault("GOOGLE_CLOUD_LOCATION", LLM_LOCATION)
 os.environ.setdefault("GOOGLE_GENAI_USE_VERTEXAI", "True")
 
 vertexai.init(project=project_id, location=LOCATION)
-embedding = VertexAIEmbeddings(
+
+
+class TimedVertexAIEmbeddings(VertexAIEmbeddings):
+    """Embeddings Vertex AI dont les appels sont mesurés comme étape "embed"."""
+
+    def embed_query(self, text: str) -> list[float]:
+        with stage_timer("retrieve_docs", "embed"):
+            return super().embed_query(text)
+
+
+embedding = TimedVertexAIEmbeddings(
     project=project_id, location=LOCATION, model_name=EMBEDDING_MODEL
 )
 
@@ -59,12 +74,24 @@ retriever = get_retriever(
 
 compressor = get_compressor(project_id=project_id)
 
+# Les recherches identiques lancées en même temps (toute une classe qui pose la
+# même question) partagent un seul appel au retriever et au reranker. La clé
+# inclut la profondeur choisie : deux requêtes de même forme normalisée mais de
+# profondeurs différentes ne partagent pas leurs documents. L'outil est
+# asynchrone et la recherche, bloquante, tourne dans un thread : la boucle
+# d'événements continue de servir les autres tours, qui peuvent la rejoindre.
+retrieval_flight: SingleFlight[str] = SingleFlight()
+
+# Nombre de candidats et de documents gardés choisi pour chaque requête : une
+# simple définition n'a pas besoin de la profondeur d'une question d'examen.
+retrieval_depth = AdaptiveDepth.from_env()
+
 
 # ============================================================================
 # AGENT 1: SEARCH AGENT - Spécialisé dans la recherche documentaire
 # ============================================================================
 
-def retrieve_docs(query: str) -> str:
+async def retrieve_docs(query: str) -> str:
     """
     Outil de recherche documentaire avancée.
     Récupère et classe les documents pertinents pour une requête donnée.
@@ -75,18 +102,62 @@ def retrieve_docs(query: str) -> str:
     Returns:
         str: Documents formatés et classés par pertinence.
     """
+    depth = retrieval_depth.choose(query)
     try:
-        retrieved_docs = retriever.invoke(query)
-        ranked_docs = compressor.compress_documents(
-            documents=retrieved_docs, query=query
+        formatted_docs = await retrieval_flight.do_async(
+            (normalize_query(query), depth),
+            lambda: _search_and_format(query, depth),
+            on_join=lambda: cache_hits.add(1, {"component": "retrieve_docs"}),
         )
-        formatted_docs = format_docs.format(docs=ranked_docs)
     except Exception as e:
+        # L'erreur est rendue à l'agent : on marque le span de l'outil en échec
+        # pour que la trace soit toujours conservée par l'échantillonnage.
+        span = trace.get_current_span()
+        span.record_exception(e)
+        span.set_status(Status(StatusCode.ERROR, str(e)))
         return f"Erreur lors de la recherche documentaire:\n\n{type(e)}: {e}"
     
     return formatted_docs
 
 
+def _search_and_format(query: str, depth: RetrievalDepth) -> str:
+    """Récupère, classe et formate les documents pour une requête.
+
+    La profondeur de recherche dépend de la requête, et le reranking est sauté
+    quand les meilleurs candidats se détachent déjà nettement par leur similarité
+    avec la requête : on garde alors les `top_n` meilleurs candidats selon cette
+    similarité. L'embedding de la requête est calculé une seule fois, pour la
+    recherche et pour ces scores. Chaque étape est mesurée séparément.
+    """
+    query_embedding = embedding.embed_query(query)
+    with stage_timer("retrieve_docs", "search"):
+        retrieved_docs = with_depth(
+            retriever, depth.max_documents, query_embedding
+        ).invoke(query)
+    scores = first_stage_scores(query_embedding, retrieved_docs, EMBEDDING_COLUMN)
+    kept_docs = (
+        retrieval_depth.keep_without_rerank(scores, retrieved_docs, depth.top_n)
+        if scores
+        else None
+    )
+    trace.get_current_span().set_attributes(
+        {
+            "retrieval.max_documents": depth.max_documents,
+            "retrieval.top_n": depth.top_n,
+            "retrieval.rerank_skipped": kept_docs is not None,
+        }
+    )
+    if kept_docs is not None:
+        ranked_docs = kept_docs
+    else:
+        with stage_timer("retrieve_docs", "rerank"):
+            ranked_docs = with_top_n(compressor, depth.top_n).compress_documents(
+                documents=retrieved_docs, query=query
+            )
+    with stage_timer("retrieve_docs", "format"):
+        return format_docs.format(docs=ranked_docs)
+
+
 search_agent_instruction = """Tu es un agent spécialisé dans la RECHERCHE DOCUMENTAIRE.
 
 Ta mission principale :
@@ -116,6 +187,7 @@ search_agent = Agent(
     ),
     instruction=search_agent_instruction,
     tools=[retrieve_docs],
+    **agent_callbacks(),
 )
 
 
@@ -159,6 +231,7 @@ pedagogical_agent = Agent(
     ),
     instruction=pedagogical_agent_instruction,
     tools=[],
+    **agent_callbacks(),
 )
 
 
@@ -209,6 +282,7 @@ assessment_agent = Agent(
     ),
     instruction=assessment_agent_instruction,
     tools=[],
+    **agent_callbacks(),
 )
 
 
@@ -259,6 +333,7 @@ planning_agent = Agent(
     ),
     instruction=planning_agent_instruction,
     tools=[],
+    **agent_callbacks(),
 )
 
 
@@ -336,5 +411,6 @@ orchestrator_agent = Agent(
         assessment_agent_tool,
         planning_agent_tool,
     ],
+    **agent_callbacks(),
 )
 
@@ -17,11 +17,61 @@
 import os
 
 from unittest.mock import MagicMock
+from langchain_core.embeddings import Embeddings
 from langchain_google_community.vertex_rank import VertexAIRank
 from langchain_google_vertexai import VertexAIEmbeddings
 from langchain_google_community import VertexAISearchRetriever
 
 
+class PrecomputedQueryEmbedding(Embeddings):
+    """
+    Embeddings returning the embedding of the query, computed beforehand.
+
+    Lets the retriever reuse the query embedding instead of computing it again.
+    """
+
+    def __init__(self, query_embedding: list[float]) -> None:
+        self.query_embedding = query_embedding
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.query_embedding
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        raise NotImplementedError("Only the query embedding is precomputed")
+
+
+def with_depth(
+    retriever: VertexAISearchRetriever,
+    max_documents: int,
+    query_embedding: list[float],
+) -> VertexAISearchRetriever:
+    """
+    Returns a copy of the retriever fetching `max_documents` candidates for a query
+    whose embedding is already known. The copy shares the search client.
+
+    Other retrievers, like the mock used when Vertex AI Search is not available, are
+    returned unchanged.
+    """
+    if not isinstance(retriever, VertexAISearchRetriever):
+        return retriever
+    return retriever.model_copy(
+        update={
+            "max_documents": max_documents,
+            "custom_embedding": PrecomputedQueryEmbedding(query_embedding),
+        }
+    )
+
+
+def with_top_n(compressor: VertexAIRank, top_n: int) -> VertexAIRank:
+    """
+    Returns a copy of the compressor keeping `top_n` documents. The copy shares the
+    ranking client. Other compressors are returned unchanged.
+    """
+    if not isinstance(compressor, VertexAIRank):
+        return compressor
+    return compressor.model_copy(update={"top_n": top_n})
+
+
 def get_retriever(
     project_id: str,
     data_store_id: str,
@@ -12,17 +12,55 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from langchain_core.prompts import (
-    PromptTemplate,
-)
+from collections.abc import Iterator, Sequence
 
-format_docs = PromptTemplate.from_template(
-    """## Context provided:
+from langchain_core.documents import Document
+
+# Reference definition of the context given to the agents, as a jinja template.
+# ContextRenderer produces exactly its output.
+CONTEXT_TEMPLATE = """## Context provided:
 {% for doc in docs%}
 <Document {{ loop.index0 }}>
 {{ doc.page_content | safe }}
 </Document {{ loop.index0 }}>
 {% endfor %}
-""",
-    template_format="jinja2",
-)
+"""
+
+
+class ContextRenderer:
+    """
+    Render retrieved documents as the context given to the agents.
+
+    Wraps each document in `<Document i>` tags by joining strings directly,
+    without the input validation and jinja rendering of a PromptTemplate.
+    """
+
+    header = "## Context provided:\n"
+
+    def format(self, *, docs: Sequence[Document]) -> str:
+        """
+        Render the documents in one string.
+
+        :param docs: The documents, in ranking order
+        :return: The rendered context
+        """
+        return self.header + "".join(
+            [
+                f"\n<Document {i}>\n{doc.page_content}\n</Document {i}>\n"
+                for i, doc in enumerate(docs)
+            ]
+        )
+
+    def iter_format(self, *, docs: Sequence[Document]) -> Iterator[str]:
+        """
+        Render the documents piece by piece: the header, then one document at a time.
+
+        :param docs: The documents, in ranking order
+        :return: An iterator over the pieces of the rendered context
+        """
+        yield self.header
+        for i, doc in enumerate(docs):
+            yield f"\n<Document {i}>\n{doc.page_content}\n</Document {i}>\n"
+
+
+format_docs = ContextRenderer()
@@ -0,0 +1,244 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Callable
+
+
+class AdmissionRejected(Exception):
+    """Raised when a turn is shed instead of being admitted."""
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(f"{reason} (retry after {retry_after:.1f}s)")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens per second."""
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+
+    def try_acquire(self, now: float) -> float:
+        """Take one token if available.
+
+        Args:
+            now: Current monotonic time in seconds
+
+        Returns:
+            0.0 if a token was taken, otherwise the seconds until one is available
+        """
+        elapsed = max(0.0, now - self.updated_at)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """Admission control for agent turns.
+
+    Combines a per-user token bucket, a global cap on in-flight turns and a
+    bounded FIFO wait queue. Slots are handed over to waiters across event loops
+    and to threads blocked in `acquire_slot_blocking`, so a single controller can
+    be shared by the sync and async query paths.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        max_queue: int = 32,
+        queue_timeout: float = 10.0,
+        user_rate: float = 0.5,
+        user_burst: float = 5.0,
+        max_tracked_users: int = 10_000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Initialize the controller.
+
+        Args:
+            max_in_flight: Maximum number of turns running at the same time
+            max_queue: Maximum number of turns waiting for a slot
+            queue_timeout: Seconds a turn may wait for a slot before being shed
+            user_rate: Turns per second refilled in each user's bucket, 0 disables
+                per-user limiting
+            user_burst: Bucket capacity, i.e. the burst a single user may send
+            max_tracked_users: Number of user buckets kept before evicting the oldest
+            clock: Monotonic clock, injectable for tests
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_tracked_users = max_tracked_users
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._in_flight = 0
+        # Sync waiters have no event loop and wait on a concurrent future instead
+        self._waiters: deque[
+            tuple[
+                asyncio.AbstractEventLoop | None,
+                asyncio.Future | concurrent.futures.Future,
+            ]
+        ] = deque()
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """Build a controller from the ADMISSION_* environment variables."""
+        return cls(
+            max_in_flight=int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "8")),
+            max_queue=int(os.environ.get("ADMISSION_MAX_QUEUE", "32")),
+            queue_timeout=float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_S", "10")),
+            user_rate=float(os.environ.get("ADMISSION_USER_RATE", "0.5")),
+            user_burst=float(os.environ.get("ADMISSION_USER_BURST", "5")),
+        )
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def check_rate(self, user_id: str) -> None:
+        """Consume one token from the user's bucket.
+
+        Args:
+            user_id: ID of the user sending the turn
+
+        Raises:
+            AdmissionRejected: If the user exceeded their rate
+        """
+        if self.user_rate <= 0:
+            return
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = TokenBucket(self.user_rate, self.user_burst, now)
+                self._buckets[user_id] = bucket
+                if len(self._buckets) > self.max_tracked_users:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(user_id)
+            wait = bucket.try_acquire(now)
+        if wait:
+            raise AdmissionRejected("rate_limited", wait)
+
+    async def acquire_slot(self) -> None:
+        """Wait for a global in-flight slot.
+
+        Raises:
+            AdmissionRejected: If the wait queue is full or the wait timed out
+        """
+        with self._lock:
+            if self._in_flight < self.max_in_flight and not self._waiters:
+                self._in_flight += 1
+                return
+            if len(self._waiters) >= self.max_queue:
+                raise AdmissionRejected("queue_full", self.queue_timeout)
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(waiter[1], timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                still_queued = waiter in self._waiters
+                if still_queued:
+                    self._waiters.remove(waiter)
+            # If we were no longer queued, the slot was already handed over and
+            # `_grant` will release it once it sees the cancelled future.
+            if isinstance(e, asyncio.TimeoutError):
+                raise AdmissionRejected("queue_timeout", self.queue_timeout) from e
+            raise
+
+    def acquire_slot_blocking(self) -> None:
+        """Wait for a global in-flight slot from a thread without an event loop.
+
+        Shares the slots and the wait queue of `acquire_slot`, for the sync query
+        path.
+
+        Raises:
+            AdmissionRejected: If the wait queue is full or the wait timed out
+        """
+        with self._lock:
+            if self._in_flight < self.max_in_flight and not self._waiters:
+                self._in_flight += 1
+                return
+            if len(self._waiters) >= self.max_queue:
+                raise AdmissionRejected("queue_full", self.queue_timeout)
+            waiter = (None, concurrent.futures.Future())
+            self._waiters.append(waiter)
+
+        try:
+            waiter[1].result(timeout=self.queue_timeout)
+        except concurrent.futures.TimeoutError as e:
+            with self._lock:
+                # Sync waiters are granted under the lock, so a waiter that is
+                # no longer queued already holds the slot.
+                if waiter not in self._waiters:
+                    return
+                self._waiters.remove(waiter)
+            raise AdmissionRejected("queue_timeout", self.queue_timeout) from e
+
+    def release_slot(self) -> None:
+        """Release an in-flight slot, handing it to the next waiter if any."""
+        with self._lock:
+            while self._waiters:
+                loop, future = self._waiters.popleft()
+                if future.done():
+                    continue
+                if loop is None:
+                    future.set_result(None)
+                    return
+                if loop.is_closed():
+                    continue
+                loop.call_soon_threadsafe(self._grant, future)
+                return
+            self._in_flight -= 1
+
+    def _grant(self, future: asyncio.Future) -> None:
+        if future.done():
+            self.release_slot()
+        else:
+            future.set_result(None)
+
+    async def acquire(self, user_id: str) -> None:
+        """Admit a turn for `user_id`: rate check first, then a global slot.
+
+        Raises:
+            AdmissionRejected: If the turn must be shed
+        """
+        self.check_rate(user_id)
+        await self.acquire_slot()
+
+    def release(self) -> None:
+        """Release the slot taken by `acquire`."""
+        self.release_slot()
@@ -0,0 +1,298 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+from collections.abc import AsyncIterator, Callable, Hashable
+from concurrent.futures import Future
+from functools import partial
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+def normalize_query(text: str) -> str:
+    """Normalize a query so that trivially different spellings share a key.
+
+    Args:
+        text: Raw query text
+
+    Returns:
+        The casefolded query with whitespace collapsed
+    """
+    return " ".join(text.casefold().split())
+
+
+class SingleFlight(Generic[T]):
+    """Coalesce concurrent identical work onto a single in-flight future.
+
+    The first caller for a key becomes the leader and does the work; callers
+    arriving while it runs wait on the same future and receive the same result
+    (or exception). The key is forgotten as soon as the leader finishes, so
+    nothing is cached beyond the lifetime of the in-flight call.
+
+    Futures are `concurrent.futures.Future` objects so that waiters can live on
+    any thread or event loop.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future[T]] = {}
+        self._running: set[asyncio.Future[T]] = set()
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def begin(self, key: Hashable) -> tuple[Future[T], bool]:
+        """Join the in-flight call for `key`, or start one.
+
+        Args:
+            key: Identity of the work
+
+        Returns:
+            The shared future and whether the caller is the leader. The leader
+            must eventually call `resolve` or `fail` with this future.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def resolve(self, key: Hashable, future: Future[T], result: T) -> None:
+        """Publish the leader's result to all waiters and forget the key.
+
+        The key is only forgotten if `future` is still its in-flight call, so
+        that a late leader never drops the call of the next one.
+        """
+        self._forget(key, future)
+        if not future.done():
+            future.set_result(result)
+
+    def fail(self, key: Hashable, future: Future[T], error: BaseException) -> None:
+        """Publish the leader's failure to all waiters and forget the key.
+
+        This is a no-op if the call was already resolved.
+        """
+        self._forget(key, future)
+        if not future.done():
+            future.set_exception(error)
+
+    def _forget(self, key: Hashable, future: Future[T]) -> None:
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], T],
+        on_join: Callable[[], None] | None = None,
+    ) -> T:
+        """Run `fn` once for all concurrent callers sharing `key`.
+
+        Args:
+            key: Identity of the work
+            fn: Zero-argument callable doing the work
+            on_join: Called when the caller joins a call already in flight,
+                e.g. to count it as a cache hit
+
+        Returns:
+            The result of the single execution of `fn`
+        """
+        future, leader = self.begin(key)
+        if not leader:
+            if on_join is not None:
+                on_join()
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self.fail(key, future, e)
+            raise
+        self.resolve(key, future, result)
+        return result
+
+    async def do_async(
+        self,
+        key: Hashable,
+        fn: Callable[[], T],
+        on_join: Callable[[], None] | None = None,
+    ) -> T:
+        """Run the blocking `fn` once for all concurrent async callers of `key`.
+
+        The leader runs `fn` in a worker thread, so that the event loop keeps
+        serving the callers that join it meanwhile. The work is not cancelled
+        with the leader: the callers that joined still receive its result.
+
+        Args:
+            key: Identity of the work
+            fn: Zero-argument blocking callable doing the work
+            on_join: Called when the caller joins a call already in flight,
+                e.g. to count it as a cache hit
+
+        Returns:
+            The result of the single execution of `fn`
+        """
+        future, leader = self.begin(key)
+        if not leader:
+            if on_join is not None:
+                on_join()
+            return await self.wait(future)
+        work = asyncio.ensure_future(asyncio.to_thread(fn))
+        with self._lock:
+            self._running.add(work)
+        work.add_done_callback(partial(self._settle, key, future))
+        return await self.wait(future)
+
+    def _settle(
+        self, key: Hashable, future: Future[T], work: asyncio.Future[T]
+    ) -> None:
+        with self._lock:
+            self._running.discard(work)
+        if work.cancelled():
+            self.fail(key, future, asyncio.CancelledError())
+        elif (error := work.exception()) is not None:
+            self.fail(key, future, error)
+        else:
+            self.resolve(key, future, work.result())
+
+    @staticmethod
+    async def wait(future: Future[T]) -> T:
+        """Await a shared future without letting a cancelled waiter cancel it."""
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+
+class Broadcast(Generic[T]):
+    """Items published by one producer, streamed live to any number of readers.
+
+    Readers that subscribe late first receive the items already published, then
+    the following ones as they are published. Readers can live on any thread or
+    event loop.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._items: list[T] = []
+        self._closed = False
+        self._error: BaseException | None = None
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def publish(self, item: T) -> None:
+        """Send `item` to all current and future readers."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Cannot publish to a closed broadcast")
+            self._items.append(item)
+            self._wake()
+
+    def close(self, error: BaseException | None = None) -> None:
+        """End the stream of all readers, with `error` if the producer failed.
+
+        This is a no-op if the broadcast is already closed.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._error = error
+            self._wake()
+
+    async def subscribe(self) -> AsyncIterator[T]:
+        """Iterate over all the items, waiting for new ones until closed.
+
+        Raises:
+            BaseException: The error the broadcast was closed with, once all the
+                items published before it have been read
+        """
+        loop = asyncio.get_running_loop()
+        index = 0
+        while True:
+            with self._lock:
+                items = self._items[index:]
+                index += len(items)
+                if not items:
+                    if self._closed:
+                        if self._error is not None:
+                            raise self._error
+                        return
+                    wake = asyncio.Event()
+                    self._waiters.append((loop, wake))
+            if items:
+                for item in items:
+                    yield item
+            else:
+                await wake.wait()
+
+    def _wake(self) -> None:
+        for loop, wake in self._waiters:
+            loop.call_soon_threadsafe(wake.set)
+        self._waiters.clear()
+
+
+class StreamFlight(Generic[T]):
+    """Coalesce concurrent identical streams onto a single in-flight broadcast.
+
+    Like `SingleFlight`, but for work producing a stream: followers receive the
+    leader's items as it produces them rather than once it has finished.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._streams: dict[Hashable, Broadcast[T]] = {}
+
+    def __len__(self) -> int:
+        return len(self._streams)
+
+    def begin(self, key: Hashable) -> tuple[Broadcast[T], bool]:
+        """Join the in-flight stream for `key`, or start one.
+
+        Args:
+            key: Identity of the work
+
+        Returns:
+            The shared broadcast and whether the caller is the leader. The
+            leader publishes its items to it and must eventually call `finish`.
+        """
+        with self._lock:
+            stream = self._streams.get(key)
+            if stream is not None:
+                return stream, False
+            stream = Broadcast()
+            self._streams[key] = stream
+            return stream, True
+
+    def finish(
+        self,
+        key: Hashable,
+        stream: Broadcast[T],
+        error: BaseException | None = None,
+    ) -> None:
+        """Close the leader's stream and forget the key if it is still its own.
+
+        Args:
+            key: Identity of the work
+            stream: The broadcast returned to the leader by `begin`
+            error: The leader's failure, if any, raised to the followers
+        """
+        with self._lock:
+            if self._streams.get(key) is stream:
+                del self._streams[key]
+        stream.close(error)
@@ -0,0 +1,364 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.tools import BaseTool, ToolContext
+from opentelemetry import metrics
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import (
+    Histogram,
+    MetricExporter,
+    MetricExportResult,
+    MetricsData,
+    PeriodicExportingMetricReader,
+    Sum,
+)
+from opentelemetry.sdk.metrics.view import ExplicitBucketHistogramAggregation, View
+
+# Bucket boundaries in ms, from a cache hit up to a slow multi-agent turn.
+LATENCY_BUCKETS_MS = (
+    1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 20000, 40000, 80000
+)  # fmt: skip
+
+_meter = metrics.get_meter("mon-agent-scolaire")
+latency_ms = _meter.create_histogram(
+    "agent.latency", unit="ms", description="Latency per component and stage"
+)
+tokens = _meter.create_counter(
+    "agent.tokens", unit="{token}", description="LLM tokens in and out"
+)
+cache_hits = _meter.create_counter(
+    "agent.cache_hits", description="Calls served by coalescing or caches"
+)
+errors = _meter.create_counter("agent.errors", description="Failed calls")
+
+# Time spent in nested stages, subtracted from the enclosing stage.
+_nested_ms: ContextVar[list[float] | None] = ContextVar("nested_ms", default=None)
+
+
+@contextmanager
+def stage_timer(component: str, stage: str) -> Iterator[None]:
+    """
+    Record the latency of a stage of `component`, and an error if it raises.
+
+    Stages can be nested: the time of inner stages is excluded from the outer
+    one, so that each stage reports its own share of the latency.
+
+    :param component: The component, e.g. "retrieve_docs"
+    :param stage: The stage within the component, e.g. "rerank"
+    """
+    parent = _nested_ms.get()
+    children: list[float] = [0.0]
+    token = _nested_ms.set(children)
+    start = time.perf_counter()
+    attributes = {"component": component, "stage": stage}
+    try:
+        yield
+    except Exception:
+        errors.add(1, attributes)
+        raise
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        _nested_ms.reset(token)
+        latency_ms.record(elapsed - children[0], attributes)
+        if parent is not None:
+            parent[0] += elapsed
+
+
+class _CallbackTimings:
+    """
+    Start times of in-flight agent, model and tool calls, keyed by call.
+
+    A call whose `after_*` callback never runs (cancelled turn, exception outside
+    the callbacks) leaves its start time behind: past `max_entries` in-flight
+    calls, the oldest ones are dropped and their latency is not recorded.
+
+    :param max_entries: Maximum number of start times kept
+    """
+
+    def __init__(self, max_entries: int = 10_000) -> None:
+        self._lock = threading.Lock()
+        self._starts: OrderedDict[tuple[str, ...], float] = OrderedDict()
+        self.max_entries = max_entries
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def start(self, *key: str) -> None:
+        with self._lock:
+            self._starts[key] = time.perf_counter()
+            self._starts.move_to_end(key)
+            while len(self._starts) > self.max_entries:
+                self._starts.popitem(last=False)
+
+    def stop(self, *key: str) -> float | None:
+        with self._lock:
+            start = self._starts.pop(key, None)
+        return None if start is None else (time.perf_counter() - start) * 1000
+
+
+_timings = _CallbackTimings()
+
+
+def before_agent(callback_context: CallbackContext) -> None:
+    _timings.start("agent", callback_context.invocation_id, callback_context.agent_name)
+
+
+def after_agent(callback_context: CallbackContext) -> None:
+    elapsed = _timings.stop(
+        "agent", callback_context.invocation_id, callback_context.agent_name
+    )
+    if elapsed is not None:
+        latency_ms.record(
+            elapsed, {"component": callback_context.agent_name, "stage": "agent"}
+        )
+
+
+def before_model(callback_context: CallbackContext, llm_request: LlmRequest) -> None:
+    _timings.start("llm", callback_context.invocation_id, callback_context.agent_name)
+
+
+def after_model(callback_context: CallbackContext, llm_response: LlmResponse) -> None:
+    if llm_response.partial:
+        return
+    attributes = {"component": callback_context.agent_name, "stage": "llm"}
+    elapsed = _timings.stop(
+        "llm", callback_context.invocation_id, callback_context.agent_name
+    )
+    if elapsed is not None:
+        latency_ms.record(elapsed, attributes)
+    usage = llm_response.usage_metadata
+    if usage is not None:
+        tokens.add(usage.prompt_token_count or 0, {**attributes, "direction": "in"})
+        tokens.add(
+            usage.candidates_token_count or 0, {**attributes, "direction": "out"}
+        )
+    if llm_response.error_code:
+        errors.add(1, attributes)
+
+
+def on_model_error(
+    callback_context: CallbackContext, llm_request: LlmRequest, error: Exception
+) -> None:
+    _timings.stop("llm", callback_context.invocation_id, callback_context.agent_name)
+    errors.add(1, {"component": callback_context.agent_name, "stage": "llm"})
+
+
+def before_tool(
+    tool: BaseTool, args: dict[str, Any], tool_context: ToolContext
+) -> None:
+    _timings.start("tool", tool_context.function_call_id or tool.name)
+
+
+def after_tool(
+    tool: BaseTool,
+    args: dict[str, Any],
+    tool_context: ToolContext,
+    tool_response: Any,
+) -> None:
+    elapsed = _timings.stop("tool", tool_context.function_call_id or tool.name)
+    if elapsed is not None:
+        latency_ms.record(elapsed, {"component": tool.name, "stage": "tool"})
+
+
+def on_tool_error(
+    tool: BaseTool, args: dict[str, Any], tool_context: ToolContext, error: Exception
+) -> None:
+    _timings.stop("tool", tool_context.function_call_id or tool.name)
+    errors.add(1, {"component": tool.name, "stage": "tool"})
+
+
+def agent_callbacks() -> dict[str, Any]:
+    """Return the ADK callbacks recording agent, LLM and tool metrics.
+
+    Meant to be unpacked into the `Agent(...)` constructor.
+    """
+    return {
+        "before_agent_callback": before_agent,
+        "after_agent_callback": after_agent,
+        "before_model_callback": before_model,
+        "after_model_callback": after_model,
+        "on_model_error_callback": on_model_error,
+        "before_tool_callback": before_tool,
+        "after_tool_callback": after_tool,
+        "on_tool_error_callback": on_tool_error,
+    }
+
+
+class PrometheusTextFileExporter(MetricExporter):
+    """
+    Write the current metrics to a file in the Prometheus text format.
+
+    The file is rewritten on every export with cumulative values, which makes it
+    usable offline (load tests, local profiling) or through a node exporter
+    textfile collector. Histograms also get `_p50`, `_p95` and `_p99` lines,
+    estimated from their buckets.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+
+    def export(
+        self,
+        metrics_data: MetricsData,
+        timeout_millis: float = 10_000,
+        **kwargs: Any,
+    ) -> MetricExportResult:
+        lines = []
+        for resource_metrics in metrics_data.resource_metrics:
+            for scope_metrics in resource_metrics.scope_metrics:
+                for metric in scope_metrics.metrics:
+                    lines.extend(_to_prometheus(metric))
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
+        return MetricExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis: float = 10_000) -> bool:
+        return True
+
+    def shutdown(self, timeout_millis: float = 30_000, **kwargs: Any) -> None:
+        pass
+
+
+def set_up_metrics(
+    exporter: MetricExporter | None = None, export_interval_ms: int = 15_000
+) -> MeterProvider | None:
+    """
+    Install a meter provider exporting the agent metrics.
+
+    Without an explicit exporter, one is picked from the environment:
+    METRICS_FILE writes the Prometheus text format to that path, and
+    METRICS_EXPORTER=cloud_monitoring sends the metrics to Cloud Monitoring.
+    Metrics stay disabled (no-op instruments) when neither is set.
+
+    :param exporter: The metric exporter to use
+    :param export_interval_ms: Interval between two exports
+    :return: The installed meter provider, or None if metrics are disabled
+    """
+    if exporter is None:
+        exporter = _exporter_from_env()
+    if exporter is None:
+        return None
+    provider = MeterProvider(
+        metric_readers=[
+            PeriodicExportingMetricReader(
+                exporter, export_interval_millis=export_interval_ms
+            )
+        ],
+        views=[
+            View(
+                instrument_name="agent.latency",
+                aggregation=ExplicitBucketHistogramAggregation(LATENCY_BUCKETS_MS),
+            )
+        ],
+    )
+    metrics.set_meter_provider(provider)
+    return provider
+
+
+def _exporter_from_env() -> MetricExporter | None:
+    if path := os.environ.get("METRICS_FILE"):
+        return PrometheusTextFileExporter(path)
+    if os.environ.get("METRICS_EXPORTER") == "cloud_monitoring":
+        try:
+            from opentelemetry.exporter.cloud_monitoring import (
+                CloudMonitoringMetricsExporter,
+            )
+        except ImportError:
+            logging.warning(
+                "opentelemetry-exporter-gcp-monitoring is not installed, "
+                "metrics are disabled"
+            )
+            return None
+        return CloudMonitoringMetricsExporter()
+    return None
+
+
+def _to_prometheus(metric: Any) -> list[str]:
+    name = re.sub(r"[^a-zA-Z0-9_]", "_", metric.name)
+    if metric.unit == "ms":
+        name += "_ms"
+    lines = []
+    if isinstance(metric.data, Histogram):
+        lines.append(f"# TYPE {name} histogram")
+        for point in metric.data.data_points:
+            labels = dict(point.attributes or {})
+            cumulative = 0
+            for bound, count in zip(
+                [*point.explicit_bounds, float("inf")], point.bucket_counts, strict=True
+            ):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(
+                    f"{name}_bucket{_labels({**labels, 'le': le})} {cumulative}"
+                )
+            lines.append(f"{name}_sum{_labels(labels)} {point.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {point.count}")
+            for q in (50, 95, 99):
+                value = _estimate_quantile(
+                    point.explicit_bounds, point.bucket_counts, q / 100
+                )
+                lines.append(f"{name}_p{q}{_labels(labels)} {value:g}")
+    elif isinstance(metric.data, Sum):
+        name += "_total"
+        lines.append(f"# TYPE {name} counter")
+        for point in metric.data.data_points:
+            lines.append(f"{name}{_labels(dict(point.attributes or {}))} {point.value}")
+    return lines
+
+
+def _labels(labels: dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{key}="{str(value).replace(chr(34), chr(39))}"'
+        for key, value in sorted(labels.items())
+    )
+    return "{" + pairs + "}"
+
+
+def _estimate_quantile(
+    bounds: tuple[float, ...] | list[float],
+    counts: tuple[int, ...] | list[int],
+    q: float,
+) -> float:
+    """Estimate a quantile by linear interpolation within its histogram bucket."""
+    total = sum(counts)
+    if not total:
+        return 0.0
+    target = q * total
+    cumulative = 0
+    for i, count in enumerate(counts):
+        if count and cumulative + count >= target:
+            lower = bounds[i - 1] if i > 0 else 0.0
+            if i >= len(bounds):
+                return float(lower)
+            return lower + (bounds[i] - lower) * (target - cumulative) / count
+        cumulative += count
+    return float(bounds[-1]) if bounds else 0.0
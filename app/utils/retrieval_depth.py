@@ -0,0 +1,190 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import math
+import os
+import re
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from langchain_core.documents import Document
+
+# Markers of a multi-part question: several questions, enumerations, comparisons
+_PART_MARKERS = re.compile(
+    r"\?|;|\n|\b(?:et|puis|ensuite|aussi|and|then)\b|\b\d\)|\bdiff[ée]rences?\b"
+    r"|\bcompar\w*|\bversus\b|\bvs\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass(frozen=True)
+class RetrievalDepth:
+    """Number of candidates fetched from the search and kept after reranking."""
+
+    max_documents: int
+    top_n: int
+
+
+SHALLOW = RetrievalDepth(max_documents=5, top_n=3)
+DEFAULT = RetrievalDepth(max_documents=10, top_n=5)
+DEEP = RetrievalDepth(max_documents=20, top_n=8)
+
+
+class AdaptiveDepth:
+    """Per-query retrieval depth.
+
+    Short single-part lookups fetch and keep fewer documents than the default,
+    long or multi-part questions more. After the first stage, the reranker is
+    skipped when a clear gap in the first-stage scores separates the top results
+    from the rest: they are kept first, followed by the next best candidates by
+    first-stage score up to the number of documents to keep.
+    """
+
+    def __init__(
+        self,
+        shallow: RetrievalDepth = SHALLOW,
+        default: RetrievalDepth = DEFAULT,
+        deep: RetrievalDepth = DEEP,
+        short_query_words: int = 4,
+        long_query_words: int = 20,
+        skip_rerank_margin: float = 0.08,
+        enabled: bool = True,
+    ) -> None:
+        """Initialize the depth policy.
+
+        Args:
+            shallow: Depth of short single-part queries
+            default: Depth of the other queries, and of all queries when disabled
+            deep: Depth of long or multi-part queries
+            short_query_words: Maximum number of words of a short query
+            long_query_words: Minimum number of words of a long query
+            skip_rerank_margin: Minimum gap between two consecutive first-stage
+                scores for the results above it to be kept without reranking,
+                0 never skips the reranker
+            enabled: Whether the depth adapts to the query at all
+        """
+        self.shallow = shallow
+        self.default = default
+        self.deep = deep
+        self.short_query_words = short_query_words
+        self.long_query_words = long_query_words
+        self.skip_rerank_margin = skip_rerank_margin
+        self.enabled = enabled
+
+    @classmethod
+    def from_env(cls) -> "AdaptiveDepth":
+        """Build a policy from the RETRIEVAL_* environment variables."""
+        return cls(
+            skip_rerank_margin=float(
+                os.environ.get("RETRIEVAL_SKIP_RERANK_MARGIN", "0.08")
+            ),
+            enabled=os.environ.get("RETRIEVAL_ADAPTIVE_DEPTH", "true").lower()
+            != "false",
+        )
+
+    def choose(self, query: str) -> RetrievalDepth:
+        """Pick the depth of a query from its length and number of parts.
+
+        Args:
+            query: The search query
+
+        Returns:
+            The number of candidates to fetch and of documents to keep
+        """
+        if not self.enabled:
+            return self.default
+        words = len(query.split())
+        parts = max(1, len(_PART_MARKERS.findall(query)))
+        if words >= self.long_query_words or parts >= 3:
+            return self.deep
+        if words <= self.short_query_words and parts == 1:
+            return self.shallow
+        return self.default
+
+    def separated_count(self, scores: Sequence[float], top_n: int) -> int | None:
+        """Find how many top results are clearly separated from the others.
+
+        Args:
+            scores: First-stage scores of the candidates, in any order
+            top_n: Maximum number of results to keep
+
+        Returns:
+            The number of results above the widest gap of at least the margin
+            among the `top_n` best, or None if there is no such gap and the
+            candidates should be reranked
+        """
+        if not self.enabled or self.skip_rerank_margin <= 0:
+            return None
+        ranked = sorted(scores, reverse=True)
+        count, widest = None, self.skip_rerank_margin
+        for k in range(1, min(top_n, len(ranked) - 1) + 1):
+            gap = ranked[k - 1] - ranked[k]
+            if gap >= widest:
+                count, widest = k, gap
+        return count
+
+    def keep_without_rerank(
+        self, scores: Sequence[float], documents: Sequence[Document], top_n: int
+    ) -> list[Document] | None:
+        """Select the documents to keep when the reranker can be skipped.
+
+        Args:
+            scores: First-stage scores of the candidates
+            documents: The candidates, in the order of their scores
+            top_n: Number of documents to keep
+
+        Returns:
+            The `top_n` best candidates by first-stage score, or all of them if
+            there are fewer, or None if the top results are not clearly separated
+            from the others and the candidates should be reranked
+        """
+        if self.separated_count(scores, top_n) is None:
+            return None
+        ranked = sorted(
+            zip(scores, documents, strict=True), key=lambda pair: pair[0], reverse=True
+        )
+        return [document for _, document in ranked[:top_n]]
+
+
+def first_stage_scores(
+    query_embedding: Sequence[float],
+    documents: Sequence[Document],
+    embedding_field: str = "embedding",
+) -> list[float] | None:
+    """Score the candidates by cosine similarity with the query embedding.
+
+    Uses the chunk embeddings stored in the structured data of the search results.
+
+    Args:
+        query_embedding: Embedding of the query
+        documents: Candidates whose page content is their structured data as JSON
+        embedding_field: Field of the structured data holding the chunk embedding
+
+    Returns:
+        One score per candidate, or None if a candidate has no usable embedding
+    """
+    query_norm = math.sqrt(sum(x * x for x in query_embedding))
+    scores = []
+    for document in documents:
+        try:
+            vector = json.loads(document.page_content)[embedding_field]
+            norm = math.sqrt(sum(x * x for x in vector))
+            dot = sum(x * y for x, y in zip(query_embedding, vector, strict=True))
+        except (KeyError, TypeError, ValueError):
+            return None
+        if not norm or not query_norm:
+            return None
+        scores.append(dot / (norm * query_norm))
+    return scores
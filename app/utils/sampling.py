@@ -0,0 +1,128 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import random
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.trace import StatusCode
+
+
+class _TraceBuffer:
+    def __init__(self) -> None:
+        self.spans: list[ReadableSpan] = []
+        self.has_error = False
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """
+    A span processor that decides whether to keep a trace once its root span ends.
+
+    Spans are buffered per trace. When the local root span ends, the whole trace is
+    forwarded to the wrapped processor if it was slow or contains an error, and
+    otherwise only with probability `sample_rate`.
+    """
+
+    def __init__(
+        self,
+        next_processor: SpanProcessor,
+        sample_rate: float = 0.1,
+        slow_threshold_ms: float = 10_000,
+        max_traces: int = 2048,
+        max_spans_per_trace: int = 2048,
+        rng: Callable[[], float] = random.random,
+    ) -> None:
+        """
+        Initialize the processor.
+
+        :param next_processor: The processor receiving the kept spans
+        :param sample_rate: Probability of keeping a trace that is neither slow
+            nor failed
+        :param slow_threshold_ms: Root span duration above which a trace is kept
+        :param max_traces: Number of open traces buffered before the oldest one is
+            decided without waiting for its root span
+        :param max_spans_per_trace: Spans buffered per trace, extra spans are dropped
+        :param rng: Source of uniform random numbers in [0, 1), for tests
+        """
+        self.next_processor = next_processor
+        self.sample_rate = sample_rate
+        self.slow_threshold_ns = int(slow_threshold_ms * 1e6)
+        self.max_traces = max_traces
+        self.max_spans_per_trace = max_spans_per_trace
+        self.rng = rng
+        self._lock = threading.Lock()
+        self._traces: OrderedDict[int, _TraceBuffer] = OrderedDict()
+
+    @classmethod
+    def from_env(cls, next_processor: SpanProcessor) -> "TailSamplingSpanProcessor":
+        """Build a processor from the TRACE_* environment variables."""
+        return cls(
+            next_processor,
+            sample_rate=float(os.environ.get("TRACE_SAMPLE_RATE", "0.1")),
+            slow_threshold_ms=float(os.environ.get("TRACE_SLOW_THRESHOLD_MS", "10000")),
+        )
+
+    def on_start(self, span: Span, parent_context: Context | None = None) -> None:
+        self.next_processor.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        trace_id = span.context.trace_id
+        is_root = span.parent is None or span.parent.is_remote
+        evicted = None
+        with self._lock:
+            buffer = self._traces.get(trace_id)
+            if buffer is None:
+                buffer = self._traces[trace_id] = _TraceBuffer()
+                if len(self._traces) > self.max_traces:
+                    evicted = self._traces.popitem(last=False)[1]
+            if len(buffer.spans) < self.max_spans_per_trace:
+                buffer.spans.append(span)
+            buffer.has_error = buffer.has_error or _is_error(span)
+            if is_root:
+                del self._traces[trace_id]
+
+        if evicted is not None:
+            self._decide(evicted, root=None)
+        if is_root:
+            self._decide(buffer, root=span)
+
+    def _decide(self, buffer: _TraceBuffer, root: ReadableSpan | None) -> None:
+        """Forward the buffered spans of a trace if it must be kept."""
+        keep = buffer.has_error or self.rng() < self.sample_rate
+        if not keep and root is not None and root.start_time and root.end_time:
+            keep = root.end_time - root.start_time >= self.slow_threshold_ns
+        if keep:
+            for span in buffer.spans:
+                self.next_processor.on_end(span)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            buffers = list(self._traces.values())
+            self._traces.clear()
+        for buffer in buffers:
+            self._decide(buffer, root=None)
+        self.next_processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.next_processor.force_flush(timeout_millis)
+
+
+def _is_error(span: ReadableSpan) -> bool:
+    return span.status.status_code is StatusCode.ERROR or any(
+        event.name == "exception" for event in span.events
+    )
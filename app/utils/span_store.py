@@ -0,0 +1,188 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+import threading
+from collections import defaultdict, deque
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Any
+
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+from opentelemetry.trace import StatusCode, format_trace_id
+
+INVOCATION_ID_ATTRIBUTE = "gcp.vertex.agent.invocation_id"
+
+
+@dataclass(frozen=True)
+class SpanRecord:
+    """The subset of a finished span kept by the local span store."""
+
+    trace_id: str
+    span_id: int
+    parent_id: int | None
+    name: str
+    start_ns: int
+    end_ns: int
+    invocation_id: str | None
+    is_error: bool
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+class LocalSpanStore(SpanProcessor):
+    """
+    A fixed-size, in-memory ring buffer of finished spans with a small query API.
+
+    Meant for profiling the hot path during load tests: it never leaves the
+    process, so it works fully offline and sees every span before sampling.
+    """
+
+    def __init__(self, max_spans: int = 10_000) -> None:
+        """
+        Initialize the store.
+
+        :param max_spans: Number of spans kept, the oldest are overwritten first
+        """
+        self._lock = threading.Lock()
+        self._records: deque[SpanRecord] = deque(maxlen=max_spans)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if not span.start_time or not span.end_time:
+            return
+        attributes = span.attributes or {}
+        invocation_id = attributes.get(INVOCATION_ID_ATTRIBUTE)
+        record = SpanRecord(
+            trace_id=format_trace_id(span.context.trace_id),
+            span_id=span.context.span_id,
+            parent_id=span.parent.span_id if span.parent else None,
+            name=span.name,
+            start_ns=span.start_time,
+            end_ns=span.end_time,
+            invocation_id=str(invocation_id) if invocation_id else None,
+            is_error=span.status.status_code is StatusCode.ERROR,
+        )
+        with self._lock:
+            self._records.append(record)
+
+    def records(self) -> list[SpanRecord]:
+        """Return a snapshot of the stored spans, oldest first."""
+        with self._lock:
+            return list(self._records)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+
+    def slowest_traces(self, n: int = 10) -> list[dict[str, Any]]:
+        """
+        Return the `n` slowest traces, measured on their root span.
+
+        :param n: Number of traces to return
+        :return: One summary dict per trace, slowest first
+        """
+        summaries = []
+        for trace_id, spans in self._by_trace().items():
+            root = _root(spans)
+            summaries.append(
+                {
+                    "trace_id": trace_id,
+                    "root": root.name,
+                    "invocation_id": next(
+                        (s.invocation_id for s in spans if s.invocation_id), None
+                    ),
+                    "duration_ms": root.duration_ms,
+                    "span_count": len(spans),
+                    "has_error": any(s.is_error for s in spans),
+                }
+            )
+        summaries.sort(key=lambda summary: summary["duration_ms"], reverse=True)
+        return summaries[:n]
+
+    def latency_percentiles(
+        self, percentiles: Sequence[float] = (50, 95, 99)
+    ) -> dict[str, dict[str, float]]:
+        """
+        Compute latency percentiles per span name.
+
+        :param percentiles: Percentiles to compute, between 0 and 100
+        :return: For each span name, its span count and the requested percentiles
+            in milliseconds, keyed as "p50", "p95", ...
+        """
+        durations: dict[str, list[float]] = defaultdict(list)
+        for record in self.records():
+            durations[record.name].append(record.duration_ms)
+
+        report = {}
+        for name, values in sorted(durations.items()):
+            values.sort()
+            stats: dict[str, float] = {"count": len(values)}
+            for p in percentiles:
+                stats[f"p{p:g}"] = _nearest_rank(values, p)
+            report[name] = stats
+        return report
+
+    def critical_path(self, invocation_or_trace_id: str) -> list[SpanRecord]:
+        """
+        Return the critical path of an invocation, from its root span down.
+
+        At each level the child that finished last is the one the parent waited
+        on, so following it yields the chain of spans that bounded the latency.
+
+        :param invocation_or_trace_id: An ADK invocation ID or a hex trace ID
+        :return: The spans on the critical path, or an empty list if unknown
+        """
+        by_trace = self._by_trace()
+        spans = by_trace.get(invocation_or_trace_id)
+        if spans is None:
+            spans = next(
+                (
+                    trace_spans
+                    for trace_spans in by_trace.values()
+                    if any(
+                        s.invocation_id == invocation_or_trace_id for s in trace_spans
+                    )
+                ),
+                [],
+            )
+        if not spans:
+            return []
+
+        children: dict[int | None, list[SpanRecord]] = defaultdict(list)
+        for span in spans:
+            children[span.parent_id].append(span)
+        path = [_root(spans)]
+        while children.get(path[-1].span_id):
+            path.append(max(children[path[-1].span_id], key=lambda s: s.end_ns))
+        return path
+
+    def _by_trace(self) -> dict[str, list[SpanRecord]]:
+        by_trace: dict[str, list[SpanRecord]] = defaultdict(list)
+        for record in self.records():
+            by_trace[record.trace_id].append(record)
+        return by_trace
+
+
+def _root(spans: list[SpanRecord]) -> SpanRecord:
+    """Return the local root of a trace, i.e. the span whose parent is not stored."""
+    span_ids = {span.span_id for span in spans}
+    roots = [span for span in spans if span.parent_id not in span_ids]
+    return max(roots, key=lambda span: span.duration_ms)
+
+
+def _nearest_rank(sorted_values: list[float], percentile: float) -> float:
+    rank = max(1, math.ceil(percentile / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
@@ -12,16 +12,33 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import gzip
 import json
 import logging
+import re
+import threading
+import time
+import uuid
 from collections.abc import Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Any
 
 import google.cloud.storage as storage
+from google.api_core.exceptions import InvalidArgument
 from google.cloud import logging as google_cloud_logging
+from google.rpc.error_details_pb2 import DebugInfo
 from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
+from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import ReadableSpan
 from opentelemetry.sdk.trace.export import SpanExportResult
+from opentelemetry.sdk.util import ns_to_iso_str
+from opentelemetry.trace import SpanContext, format_span_id, format_trace_id
+
+# Cloud Logging rejects entries above 256 KB, keep some room for the span fields.
+MAX_LOG_ATTRIBUTES_BYTES = 255 * 1024
+
+# Strings above this length have their size measured by serializing them.
+_EXACT_SIZE_MIN_CHARS = 1024
 
 
 class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
@@ -39,6 +56,9 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
         storage_client: storage.Client | None = None,
         bucket_name: str | None = None,
         debug: bool = False,
+        bucket_check_interval: float = 300.0,
+        upload_workers: int = 2,
+        max_pending_uploads: int = 8,
         **kwargs: Any,
     ) -> None:
         """
@@ -48,6 +68,9 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
         :param storage_client: Google Cloud Storage client
         :param bucket_name: Name of the GCS bucket to store large payloads
         :param debug: Enable debug mode for additional logging
+        :param bucket_check_interval: Seconds before re-checking that the bucket exists
+        :param upload_workers: Number of threads uploading payloads to GCS
+        :param max_pending_uploads: Uploads queued before export blocks on them
         :param kwargs: Additional arguments to pass to the parent class
         """
         super().__init__(**kwargs)
@@ -61,32 +84,45 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
             bucket_name or f"{self.project_id}-mon-agent-scolaire-logs"
         )
         self.bucket = self.storage_client.bucket(self.bucket_name)
+        self._log_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="span-log-writer"
+        )
+        self._resource_cache: tuple[Resource | None, dict[str, Any]] = (None, {})
+        self.bucket_check_interval = bucket_check_interval
+        self._bucket_checked: tuple[float, bool] | None = None
+        self._upload_executor = ThreadPoolExecutor(
+            max_workers=upload_workers, thread_name_prefix="span-payload-upload"
+        )
+        self._upload_slots = threading.BoundedSemaphore(max_pending_uploads)
 
     def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
         """
         Export the spans to Google Cloud Logging and Cloud Trace.
 
+        The whole batch is written to Cloud Logging with a single batched write,
+        which runs on a background thread while the spans are sent to Cloud Trace.
+        The write allows partial success: an entry rejected by the API, e.g. an
+        oversized one, is logged and dropped without losing the rest of the batch.
+        Offloaded attribute values of the batch are uploaded to GCS as a single
+        object, in the background.
+
         :param spans: A sequence of spans to export
         :return: The result of the export operation
         """
+        log_batch = self.logger.batch()
+        payloads = _PayloadBatch(f"spans/batch-{uuid.uuid4().hex}.ndjson.gz")
+        span_ids = []
         for span in spans:
-            span_context = span.get_span_context()
-            trace_id = format(span_context.trace_id, "x")
-            span_id = format(span_context.span_id, "x")
-            span_dict = json.loads(span.to_json())
-
-            span_dict["trace"] = f"projects/{self.project_id}/traces/{trace_id}"
-            span_dict["span_id"] = span_id
-
+            span_dict = self._span_to_dict(span)
+            span_ids.append(span_dict["span_id"])
             span_dict = self._process_large_attributes(
-                span_dict=span_dict, span_id=span_id
+                span_dict=span_dict, span_id=span_dict["span_id"], payloads=payloads
             )
 
             if self.debug:
                 print(span_dict)
 
-            # Log the span data to Google Cloud Logging
-            self.logger.log_struct(
+            log_batch.log_struct(
                 span_dict,
                 labels={
                     "type": "agent_telemetry",
@@ -94,58 +130,254 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
                 },
                 severity="INFO",
             )
+        log_write = self._log_executor.submit(log_batch.commit, partial_success=True)
+        if payloads:
+            self._upload_slots.acquire()
+            upload = self._upload_executor.submit(
+                self.store_in_gcs, payloads.getvalue(), payloads.blob_name
+            )
+            upload.add_done_callback(self._upload_done)
+
         # Export spans to Google Cloud Trace using the parent class method
-        return super().export(spans)
+        result = super().export(spans)
+        try:
+            log_write.result()
+        except InvalidArgument as e:
+            # The valid entries of the batch were written, only these were not
+            rejected = [span_ids[index] for index in _rejected_entries(e)]
+            logging.error(
+                f"Cloud Logging rejected the entries of spans {rejected or 'unknown'}"
+                f": {e.message}"
+            )
+        except Exception:
+            logging.exception("Failed to write span batch to Cloud Logging")
+            return SpanExportResult.FAILURE
+        return result
 
-    def store_in_gcs(self, content: str, span_id: str) -> str:
+    def shutdown(self) -> None:
+        """Wait for pending log writes and uploads before shutting down."""
+        self._log_executor.shutdown(wait=True)
+        self._upload_executor.shutdown(wait=True)
+        super().shutdown()
+
+    def _span_to_dict(self, span: ReadableSpan) -> dict[str, Any]:
         """
-        Initiate storing large content in Google Cloud Storage/
+        Build the log entry of a span directly from its fields.
+
+        The layout matches `ReadableSpan.to_json` so existing log queries keep
+        working, without serializing and re-parsing every span.
 
-        :param content: The content to store
-        :param span_id: The ID of the span
-        :return: The  GCS URI of the stored content
+        :param span: The span to convert
+        :return: The span data dictionary
         """
-        if not self.storage_client.bucket(self.bucket_name).exists():
-            logging.warning(
-                f"Bucket {self.bucket_name} not found. "
-                "Unable to store span attributes in GCS."
+        span_context = span.get_span_context()
+        trace_id = format_trace_id(span_context.trace_id)
+        span_id = format_span_id(span_context.span_id)
+        status = {"status_code": span.status.status_code.name}
+        if span.status.description:
+            status["description"] = span.status.description
+
+        return {
+            "name": span.name,
+            "context": _format_context(span_context),
+            "kind": str(span.kind),
+            "parent_id": (
+                f"0x{format_span_id(span.parent.span_id)}" if span.parent else None
+            ),
+            "start_time": ns_to_iso_str(span.start_time) if span.start_time else None,
+            "end_time": ns_to_iso_str(span.end_time) if span.end_time else None,
+            "status": status,
+            "attributes": _format_attributes(span.attributes),
+            "events": [
+                {
+                    "name": event.name,
+                    "timestamp": ns_to_iso_str(event.timestamp),
+                    "attributes": _format_attributes(event.attributes),
+                }
+                for event in span.events
+            ],
+            "links": [
+                {
+                    "context": _format_context(link.context),
+                    "attributes": _format_attributes(link.attributes),
+                }
+                for link in span.links
+            ],
+            "resource": self._format_resource(span.resource),
+            "trace": f"projects/{self.project_id}/traces/{trace_id}",
+            "span_id": span_id,
+        }
+
+    def _format_resource(self, resource: Resource) -> dict[str, Any]:
+        """Format a span resource, reusing the result for the shared resource."""
+        if self._resource_cache[0] is not resource:
+            self._resource_cache = (
+                resource,
+                {
+                    "attributes": _format_attributes(resource.attributes),
+                    "schema_url": resource.schema_url,
+                },
             )
-            return "GCS bucket not found"
+        return self._resource_cache[1]
 
-        blob_name = f"spans/{span_id}.json"
-        blob = self.bucket.blob(blob_name)
+    def store_in_gcs(self, content: bytes, blob_name: str) -> str:
+        """
+        Store the gzip-compressed NDJSON payloads of an export batch in GCS.
 
-        blob.upload_from_string(content, "application/json")
+        :param content: The concatenated gzip members, one NDJSON line each
+        :param blob_name: The name of the blob within the bucket
+        :return: The GCS URI of the stored content
+        """
+        blob = self.bucket.blob(blob_name)
+        blob.upload_from_string(content, "application/gzip")
         return f"gs://{self.bucket_name}/{blob_name}"
 
-    def _process_large_attributes(self, span_dict: dict, span_id: str) -> dict:
+    def _upload_done(self, upload: Future) -> None:
+        self._upload_slots.release()
+        if upload.exception() is not None:
+            logging.error(
+                f"Failed to store span attributes in GCS: {upload.exception()}"
+            )
+
+    def _bucket_exists(self) -> bool:
+        """Check that the payload bucket exists, caching the answer for a while."""
+        now = time.monotonic()
+        if (
+            self._bucket_checked is None
+            or now - self._bucket_checked[0] > self.bucket_check_interval
+        ):
+            self._bucket_checked = (now, self.bucket.exists())
+        return self._bucket_checked[1]
+
+    def _process_large_attributes(
+        self, span_dict: dict, span_id: str, payloads: "_PayloadBatch"
+    ) -> dict:
         """
-        Process large attribute values by storing them in GCS if they exceed the size
-        limit of Google Cloud Logging.
+        Offload the largest attribute values to GCS when the attributes exceed the
+        size limit of Google Cloud Logging.
+
+        Sizes are estimated per attribute, and only as many values as needed to fit
+        under the limit are moved out, largest first. Each offloaded value is added
+        to the export batch's payload object as its own gzip member, and replaced in
+        the log entry by a reference of the form
+        `gs://<bucket>/<blob>#bytes=<first>-<last>`. That byte range can be fetched
+        on its own and gunzipped into a single NDJSON record.
 
         :param span_dict: The span data dictionary
-        :param trace_id: The trace ID
         :param span_id: The span ID
+        :param payloads: The payload object of the current export batch
         :return: The updated span dictionary
         """
         attributes = span_dict["attributes"]
-        if len(json.dumps(attributes).encode()) > 255 * 1024:  # 250 KB
-            # Separate large payload from other attributes
-            attributes_payload = dict(attributes.items())
-            attributes_retain = dict(attributes.items())
-
-            # Store large payload in GCS
-            gcs_uri = self.store_in_gcs(json.dumps(attributes_payload), span_id)
-            attributes_retain["uri_payload"] = gcs_uri
-            attributes_retain["url_payload"] = (
-                f"https://storage.mtls.cloud.google.com/"
-                f"{self.bucket_name}/spans/{span_id}.json"
-            )
+        sizes = {key: _estimate_size(key, value) for key, value in attributes.items()}
+        total_size = sum(sizes.values())
+        if total_size <= MAX_LOG_ATTRIBUTES_BYTES:
+            return span_dict
 
-            span_dict["attributes"] = attributes_retain
-            logging.info(
-                "Length of payload span above 250 KB, storing attributes in GCS "
-                "to avoid large log entry errors"
+        bucket_exists = self._bucket_exists()
+        if not bucket_exists:
+            logging.warning(
+                f"Bucket {self.bucket_name} not found. "
+                "Unable to store span attributes in GCS."
             )
 
+        attributes_retain = dict(attributes)
+        offloaded = []
+        for key in sorted(sizes, key=sizes.__getitem__, reverse=True):
+            if total_size <= MAX_LOG_ATTRIBUTES_BYTES:
+                break
+            if bucket_exists:
+                first, last = payloads.add(
+                    {"span_id": span_id, "attribute": key, "value": attributes[key]}
+                )
+                reference = (
+                    f"gs://{self.bucket_name}/{payloads.blob_name}#bytes={first}-{last}"
+                )
+            else:
+                reference = "GCS bucket not found"
+            attributes_retain[key] = reference
+            total_size -= sizes[key] - _estimate_size(key, reference)
+            offloaded.append(key)
+
+        attributes_retain["offloaded_attributes"] = offloaded
+        span_dict["attributes"] = attributes_retain
+        logging.info(
+            f"Span attributes above {MAX_LOG_ATTRIBUTES_BYTES // 1024} KB, stored "
+            f"{len(offloaded)} attribute(s) in GCS to avoid large log entry errors"
+        )
         return span_dict
+
+
+class _PayloadBatch:
+    """Offloaded attribute values of one export batch, as gzip-compressed NDJSON.
+
+    Every record is compressed as an independent gzip member. The concatenation
+    is itself a valid gzip stream of the whole NDJSON document, and each record
+    can also be read back alone from its byte range.
+    """
+
+    def __init__(self, blob_name: str) -> None:
+        self.blob_name = blob_name
+        self._buffer = bytearray()
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def add(self, record: dict[str, Any]) -> tuple[int, int]:
+        """Append a record and return its inclusive byte range in the object."""
+        member = gzip.compress((json.dumps(record) + "\n").encode(), compresslevel=6)
+        first = len(self._buffer)
+        self._buffer += member
+        return first, len(self._buffer) - 1
+
+    def getvalue(self) -> bytes:
+        return bytes(self._buffer)
+
+
+def _format_context(context: SpanContext) -> dict[str, str]:
+    return {
+        "trace_id": f"0x{format_trace_id(context.trace_id)}",
+        "span_id": f"0x{format_span_id(context.span_id)}",
+        "trace_state": repr(context.trace_state),
+    }
+
+
+def _format_attributes(attributes: Any) -> dict[str, Any]:
+    """Copy span attributes into a JSON-compatible dict (tuples become lists)."""
+    if not attributes:
+        return {}
+    return {
+        key: list(value) if isinstance(value, tuple) else value
+        for key, value in attributes.items()
+    }
+
+
+def _rejected_entries(error: InvalidArgument) -> list[int]:
+    """Indexes of the batch entries a partially successful write rejected."""
+    return sorted(
+        {
+            int(index)
+            for detail in error.details
+            if isinstance(detail, DebugInfo)
+            for index in re.findall(r"key: (\d+)", detail.detail)
+        }
+    )
+
+
+def _estimate_size(key: str, value: Any) -> int:
+    """Estimate the JSON size in bytes of one attribute.
+
+    Long strings, which decide whether a span fits, are measured exactly with
+    their JSON escaping. Short ones are estimated from their quotes and
+    backslashes, the characters they most often need to escape.
+    """
+    if isinstance(value, str):
+        # Quotes, colon and separator around the key and the value.
+        if len(value) > _EXACT_SIZE_MIN_CHARS:
+            serialized = json.dumps(value, ensure_ascii=False).encode()
+            return len(key) + len(serialized) + 4
+        escaped = value.count('"') + value.count("\\")
+        return len(key) + len(value.encode()) + escaped + 6
+    if isinstance(value, list | tuple):
+        return len(key) + 5 + sum(_estimate_size("", item) for item in value)
+    return len(key) + len(str(value)) + 4
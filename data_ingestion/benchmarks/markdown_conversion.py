@@ -0,0 +1,161 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Throughput benchmark for the HTML to markdown stage of `process_data`.
+
+Generates a synthetic StackOverflow-like corpus (question bodies with code
+blocks, lists and links, and a skewed number of answers per question) and
+compares the former row-by-row conversion with the pooled, batched conversion
+used by the component, at 1, 2, 4 and N worker processes. Pools are started and
+warmed up before the timed region. Usage:
+
+    uv run --with markdownify python benchmarks/markdown_conversion.py --rows 2000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from markdownify import markdownify
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from data_ingestion_pipeline.components.text_processing import (
+    convert_html_to_markdown,
+    convert_questions_to_markdown,
+)
+
+WORDS = (
+    "python list dict pandas dataframe index error value loop function class "
+    "import module async await thread process memory string bytes json file"
+).split()
+
+
+def paragraph(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(20, 80))
+    return f"<p>{' '.join(words)} <a href='https://example.com'>{words[0]}</a></p>"
+
+
+def html_body(rng: random.Random) -> str:
+    parts = [paragraph(rng) for _ in range(rng.randint(1, 4))]
+    if rng.random() < 0.7:
+        code = "\n".join(
+            f"    {' '.join(rng.choices(WORDS, k=6))}"
+            for _ in range(rng.randint(3, 30))
+        )
+        parts.append(f"<pre><code>{code}</code></pre>")
+    if rng.random() < 0.3:
+        items = "".join(f"<li>{w}</li>" for w in rng.choices(WORDS, k=5))
+        parts.append(f"<ul>{items}</ul>")
+    return "\n".join(parts)
+
+
+def make_corpus(rows: int, seed: int = 0) -> list[dict[str, Any]]:
+    """Build rows shaped like the `question_text` and `answers` columns."""
+    rng = random.Random(seed)
+    return [
+        {
+            "question_text": html_body(rng),
+            "answers": [
+                {"body": html_body(rng)}
+                for _ in range(min(int(rng.paretovariate(1.2)), 40))
+            ],
+        }
+        for _ in range(rows)
+    ]
+
+
+def convert_row_by_row(corpus: list[dict[str, Any]]) -> list[str]:
+    """The former implementation: one markdownify call per row, `+=` per answer."""
+    results = []
+    for row in corpus:
+        text = markdownify(row["question_text"]).strip() + "\n"
+        answers_md = ""
+        for index, answer in enumerate(row["answers"]):
+            answers_md += f"\n\n## Answer {index + 1}:\n"
+            answers_md += markdownify(answer["body"]).strip()
+        results.append(text + answers_md)
+    return results
+
+
+def convert_pooled(
+    corpus: list[dict[str, Any]],
+    pool: ProcessPoolExecutor | None,
+    workers: int,
+    batch_size: int,
+) -> list[str]:
+    """The component implementation: one flat list sharded across `pool`."""
+    return convert_questions_to_markdown(
+        [row["question_text"] for row in corpus],
+        [[answer["body"] for answer in row["answers"]] for row in corpus],
+        lambda html: convert_html_to_markdown(html, pool, workers, batch_size),
+    )
+
+
+def start_pool(workers: int) -> ProcessPoolExecutor | None:
+    """Start `workers` processes and wait until they are all up, as the
+    component does once for all its batches."""
+    if workers <= 1:
+        return None
+    pool = ProcessPoolExecutor(max_workers=workers)
+    list(pool.map(markdownify, ["<p>warm up</p>"] * workers * 4, chunksize=1))
+    return pool
+
+
+def report(name: str, elapsed: float, rows: int, workers: int) -> None:
+    rate = rows / elapsed
+    print(
+        f"{name:<14} {elapsed:8.2f}s {rate:10.1f} rows/s "
+        f"{rate / workers:10.1f} rows/s/core ({workers} cores)"
+    )
+
+
+def worker_counts(max_workers: int) -> list[int]:
+    """1, 2, 4 and `max_workers` processes, without duplicates."""
+    return sorted({count for count in (1, 2, 4) if count < max_workers} | {max_workers})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.rows)
+    documents = args.rows + sum(len(row["answers"]) for row in corpus)
+    print(f"{args.rows} rows, {documents} HTML documents")
+    start = time.perf_counter()
+    baseline = convert_row_by_row(corpus)
+    report("row-by-row", time.perf_counter() - start, args.rows, workers=1)
+    for workers in worker_counts(args.workers):
+        pool = start_pool(workers)
+        try:
+            start = time.perf_counter()
+            pooled = convert_pooled(corpus, pool, workers, args.batch_size)
+            elapsed = time.perf_counter() - start
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        report("pooled", elapsed, args.rows, workers)
+        assert pooled == baseline, "pooled conversion differs from row-by-row output"
+
+
+if __name__ == "__main__":
+    main()
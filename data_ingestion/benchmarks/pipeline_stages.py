@@ -0,0 +1,273 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Scaling benchmark for the stages of the ingestion pipeline.
+
+Streams synthetic StackOverflow-like corpora of several sizes through the
+markdown -> chunk -> embed -> export stages locally, in batches as
+`process_data` does, with the deterministic hash embedder standing in for the
+embedding model. Each size runs in a fresh process, so that peak RSS is not
+carried over from a previous size. Wall time, rows/s and peak RSS of every stage
+are written to a JSON report that can be compared across commits. Usage:
+
+    uv run --with markdownify --with langchain-text-splitters \\
+        python benchmarks/pipeline_stages.py --sizes 1000,10000,100000 \\
+        --report benchmark-report.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from data_ingestion_pipeline.components.text_processing import create_text_splitter
+from data_ingestion_pipeline.local_runner import (
+    Chunk,
+    HashEmbedder,
+    JsonlWriter,
+    ParquetShardWriter,
+)
+from markdown_conversion import convert_pooled, make_corpus, start_pool
+
+STAGES = ("markdown", "chunk", "embed", "export")
+
+
+def current_rss_bytes() -> int:
+    """Return the resident set size of this process, or 0 outside Linux."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+class StageProfiler:
+    """Accumulates wall time, rows and peak RSS per stage over all batches.
+
+    A background thread samples the RSS of this process every few milliseconds
+    and attributes it to the stage running at that moment. Markdown workers are
+    separate processes: their peak is taken from `RUSAGE_CHILDREN` instead,
+    which covers every child this process has waited for, hence one process
+    per size.
+    """
+
+    def __init__(self, sample_interval: float = 0.005) -> None:
+        self.wall = dict.fromkeys(STAGES, 0.0)
+        self.rows = dict.fromkeys(STAGES, 0)
+        self.peak_rss = dict.fromkeys(STAGES, 0)
+        self._current: str | None = None
+        self._done = threading.Event()
+        self._sampler = threading.Thread(
+            target=self._sample, args=(sample_interval,), daemon=True
+        )
+        self._sampler.start()
+
+    def _sample(self, interval: float) -> None:
+        while not self._done.wait(interval):
+            stage = self._current
+            if stage is not None:
+                self.peak_rss[stage] = max(self.peak_rss[stage], current_rss_bytes())
+
+    @contextmanager
+    def stage(self, name: str, rows: int) -> Iterator[None]:
+        self._current = name
+        self.peak_rss[name] = max(self.peak_rss[name], current_rss_bytes())
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.wall[name] += time.perf_counter() - start
+            self.rows[name] += rows
+            self.peak_rss[name] = max(self.peak_rss[name], current_rss_bytes())
+            self._current = None
+
+    def close(self) -> None:
+        self._done.set()
+        self._sampler.join()
+
+    def results(self, documents: int) -> list[dict[str, Any]]:
+        results = []
+        for name in STAGES:
+            wall = self.wall[name]
+            results.append(
+                {
+                    "documents": documents,
+                    "stage": name,
+                    "wall_s": round(wall, 4),
+                    "rows": self.rows[name],
+                    "rows_per_s": round(self.rows[name] / wall, 1) if wall else None,
+                    "peak_rss_mb": round(self.peak_rss[name] / 2**20, 1),
+                }
+            )
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        results[0]["peak_workers_rss_mb"] = round(children / 1024, 1)
+        return results
+
+
+def run_size(
+    documents: int,
+    output: Path,
+    export_format: str,
+    workers: int,
+    batch_documents: int,
+    embed_batch_size: int,
+) -> list[dict[str, Any]]:
+    """Stream a corpus of `documents` questions through every stage."""
+    splitter = create_text_splitter()
+    embedder = HashEmbedder()
+    creation_timestamp = datetime.now(timezone.utc).isoformat()
+    writer: JsonlWriter | ParquetShardWriter
+    if export_format == "jsonl":
+        writer = JsonlWriter(output, creation_timestamp, "embedding")
+    else:
+        writer = ParquetShardWriter(output, creation_timestamp, "embedding")
+
+    # Like the component, one pool serves every batch
+    pool = start_pool(workers)
+    profiler = StageProfiler()
+    try:
+        for offset in range(0, documents, batch_documents):
+            size = min(batch_documents, documents - offset)
+            corpus = make_corpus(size, seed=offset)
+            with profiler.stage("markdown", size):
+                markdown = convert_pooled(corpus, pool, workers, batch_size=256)
+            del corpus
+
+            chunks: list[Chunk] = []
+            with profiler.stage("chunk", size):
+                for question_id, text in enumerate(markdown, start=offset):
+                    chunks.extend(
+                        Chunk(
+                            chunk_id=f"{question_id}__{index}",
+                            question_id=question_id,
+                            title=text.split("\n", 1)[0],
+                            text=chunk,
+                            full_text_md=text,
+                            last_edit_date=creation_timestamp,
+                        )
+                        for index, chunk in enumerate(splitter.split_text(text))
+                    )
+            del markdown
+
+            for start in range(0, len(chunks), embed_batch_size):
+                batch = chunks[start : start + embed_batch_size]
+                with profiler.stage("embed", len(batch)):
+                    embeddings = embedder.embed([chunk.text for chunk in batch])
+                with profiler.stage("export", len(batch)):
+                    writer.write(batch, embeddings)
+        with profiler.stage("export", 0):
+            writer.close()
+    finally:
+        profiler.close()
+        if pool is not None:
+            pool.shutdown()
+
+    results = profiler.results(documents)
+    paths = [output] if output.is_file() else list(output.glob("*"))
+    results[-1]["export_format"] = export_format
+    results[-1]["output_mb"] = round(sum(p.stat().st_size for p in paths) / 2**20, 2)
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-documents", type=int, default=1000)
+    parser.add_argument("--embed-batch-size", type=int, default=250)
+    parser.add_argument(
+        "--export-format", choices=["jsonl", "parquet"], default="jsonl"
+    )
+    parser.add_argument("--report", type=Path, default=Path("benchmark-report.json"))
+    # Internal: run a single size in this process and print its results
+    parser.add_argument("--output", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.output is not None:
+        for result in run_size(
+            int(args.sizes),
+            args.output,
+            args.export_format,
+            workers=args.workers,
+            batch_documents=args.batch_documents,
+            embed_batch_size=args.embed_batch_size,
+        ):
+            print(json.dumps(result))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for documents in (int(size) for size in args.sizes.split(",")):
+            output = Path(output_dir) / f"{documents}.{args.export_format}"
+            single_size = subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    f"--sizes={documents}",
+                    f"--workers={args.workers}",
+                    f"--batch-documents={args.batch_documents}",
+                    f"--embed-batch-size={args.embed_batch_size}",
+                    f"--export-format={args.export_format}",
+                    f"--output={output}",
+                ],
+                stdout=subprocess.PIPE,
+                text=True,
+                check=True,
+            )
+            for line in single_size.stdout.splitlines():
+                print(line)
+                results.append(json.loads(line))
+
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": args.workers,
+        "batch_documents": args.batch_documents,
+        "results": results,
+    }
+    args.report.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
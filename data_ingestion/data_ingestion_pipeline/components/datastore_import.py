@@ -0,0 +1,302 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ruff: noqa
+
+"""
+Calls to the Vertex AI Search document service made by `ingest_data`.
+
+The functions are embedded into the `ingest_data` component through
+`additional_funcs`, so each of them must be self-contained: imports go inside
+the function, they may only call each other, and their annotations may only use
+builtins and `typing` names, which is all the component script imports. Clients
+are passed in, so that the unit tests can hand them fakes.
+"""
+
+from typing import Any, Optional
+
+
+def wait_until_indexed(
+    document_client: Any,
+    branch: str,
+    canaries: list[tuple[str, str]],
+    timeout_seconds: float,
+    search_client: Any = None,
+    serving_config: str = "",
+    expected_documents: Optional[int] = None,
+    initial_delay: float = 5.0,
+    max_delay: float = 60.0,
+) -> Optional[float]:
+    """Poll the datastore with exponential backoff until it serves the import.
+
+    Reading the canary documents back by ID is a cheap first check, but the
+    reads succeed as soon as the import operation is done. With a search client,
+    which is what tells that the index serves the import, the search must also
+    count the expected documents and return each canary for its text, which can
+    lag behind by several minutes. The searches only start once every canary is
+    readable.
+
+    Args:
+        document_client: Document service client
+        branch: Branch the documents were imported into
+        canaries: (document id, chunk text) pairs of imported documents
+        timeout_seconds: How long to wait before giving up
+        search_client: Search service client, None to skip the search checks
+        serving_config: Serving config searched with search_client
+        expected_documents: Number of documents the search must count, None
+            when unknown (incremental import)
+        initial_delay: First interval between two polls, doubled after each
+        max_delay: Maximum interval between two polls
+
+    Returns:
+        Seconds until the index was ready, or None if the deadline passed
+    """
+    import logging
+    import time
+
+    from google.api_core.exceptions import NotFound
+    from google.cloud import discoveryengine
+
+    def search(query: str, page_size: int) -> Any:
+        pager = search_client.search(
+            request=discoveryengine.SearchRequest(
+                serving_config=serving_config, query=query, page_size=page_size
+            )
+        )
+        return next(iter(pager.pages))
+
+    start = time.monotonic()
+    deadline = start + timeout_seconds
+    delay = initial_delay
+    unread = dict(canaries)
+    unsearched = dict(canaries) if search_client is not None else {}
+    while True:
+        for document_id in list(unread):
+            try:
+                document_client.get_document(
+                    request=discoveryengine.GetDocumentRequest(
+                        name=f"{branch}/documents/{document_id}"
+                    )
+                )
+            except NotFound:
+                continue
+            del unread[document_id]
+        counted = search_client is None
+        searched = ""
+        if search_client is not None and not unread:
+            indexed_documents = search("", 1).total_size
+            for document_id, text in list(unsearched.items()):
+                response = search(" ".join(text.split()[:32]), 10)
+                if any(result.id == document_id for result in response.results):
+                    del unsearched[document_id]
+            counted = (
+                expected_documents is None or indexed_documents >= expected_documents
+            )
+            searched = (
+                f", {indexed_documents}/{expected_documents or '?'} documents and "
+                f"{len(canaries) - len(unsearched)}/{len(canaries)} canaries searchable"
+            )
+        elapsed = time.monotonic() - start
+        logging.info(
+            f"{len(canaries) - len(unread)}/{len(canaries)} canaries readable"
+            f"{searched} after {elapsed:.0f}s"
+        )
+        if counted and not unread and not unsearched:
+            return elapsed
+        if time.monotonic() + delay > deadline:
+            return None
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+def purge_documents(
+    client: Any, branch: str, ids_uri: str, poll_seconds: int = 30
+) -> int:
+    """Delete the documents whose IDs are listed in GCS files, in one operation.
+
+    Args:
+        client: Document service client
+        branch: Branch the documents are deleted from
+        ids_uri: URI of the files, which may be a wildcard, holding one document
+            ID per line
+        poll_seconds: Interval between two checks of the operation
+
+    Returns:
+        Number of documents deleted. The IDs of documents that are already
+        gone, e.g. deleted by a previous attempt, are ignored
+
+    Raises:
+        RuntimeError: If some documents could not be deleted
+    """
+    import logging
+    import time
+
+    from google.cloud import discoveryengine
+
+    operation = client.purge_documents(
+        request=discoveryengine.PurgeDocumentsRequest(
+            parent=branch,
+            gcs_source=discoveryengine.GcsSource(
+                input_uris=[ids_uri], data_schema="document_id"
+            ),
+            filter="*",
+            force=True,
+        )
+    )
+    logging.info(f"Waiting for purge operation: {operation.operation.name}")
+    while not operation.done():
+        time.sleep(poll_seconds)
+    response = operation.result()
+    metadata = operation.metadata
+    logging.info(
+        f"Purge: {response.purge_count} deleted, {metadata.ignored_count} not "
+        f"found, {metadata.failure_count} failed"
+    )
+    if metadata.failure_count:
+        raise RuntimeError(
+            f"{metadata.failure_count} documents listed in {ids_uri} could not be "
+            "deleted"
+        )
+    return response.purge_count
+
+
+def wait_for_import(
+    operation: Any, label: str, poll_seconds: int = 30
+) -> tuple[int, int]:
+    """Wait for an import operation, logging its progress and error samples.
+
+    Args:
+        operation: Long-running import operation
+        label: Name of the import in the logs
+        poll_seconds: Interval between progress logs
+
+    Returns:
+        Number of documents imported, and number of documents that failed to
+        import, at least one per error sample
+
+    Raises:
+        GoogleAPICallError: If the operation failed
+    """
+    import logging
+    import time
+
+    while not operation.done():
+        metadata = operation.metadata
+        if metadata is not None:
+            logging.info(
+                f"{label}: {metadata.success_count} imported, "
+                f"{metadata.failure_count} failed of {metadata.total_count}"
+            )
+        time.sleep(poll_seconds)
+    response = operation.result()
+    for error in response.error_samples[:5]:
+        logging.warning(f"{label} error sample: {error.message}")
+    metadata = operation.metadata
+    logging.info(
+        f"{label}: {metadata.success_count} imported, {metadata.failure_count} failed"
+    )
+    return metadata.success_count, max(
+        metadata.failure_count, len(response.error_samples)
+    )
+
+
+def import_shards(
+    client: Any,
+    parent: str,
+    shard_uris: list[str],
+    parallelism: int = 4,
+    requests_per_minute: int = 30,
+    max_retries: int = 2,
+    retry_delay_seconds: int = 30,
+    poll_seconds: int = 30,
+) -> int:
+    """Import JSONL shards with concurrent incremental import operations.
+
+    A shard whose operation fails, or reports documents that failed to import,
+    is imported again: incremental imports update the documents in place.
+
+    Args:
+        client: Document service client
+        parent: Branch the documents are imported into
+        shard_uris: GCS URIs of the shards
+        parallelism: Maximum number of import operations running at once
+        requests_per_minute: Maximum rate at which import operations are
+            started, to stay within the import quota
+        max_retries: Number of times the failed shards are retried
+        retry_delay_seconds: Delay before the first retry, doubled before each
+            of the next ones, up to 5 minutes
+        poll_seconds: Interval between progress logs of an operation
+
+    Returns:
+        Number of documents successfully imported
+
+    Raises:
+        RuntimeError: If some shards still fail after max_retries retries
+    """
+    import logging
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    from google.cloud import discoveryengine
+
+    submit_lock = threading.Lock()
+    next_submit = 0.0
+
+    def import_shard(uri: str) -> int:
+        nonlocal next_submit
+        with submit_lock:
+            # Space out the requests to stay within the import quota
+            time.sleep(max(0.0, next_submit - time.monotonic()))
+            next_submit = time.monotonic() + 60 / requests_per_minute
+            operation = client.import_documents(
+                request=discoveryengine.ImportDocumentsRequest(
+                    parent=parent,
+                    gcs_source=discoveryengine.GcsSource(
+                        input_uris=[uri], data_schema="document"
+                    ),
+                    reconciliation_mode=discoveryengine.ImportDocumentsRequest.ReconciliationMode.INCREMENTAL,
+                )
+            )
+        label = f"Shard {uri.rsplit('/', 1)[-1]}"
+        logging.info(f"{label}: waiting for {operation.operation.name}")
+        imported, failed = wait_for_import(operation, label, poll_seconds)
+        if failed:
+            raise RuntimeError(f"{failed} documents failed to import")
+        return imported
+
+    imported: dict[str, int] = {}
+    pending = shard_uris
+    for attempt in range(max_retries + 1):
+        if attempt:
+            logging.info(f"Retrying {len(pending)} failed shards...")
+            time.sleep(min(retry_delay_seconds * 2 ** (attempt - 1), 300))
+        failed = []
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            futures = {executor.submit(import_shard, uri): uri for uri in pending}
+            for future in as_completed(futures):
+                try:
+                    imported[futures[future]] = future.result()
+                except Exception as e:
+                    logging.warning(f"Import of {futures[future]} failed: {e}")
+                    failed.append(futures[future])
+        logging.info(
+            f"{len(shard_uris) - len(failed)}/{len(shard_uris)} shards imported"
+        )
+        if not failed:
+            return sum(imported.values())
+        pending = failed
+    raise RuntimeError(
+        f"{len(pending)} of {len(shard_uris)} shards failed to import after "
+        f"{max_retries} retries: {pending}"
+    )
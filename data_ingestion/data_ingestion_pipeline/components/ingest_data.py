@@ -15,9 +15,22 @@
 
 from kfp.dsl import Dataset, Input, component
 
+from data_ingestion_pipeline.components.datastore_import import (
+    import_shards,
+    purge_documents,
+    wait_for_import,
+    wait_until_indexed,
+)
+
 
 @component(
-    base_image="us-docker.pkg.dev/production-ai-template/starter-pack/data_processing:0.2"
+    base_image="us-docker.pkg.dev/production-ai-template/starter-pack/data_processing:0.2",
+    additional_funcs=[
+        import_shards,
+        purge_documents,
+        wait_for_import,
+        wait_until_indexed,
+    ],
 )
 def ingest_data(
     project_id: str,
@@ -26,22 +39,72 @@ def ingest_data(
     data_store_id: str,
     embedding_dimension: int = 768,
     embedding_column: str = "embedding",
+    staging_dataset: str = "",
+    staging_table: str = "datastore_import_staging",
+    staging_expiration_hours: int = 24,
+    run_id: str = "",
+    readiness_timeout_seconds: int = 600,
+    canary_sample_size: int = 5,
+    readiness_search_check: bool = True,
+    import_parallelism: int = 4,
+    import_requests_per_minute: int = 30,
+    max_shard_retries: int = 2,
 ) -> None:
     """Process and ingest documents into Vertex AI Search datastore.
 
+    JSONL documents are imported straight from GCS. Parquet shards are first
+    loaded into a BigQuery staging table of their own run, which expires after
+    staging_expiration_hours, then imported from BigQuery. The
+    component then waits until the datastore serves the new data: the search
+    must count the imported documents and return a sample of the imported
+    chunks, after they are all readable by ID.
+
+    When `process_data` ran with export_mode="incremental", its output only holds
+    the chunks the run added or changed: they are imported in incremental mode,
+    and the chunks it removed are deleted by a single purge operation.
+    Incremental imports of several JSONL shards run as concurrent import
+    operations, one per shard, and only the shards whose operation failed or
+    reported failed documents are retried. A full import stays a single
+    operation, as each one removes the documents missing from its input.
+
     Args:
         project_id: Google Cloud project ID
         data_store_region: Region for Vertex AI Search
         input_files: Input dataset containing documents
         data_store_id: ID of target datastore
         embedding_column: Name of embedding column in schema
+        staging_dataset: BigQuery dataset of the staging table, required for
+            Parquet input
+        staging_table: Prefix of the BigQuery table the Parquet shards are
+            loaded into, suffixed with a hash of run_id so that concurrent runs
+            do not overwrite each other
+        staging_expiration_hours: Lifetime of the staging table
+        run_id: ID of the pipeline run, retries of a run reuse its staging
+            table. A random ID is used when empty
+        readiness_timeout_seconds: How long to wait for the index to serve the
+            imported documents before giving up with a warning
+        canary_sample_size: Number of imported chunks searched for to check
+            that the datastore is ready
+        readiness_search_check: Whether the search must serve the imported
+            documents. When False, only reading the sampled chunks back by ID
+            is checked, which succeeds as soon as the import is done
+        import_parallelism: Maximum number of shard import operations running
+            at once
+        import_requests_per_minute: Maximum rate at which shard import
+            operations are started, to stay within the import quota
+        max_shard_retries: Number of times the shards whose import failed are
+            retried
     """
+    import hashlib
+    import itertools
     import json
     import logging
-    import time
+    import random
+    import uuid
+    from datetime import datetime, timedelta, timezone
 
     from google.api_core.client_options import ClientOptions
-    from google.cloud import discoveryengine
+    from google.cloud import bigquery, discoveryengine, storage
 
     def update_schema_as_json(
         original_schema: str,
@@ -79,7 +142,7 @@ def ingest_data(
         data_store_id: str,
         field_name: str | None = None,
         client_options: ClientOptions | None = None,
-    ) -> None:
+    ) -> bool:
         """Update datastore schema to include embedding field.
 
         Args:
@@ -88,6 +151,9 @@ def ingest_data(
             data_store_id: Target datastore ID
             embedding_column: Name of embedding column
             client_options: Client options for API
+
+        Returns:
+            False if the schema already had the embedding field, True otherwise
         """
         schema_client = discoveryengine.SchemaServiceClient(
             client_options=client_options
@@ -99,6 +165,14 @@ def ingest_data(
         schema = schema_client.get_schema(
             request=discoveryengine.GetSchemaRequest(name=name)
         )
+        properties = json.loads(schema.json_schema or "{}").get("properties") or {}
+        field = properties.get(field_name) if field_name else None
+        if (
+            field
+            and field.get("keyPropertyMapping") == "embedding_vector"
+            and field.get("dimension") == embedding_dimension
+        ):
+            return False
         new_schema_json = update_schema_as_json(
             original_schema=schema.json_schema,
             embedding_dimension=embedding_dimension,
@@ -114,6 +188,43 @@ def ingest_data(
         )
         logging.info(f"Waiting for schema update operation: {operation.operation.name}")
         operation.result()
+        return True
+
+    run_hash = hashlib.sha1(run_id.encode()).hexdigest()[:16] if run_id else None
+    staging_table_id = f"{staging_table}_{run_hash or uuid.uuid4().hex[:16]}"
+
+    def load_parquet_to_staging(project_id: str, input_files_uri: str) -> str:
+        """Load Parquet shards into the staging table of this run.
+
+        Args:
+            project_id: Google Cloud project ID
+            input_files_uri: Wildcard URI of the Parquet shards
+
+        Returns:
+            The ID of the loaded table, within the staging dataset
+        """
+        if not staging_dataset:
+            raise ValueError("staging_dataset is required to import Parquet files")
+        bq_client = bigquery.Client(project=project_id)
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+        )
+        # Load embedding lists as ARRAY<FLOAT64> rather than nested records
+        parquet_options = bigquery.ParquetOptions()
+        parquet_options.enable_list_inference = True
+        job_config.parquet_options = parquet_options
+        table_ref = f"{project_id}.{staging_dataset}.{staging_table_id}"
+        logging.info(f"Loading {input_files_uri} into {table_ref}...")
+        bq_client.load_table_from_uri(
+            input_files_uri, table_ref, job_config=job_config
+        ).result()
+        table = bq_client.get_table(table_ref)
+        table.expires = datetime.now(timezone.utc) + timedelta(
+            hours=staging_expiration_hours
+        )
+        bq_client.update_table(table, ["expires"])
+        return staging_table_id
 
     def add_data_in_store(
         project_id: str,
@@ -121,7 +232,8 @@ def ingest_data(
         data_store_id: str,
         input_files_uri: str,
         client_options: ClientOptions | None = None,
-    ) -> None:
+        incremental: bool = False,
+    ) -> int:
         """Import documents into datastore.
 
         Args:
@@ -130,6 +242,11 @@ def ingest_data(
             data_store_id: Target datastore ID
             input_files_uri: URI of input files
             client_options: Client options for API
+            incremental: Whether to only add and update documents, instead of
+                also removing the documents missing from the input
+
+        Returns:
+            Number of documents successfully imported
         """
         client = discoveryengine.DocumentServiceClient(client_options=client_options)
 
@@ -139,45 +256,174 @@ def ingest_data(
             data_store=data_store_id,
             branch="default_branch",
         )
-
-        request = discoveryengine.ImportDocumentsRequest(
-            parent=parent,
-            gcs_source=discoveryengine.GcsSource(
-                input_uris=[input_files_uri],
-                data_schema="document",
-            ),
-            reconciliation_mode=discoveryengine.ImportDocumentsRequest.ReconciliationMode.FULL,
+        reconciliation_mode = (
+            discoveryengine.ImportDocumentsRequest.ReconciliationMode.INCREMENTAL
+            if incremental
+            else discoveryengine.ImportDocumentsRequest.ReconciliationMode.FULL
         )
 
+        if (
+            incremental
+            and not input_files_uri.endswith(".parquet")
+            and import_parallelism > 1
+        ):
+            shard_uris = [
+                f"gs://{blob.bucket.name}/{blob.name}"
+                for blob in list_gcs_files(project_id, input_files_uri)
+            ]
+            if len(shard_uris) > 1:
+                return import_shards(
+                    client,
+                    parent,
+                    shard_uris,
+                    parallelism=import_parallelism,
+                    requests_per_minute=import_requests_per_minute,
+                    max_retries=max_shard_retries,
+                )
+
+        if input_files_uri.endswith(".parquet"):
+            table_id = load_parquet_to_staging(project_id, input_files_uri)
+            request = discoveryengine.ImportDocumentsRequest(
+                parent=parent,
+                bigquery_source=discoveryengine.BigQuerySource(
+                    project_id=project_id,
+                    dataset_id=staging_dataset,
+                    table_id=table_id,
+                    data_schema="custom",
+                ),
+                id_field="id",
+                reconciliation_mode=reconciliation_mode,
+            )
+        else:
+            request = discoveryengine.ImportDocumentsRequest(
+                parent=parent,
+                gcs_source=discoveryengine.GcsSource(
+                    input_uris=[input_files_uri],
+                    data_schema="document",
+                ),
+                reconciliation_mode=reconciliation_mode,
+            )
+
         operation = client.import_documents(request=request)
         logging.info(f"Waiting for import operation: {operation.operation.name}")
-        operation.result()
+        imported, _ = wait_for_import(operation, "import")
+        return imported
+
+    def list_gcs_files(project_id: str, uri_pattern: str) -> list[storage.Blob]:
+        """List the GCS objects matching a `gs://bucket/prefix*suffix` pattern."""
+        bucket_name, pattern = uri_pattern.removeprefix("gs://").split("/", 1)
+        prefix, suffix = pattern.split("*", 1)
+        return [
+            blob
+            for blob in storage.Client(project=project_id).list_blobs(
+                bucket_name, prefix=prefix
+            )
+            if blob.name.endswith(suffix)
+        ]
+
+    def sample_imported_chunks(
+        project_id: str, input_files_uri: str, sample_size: int
+    ) -> list[tuple[str, str]]:
+        """Pick a sample of the imported chunks to use as canaries.
+
+        Args:
+            project_id: Google Cloud project ID
+            input_files_uri: Wildcard URI of the imported files
+            sample_size: Number of chunks to pick
+
+        Returns:
+            (document id, chunk text) pairs
+        """
+        if input_files_uri.endswith(".parquet"):
+            bq_client = bigquery.Client(project=project_id)
+            rows = bq_client.query(
+                f"""
+                SELECT id, content
+                FROM `{project_id}.{staging_dataset}.{staging_table_id}`
+                WHERE content IS NOT NULL
+                ORDER BY RAND()
+                LIMIT {sample_size}
+                """
+            ).result()
+            return [(row.id, row.content) for row in rows]
+
+        # Sample from the head of the first JSONL shard rather than reading it all
+        blob = list_gcs_files(project_id, input_files_uri)[0]
+        with blob.open("r") as f:
+            lines = list(itertools.islice(f, 1000))
+        documents = [json.loads(line) for line in lines]
+        return [
+            (document["id"], json.loads(document["json_data"])["content"])
+            for document in random.sample(documents, min(sample_size, len(documents)))
+        ]
 
     client_options = ClientOptions(
         api_endpoint=f"{data_store_region}-discoveryengine.googleapis.com"
     )
+    data_store = f"projects/{project_id}/locations/{data_store_region}/collections/default_collection/dataStores/{data_store_id}"
+    branch = f"{data_store}/branches/default_branch"
 
     logging.info("Updating data store schema...")
-    update_data_store_schema(
+    if update_data_store_schema(
         project_id=project_id,
         location=data_store_region,
         data_store_id=data_store_id,
         field_name=embedding_column,
         client_options=client_options,
-    )
-    logging.info("Schema updated successfully")
+    ):
+        logging.info("Schema updated successfully")
+    else:
+        logging.info("Schema already has the embedding field, update skipped")
 
-    logging.info("Importing data into store...")
-    add_data_in_store(
-        project_id=project_id,
-        location=data_store_region,
-        data_store_id=data_store_id,
-        client_options=client_options,
-        input_files_uri=input_files.uri,
-    )
-    logging.info("Data import completed")
-    logging.info(
-        "Sleeping for 3 minutes to allow Vertex AI Search to properly index the data..."
+    incremental = input_files.metadata.get("import_mode") == "incremental"
+    if incremental and input_files.metadata["documents"] == 0:
+        logging.info("No added or changed documents to import")
+        imported_documents = 0
+    else:
+        logging.info("Importing data into store...")
+        imported_documents = add_data_in_store(
+            project_id=project_id,
+            location=data_store_region,
+            data_store_id=data_store_id,
+            client_options=client_options,
+            input_files_uri=input_files.uri,
+            incremental=incremental,
+        )
+        logging.info(f"Data import completed: {imported_documents} documents")
+
+    if incremental and input_files.metadata["deleted"]:
+        logging.info("Deleting removed documents...")
+        deleted_documents = purge_documents(
+            client=discoveryengine.DocumentServiceClient(client_options=client_options),
+            branch=branch,
+            ids_uri=input_files.metadata["deleted_uri"],
+        )
+        logging.info(f"Deleted {deleted_documents} documents")
+
+    if imported_documents == 0:
+        return
+    logging.info("Waiting for Vertex AI Search to index the data...")
+    indexing_seconds = wait_until_indexed(
+        document_client=discoveryengine.DocumentServiceClient(
+            client_options=client_options
+        ),
+        branch=branch,
+        canaries=sample_imported_chunks(
+            project_id, input_files.uri, canary_sample_size
+        ),
+        timeout_seconds=readiness_timeout_seconds,
+        search_client=(
+            discoveryengine.SearchServiceClient(client_options=client_options)
+            if readiness_search_check
+            else None
+        ),
+        serving_config=f"{data_store}/servingConfigs/default_config",
+        expected_documents=None if incremental else imported_documents,
     )
-    time.sleep(180)  # Sleep for 180 seconds (3 minutes)
-    logging.info("Sleep completed. Data indexing should now be complete.")
+    if indexing_seconds is None:
+        logging.warning(
+            f"Index not ready after {readiness_timeout_seconds}s, "
+            "the new data may not be searchable yet"
+        )
+    else:
+        logging.info(f"Indexing completed in {indexing_seconds:.0f}s")
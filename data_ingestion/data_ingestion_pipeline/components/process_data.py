@@ -22,9 +22,20 @@ It leverages BigQuery for data processing. We also suggest looking at remote fun
 
 from kfp.dsl import Dataset, Output, component
 
+from data_ingestion_pipeline.components.text_processing import (
+    convert_html_to_markdown,
+    convert_questions_to_markdown,
+    create_text_splitter,
+)
+
 
 @component(
-    base_image="us-docker.pkg.dev/production-ai-template/starter-pack/data_processing:0.2"
+    base_image="us-docker.pkg.dev/production-ai-template/starter-pack/data_processing:0.2",
+    additional_funcs=[
+        convert_html_to_markdown,
+        convert_questions_to_markdown,
+        create_text_splitter,
+    ],
 )
 def process_data(
     project_id: str,
@@ -39,6 +50,14 @@ def process_data(
     deduped_table: str = "questions_embeddings",
     location: str = "us-central1",
     embedding_column: str = "embedding",
+    markdown_batch_size: int = 256,
+    incremental_retention_days: int = 0,
+    chunk_batch_size: int = 5000,
+    chunk_length_unit: str = "characters",
+    export_format: str = "jsonl",
+    run_id: str = "",
+    export_mode: str = "full",
+    export_max_rows_per_shard: int = 20000,
 ) -> None:
     """Process StackOverflow questions and answers by:
     1. Fetching data from BigQuery
@@ -46,7 +65,12 @@ def process_data(
     3. Splitting text into chunks
     4. Generating embeddings
     5. Storing results in BigQuery
-    6. Exporting to JSONL
+    6. Exporting to JSONL or Parquet
+
+    Chunks whose content hash is already stored in the deduplicated table reuse
+    their embedding, so only new or edited chunks are sent to the embedder.
+    When a run_id is given, each stage is checkpointed so that a retry of the
+    run resumes after the last completed one.
 
     Args:
         output_files: Output dataset path
@@ -58,22 +82,58 @@ def process_data(
         destination_table: Table for storing incremental results
         deduped_table: Table for storing deduplicated results
         location: BigQuery location
+        markdown_batch_size: Number of HTML documents sent at once to each
+            markdown conversion worker process
+        incremental_retention_days: Days of history kept in the incremental table,
+            older partitions are deleted. 0 keeps the whole history
+        chunk_batch_size: Number of rows, then of chunks, held in memory at once
+            while streaming through conversion, chunking and embedding
+        chunk_length_unit: Unit of chunk_size and chunk_overlap, "characters" or
+            "tokens" (requires tiktoken)
+        export_format: Format of the exported documents, "jsonl" or "parquet".
+            Parquet keeps embeddings as float lists and drops the full question
+            text, `ingest_data` imports it through a BigQuery staging table
+        run_id: ID of the pipeline run. When set, completed stages are checkpointed
+            in BigQuery and a retry of the run resumes after the last one
+        export_mode: "full" exports the whole deduplicated table. "incremental"
+            (requires is_incremental) exports only the chunks this run added or
+            changed, plus the IDs of the chunks it removed, for `ingest_data`
+            to apply as an incremental import and deletes
+        export_max_rows_per_shard: Maximum number of documents per exported
+            file. A document takes at least 20 KB as JSONL, where the full
+            question text is repeated, and about 7 KB as Parquet, with 768
+            dimensional embeddings
     """
+    import hashlib
+    import json
     import logging
-    from datetime import datetime, timedelta
+    import math
+    import os
+    import uuid
+    from collections.abc import Iterator
+    from concurrent.futures import ProcessPoolExecutor
+    from datetime import datetime, timedelta, timezone
+    from typing import Any
 
     import backoff
     import bigframes.ml.llm as llm
     import bigframes.pandas as bpd
     import google.api_core.exceptions
-    import swifter
+    import pandas as pd
     from google.cloud import bigquery
-    from langchain.text_splitter import RecursiveCharacterTextSplitter
-    from markdownify import markdownify
 
     # Initialize logging
     logging.basicConfig(level=logging.INFO)
-    logging.info(f"Using {swifter} for apply operations.")
+    if export_format not in ("jsonl", "parquet"):
+        raise ValueError(
+            f"Unsupported export_format {export_format!r}, expected 'jsonl' or 'parquet'"
+        )
+    if export_mode not in ("full", "incremental"):
+        raise ValueError(
+            f"Unsupported export_mode {export_mode!r}, expected 'full' or 'incremental'"
+        )
+    if export_mode == "incremental" and not is_incremental:
+        raise ValueError("export_mode='incremental' requires is_incremental")
 
     # Initialize clients
     logging.info("Initializing clients...")
@@ -122,19 +182,88 @@ def process_data(
         logging.info("Fetching StackOverflow data from BigQuery...")
         return bpd.read_gbq(query)
 
-    def convert_html_to_markdown(html: str) -> str:
-        """Convert HTML into Markdown for easier parsing and rendering after LLM response."""
-        return markdownify(html).strip()
+    markdown_workers = os.cpu_count() or 1
+    markdown_pool: ProcessPoolExecutor | None = None
+
+    def convert_rows_to_markdown(rows: pd.DataFrame) -> pd.Series:
+        """Build the full markdown text of each question with its answers."""
+        markdown = convert_questions_to_markdown(
+            list(rows["question_text"]),
+            [[answer["body"] for answer in answers] for answers in rows["answers"]],
+            lambda html: convert_html_to_markdown(
+                html, markdown_pool, markdown_workers, markdown_batch_size
+            ),
+        )
+        return pd.Series(
+            [
+                f"# {title}\n{question_md}"  # Title is H1 heading size
+                for title, question_md in zip(rows["question_title"], markdown)
+            ],
+            index=rows.index,
+        )
+
+    def iter_chunk_batches(
+        df: bpd.DataFrame, text_splitter: Any
+    ) -> Iterator[pd.DataFrame]:
+        """Stream the rows of `df` and yield their chunks in batches.
 
-    def create_answers_markdown(answers: list) -> str:
-        """Convert each answer's HTML to markdown and concatenate into a single markdown text."""
-        answers_md = ""
-        for index, answer_record in enumerate(answers):
-            answers_md += (
-                f"\n\n## Answer {index + 1}:\n"  # Answer number is H2 heading size
+        Yields DataFrames of at most `chunk_batch_size` chunks, one row per
+        (question_id, chunk index, text) with the question columns kept for export.
+        """
+        batch: list[dict] = []
+        for rows in df.to_pandas_batches(page_size=chunk_batch_size):
+            rows = rows.assign(full_text_md=convert_rows_to_markdown(rows))
+            for row in rows.itertuples(index=False):
+                for chunk_idx, text in enumerate(
+                    text_splitter.split_text(row.full_text_md)
+                ):
+                    batch.append(
+                        {
+                            "last_edit_date": row.last_edit_date,
+                            "question_id": row.question_id,
+                            "question_text": row.question_text,
+                            "full_text_md": row.full_text_md,
+                            "text_chunk": text,
+                            "chunk_id": f"{row.question_id}__{chunk_idx}",
+                            "content_hash": hashlib.sha256(text.encode()).hexdigest(),
+                        }
+                    )
+                    if len(batch) >= chunk_batch_size:
+                        yield pd.DataFrame(batch)
+                        batch = []
+        if batch:
+            yield pd.DataFrame(batch)
+
+    def embed_chunks(
+        chunks: bpd.DataFrame, reusable_embeddings: "bpd.DataFrame | None"
+    ) -> bpd.DataFrame:
+        """Embed the chunks, reusing the stored embeddings of unchanged ones."""
+        if reusable_embeddings is None:
+            chunks_reused, chunks_new = None, chunks
+        else:
+            chunks = chunks.merge(reusable_embeddings, how="left", on="content_hash")
+            chunks["is_reused"] = chunks["is_reused"].fillna(False)
+            chunks_reused = chunks[chunks["is_reused"]].drop(columns=["is_reused"])
+            chunks_new = chunks[~chunks["is_reused"]].drop(
+                columns=[
+                    "is_reused",
+                    "embedding",
+                    "embedding_statistics",
+                    "embedding_status",
+                ]
             )
-            answers_md += convert_html_to_markdown(answer_record["body"])
-        return answers_md
+            if len(chunks_new) == 0:
+                return chunks_reused
+
+        embeddings_df = embedder.predict(chunks_new["text_chunk"])
+        chunks_new = chunks_new.assign(
+            embedding=embeddings_df["ml_generate_embedding_result"],
+            embedding_statistics=embeddings_df["ml_generate_embedding_statistics"],
+            embedding_status=embeddings_df["ml_generate_embedding_status"],
+        )
+        if chunks_reused is None:
+            return chunks_new
+        return bpd.concat([chunks_reused, chunks_new])
 
     def create_table_if_not_exist(
         df: bpd.DataFrame,
@@ -156,167 +285,480 @@ def process_data(
         dataset = bigquery.Dataset(f"{project_id}.{dataset_id}")
         dataset.location = location
         bq_client.create_dataset(dataset, exists_ok=True)
-        bq_client.create_table(table=table, exists_ok=True)
-
-    # Fetch and preprocess data
-    logging.info("Fetching and preprocessing data...")
-    df = fetch_stackoverflow_data(
-        start_date=START_DATE.strftime("%Y-%m-%d"),
-        end_date=END_DATE.strftime("%Y-%m-%d"),
-        dataset_suffix=location.lower().replace("-", "_"),
+        table = bq_client.create_table(table=table, exists_ok=True)
+
+        # Add the columns introduced since the table was created, e.g. content_hash.
+        existing_columns = {field.name for field in table.schema}
+        missing_fields = [
+            field for field in table_schema if field.name not in existing_columns
+        ]
+        if missing_fields:
+            table.schema = [*table.schema, *missing_fields]
+            bq_client.update_table(table, ["schema"])
+
+    def fetch_reusable_embeddings() -> "bpd.DataFrame | None":
+        """Fetch the latest successful embedding stored for each content hash."""
+        table_ref = f"{project_id}.{destination_dataset}.{deduped_table}"
+        try:
+            table = bq_client.get_table(table_ref)
+        except google.api_core.exceptions.NotFound:
+            return None
+        if "content_hash" not in {field.name for field in table.schema}:
+            return None
+        return bpd.read_gbq(f"""
+            SELECT
+                content_hash,
+                embedding,
+                embedding_statistics,
+                embedding_status,
+                TRUE AS is_reused
+            FROM `{table_ref}`
+            WHERE content_hash IS NOT NULL AND embedding_status = ''
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY content_hash ORDER BY creation_timestamp DESC
+            ) = 1
+        """)
+
+    # Stage checkpoints: a retry of the same pipeline run resumes after the last
+    # completed stage instead of redoing the conversion and embedding work.
+    # Intermediate results are kept in work tables named after the run.
+    run_key = f"{run_id}/{schedule_time}" if run_id else uuid.uuid4().hex
+    run_hash = hashlib.sha1(run_key.encode()).hexdigest()[:16]
+    source_table_id = (
+        f"{project_id}.{destination_dataset}._process_data_{run_hash}_source"
     )
-    df = (
-        df.sort_values("last_edit_date", ascending=False)
-        .drop_duplicates("question_id")
-        .reset_index(drop=True)
+    chunks_table_id = (
+        f"{project_id}.{destination_dataset}._process_data_{run_hash}_chunks"
     )
-    logging.info("Data fetched and preprocessed.")
-
-    # Convert content to markdown
-    logging.info("Converting content to markdown...")
-
-    # Create markdown fields efficiently
-    df["question_title_md"] = (
-        "# " + df["question_title"] + "\n"
-    )  # Title is H1 heading size
-    df["question_text_md"] = (
-        df["question_text"].to_pandas().swifter.apply(convert_html_to_markdown) + "\n"
+    changes_table_id = (
+        f"{project_id}.{destination_dataset}._process_data_{run_hash}_changes"
     )
-    df["answers_md"] = df["answers"].to_pandas().swifter.apply(create_answers_markdown)
-
-    # Create a column containing the whole markdown text
-    df["full_text_md"] = (
-        df["question_title_md"] + df["question_text_md"] + df["answers_md"]
+    export_table_id = (
+        f"{project_id}.{destination_dataset}._process_data_{run_hash}_export"
+    )
+    checkpoints_table_id = (
+        f"{project_id}.{destination_dataset}.process_data_checkpoints"
     )
-    logging.info("Content converted to markdown.")
 
-    # Keep only necessary columns
-    df = df[["last_edit_date", "question_id", "question_text", "full_text_md"]]
+    def run_query(query: str, **params: str) -> bigquery.table.RowIterator:
+        """Run a query with string parameters and wait for its result."""
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ScalarQueryParameter(name, "STRING", value)
+                for name, value in params.items()
+            ]
+        )
+        return bq_client.query(query, job_config=job_config).result()
+
+    def load_checkpoints() -> dict[str, dict]:
+        """Load the completed stages of this run, with their payload."""
+        if not run_id:
+            return {}
+        run_query(f"""
+            CREATE TABLE IF NOT EXISTS `{checkpoints_table_id}` (
+                run_key STRING, stage STRING, payload STRING, completed_at TIMESTAMP
+            )
+        """)
+        rows = run_query(
+            f"SELECT stage, payload FROM `{checkpoints_table_id}` WHERE run_key = @run_key",
+            run_key=run_key,
+        )
+        return {row.stage: json.loads(row.payload) for row in rows}
+
+    def mark_stage(stage: str, **payload: Any) -> None:
+        """Record a stage as completed. Marking it again updates its payload."""
+        checkpoints[stage] = payload
+        if not run_id:
+            return
+        run_query(
+            f"""
+            MERGE `{checkpoints_table_id}` T
+            USING (SELECT @run_key AS run_key, @stage AS stage, @payload AS payload) S
+            ON T.run_key = S.run_key AND T.stage = S.stage
+            WHEN MATCHED THEN
+                UPDATE SET payload = S.payload, completed_at = CURRENT_TIMESTAMP()
+            WHEN NOT MATCHED THEN
+                INSERT (run_key, stage, payload, completed_at)
+                VALUES (S.run_key, S.stage, S.payload, CURRENT_TIMESTAMP())
+            """,
+            run_key=run_key,
+            stage=stage,
+            payload=json.dumps(payload),
+        )
 
-    # Split text into chunks
-    logging.info("Splitting text into chunks...")
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len,
-    )
+    def expire_work_table(table_id: str, days: int = 7) -> None:
+        """Let abandoned work tables expire instead of accumulating."""
+        table = bq_client.get_table(table_id)
+        table.expires = datetime.now(timezone.utc) + timedelta(days=days)
+        bq_client.update_table(table, ["expires"])
 
-    df["text_chunk"] = (
-        df["full_text_md"]
-        .to_pandas()
-        .astype(object)
-        .swifter.apply(text_splitter.split_text)
-    )
-    logging.info("Text split into chunks.")
-
-    # Create chunk IDs and explode chunks into rows
-    logging.info("Creating chunk IDs and exploding chunks into rows...")
-    chunk_ids = [
-        str(idx) for text_chunk in df["text_chunk"] for idx in range(len(text_chunk))
-    ]
-    df = df.explode("text_chunk").reset_index(drop=True)
-    df["chunk_id"] = df["question_id"].astype("string") + "__" + chunk_ids
-    logging.info("Chunk IDs created and chunks exploded.")
-
-    # Generate embeddings
-    logging.info("Generating embeddings...")
-
-    # The first invocation in a new project might fail due to permission propagation.
-    @backoff.on_exception(
-        backoff.expo, google.api_core.exceptions.InvalidArgument, max_tries=10
+    dataset = bigquery.Dataset(f"{project_id}.{destination_dataset}")
+    dataset.location = location
+    bq_client.create_dataset(dataset, exists_ok=True)
+    checkpoints = load_checkpoints()
+    if checkpoints:
+        logging.info(f"Resuming run {run_key} after stages {list(checkpoints)}.")
+
+    # Fetch and preprocess data
+    if "fetched" not in checkpoints:
+        logging.info("Fetching and preprocessing data...")
+        df = fetch_stackoverflow_data(
+            start_date=START_DATE.strftime("%Y-%m-%d"),
+            end_date=END_DATE.strftime("%Y-%m-%d"),
+            dataset_suffix=location.lower().replace("-", "_"),
+        )
+        df = (
+            df.sort_values("last_edit_date", ascending=False)
+            .drop_duplicates("question_id")
+            .reset_index(drop=True)
+        )
+        df.to_gbq(source_table_id, if_exists="replace")
+        expire_work_table(source_table_id)
+        mark_stage("fetched", creation_timestamp=datetime.now().isoformat())
+        logging.info("Data fetched and preprocessed.")
+    creation_timestamp = datetime.fromisoformat(
+        checkpoints["fetched"]["creation_timestamp"]
     )
-    def create_embedder() -> llm.TextEmbeddingGenerator:
-        return llm.TextEmbeddingGenerator(model_name="text-embedding-005")
 
-    embedder = create_embedder()
+    # Stream the rows through markdown conversion, chunking and embedding in
+    # bounded batches, so that memory does not grow with the corpus size. Rows
+    # are processed by question_id, and the "chunked" checkpoint records the last
+    # question whose chunks are all stored, so a retry picks up after it.
+    if "embedded" not in checkpoints:
+        text_splitter = create_text_splitter(
+            chunk_size, chunk_overlap, chunk_length_unit
+        )
 
-    embeddings_df = embedder.predict(df["text_chunk"])
-    logging.info("Embeddings generated.")
+        # The first invocation in a new project might fail due to permission propagation.
+        @backoff.on_exception(
+            backoff.expo, google.api_core.exceptions.InvalidArgument, max_tries=10
+        )
+        def create_embedder() -> llm.TextEmbeddingGenerator:
+            return llm.TextEmbeddingGenerator(model_name="text-embedding-005")
+
+        embedder = create_embedder()
+        reusable_embeddings = fetch_reusable_embeddings()
+
+        df = bpd.read_gbq(source_table_id).sort_values("question_id")
+        progress = checkpoints.get("chunked", {"question_id": None, "chunks": 0})
+        chunk_count = progress["chunks"]
+        if progress["question_id"] is None:
+            # Drop the chunks of an attempt interrupted before its first checkpoint
+            bq_client.delete_table(chunks_table_id, not_found_ok=True)
+        else:
+            logging.info(f"Resuming after question {progress['question_id']}...")
+            df = df[df["question_id"] > progress["question_id"]]
+            run_query(
+                f"DELETE FROM `{chunks_table_id}` WHERE question_id > {int(progress['question_id'])}"
+            )
 
-    df = df.assign(
-        embedding=embeddings_df["ml_generate_embedding_result"],
-        embedding_statistics=embeddings_df["ml_generate_embedding_statistics"],
-        embedding_status=embeddings_df["ml_generate_embedding_status"],
-        creation_timestamp=datetime.now(),
-    )
+        logging.info("Converting, chunking and embedding content...")
+        # markdownify is pure Python and bound by the GIL, documents are sharded
+        # across a process pool shared by all batches. It only lives for this
+        # stage, so that a resumed run skipping it does not start any worker.
+        if markdown_workers > 1:
+            markdown_pool = ProcessPoolExecutor(max_workers=markdown_workers)
+        try:
+            for chunks in iter_chunk_batches(
+                df[
+                    [
+                        "last_edit_date",
+                        "question_id",
+                        "question_title",
+                        "question_text",
+                        "answers",
+                    ]
+                ],
+                text_splitter,
+            ):
+                embedded = embed_chunks(bpd.read_pandas(chunks), reusable_embeddings)
+                embedded = embedded.assign(creation_timestamp=creation_timestamp)
+                # Materialize the batch once, it feeds both the incremental and
+                # deduplicated tables
+                embedded.to_gbq(chunks_table_id, if_exists="append")
+                if chunk_count == 0:
+                    expire_work_table(chunks_table_id)
+                chunk_count += len(chunks)
+                logging.info(f"{chunk_count} chunks processed.")
+
+                # The last question of the batch may continue in the next one
+                question_ids = chunks["question_id"]
+                completed = question_ids[question_ids != question_ids.iloc[-1]]
+                if len(completed):
+                    chunk_count_completed = chunk_count - int(
+                        (question_ids == question_ids.iloc[-1]).sum()
+                    )
+                    mark_stage(
+                        "chunked",
+                        question_id=int(completed.max()),
+                        chunks=chunk_count_completed,
+                    )
+        finally:
+            if markdown_pool is not None:
+                markdown_pool.shutdown()
+        mark_stage("embedded", chunks=chunk_count)
+        logging.info("Content converted, chunked and embedded.")
 
     # Store results in BigQuery
     PARTITION_DATE_COLUMN = "creation_timestamp"
 
-    # Create and populate incremental table
-    logging.info("Creating and populating incremental table...")
-    create_table_if_not_exist(
-        df=df,
-        project_id=project_id,
-        dataset_id=destination_dataset,
-        table_id=destination_table,
-        partition_column=PARTITION_DATE_COLUMN,
-    )
-
-    if_exists_mode = "append" if is_incremental else "replace"
-    df.to_gbq(
-        destination_table=f"{destination_dataset}.{destination_table}",
-        if_exists=if_exists_mode,
-    )
-    logging.info("Incremental table created and populated.")
-
-    # Create deduplicated table
-    logging.info("Creating deduplicated table...")
-    df_questions = bpd.read_gbq(
-        f"{destination_dataset}.{destination_table}", use_cache=False
-    )
-    max_date_df = (
-        df_questions.groupby("question_id")["creation_timestamp"].max().reset_index()
-    )
-    df_questions_dedup = max_date_df.merge(
-        df_questions, how="inner", on=["question_id", "creation_timestamp"]
-    )
+    def partition_column_type(table_ref: str) -> str:
+        """Type of the partition column, a TIMESTAMP or a DATETIME."""
+        # df.to_gbq writes the naive datetime.now() values as DATETIME, tables
+        # created otherwise may use TIMESTAMP
+        return next(
+            field.field_type
+            for field in bq_client.get_table(table_ref).schema
+            if field.name == PARTITION_DATE_COLUMN
+        )
 
-    create_table_if_not_exist(
-        df=df_questions_dedup,
-        project_id=project_id,
-        dataset_id=destination_dataset,
-        table_id=deduped_table,
-        partition_column=PARTITION_DATE_COLUMN,
-    )
+    if checkpoints["embedded"]["chunks"] == 0:
+        logging.info("No new content, the tables are left unchanged.")
+    elif "stored" not in checkpoints:
+        df = bpd.read_gbq(chunks_table_id)
+        incremental_table_ref = (
+            f"{project_id}.{destination_dataset}.{destination_table}"
+        )
 
-    df_questions_dedup.to_gbq(
-        destination_table=f"{destination_dataset}.{deduped_table}",
-        if_exists="replace",
-    )
-    logging.info("Deduplicated table created and populated.")
+        # Create and populate incremental table
+        logging.info("Creating and populating incremental table...")
+        create_table_if_not_exist(
+            df=df,
+            project_id=project_id,
+            dataset_id=destination_dataset,
+            table_id=destination_table,
+            partition_column=PARTITION_DATE_COLUMN,
+        )
 
-    # Export to JSONL
-    logging.info("Exporting to JSONL...")
+        if is_incremental:
+            # Remove what an interrupted attempt of this run may have appended:
+            # all its rows share the creation timestamp of the "fetched" stage.
+            column_type = partition_column_type(incremental_table_ref)
+            run_query(
+                f"""
+                DELETE FROM `{incremental_table_ref}`
+                WHERE {PARTITION_DATE_COLUMN} = {column_type}(@creation_timestamp)
+                """,
+                creation_timestamp=creation_timestamp.isoformat(),
+            )
+        if_exists_mode = "append" if is_incremental else "replace"
+        df.to_gbq(
+            destination_table=f"{destination_dataset}.{destination_table}",
+            if_exists=if_exists_mode,
+        )
+        logging.info("Incremental table created and populated.")
+
+        # Upsert the current batch into the deduplicated table
+        logging.info("Upserting batch into deduplicated table...")
+        create_table_if_not_exist(
+            df=df,
+            project_id=project_id,
+            dataset_id=destination_dataset,
+            table_id=deduped_table,
+            partition_column=PARTITION_DATE_COLUMN,
+        )
 
-    export_query = f"""
-    SELECT
-        chunk_id as id,
-        TO_JSON_STRING(STRUCT(
+        deduped_table_ref = f"{project_id}.{destination_dataset}.{deduped_table}"
+        if is_incremental:
+            # Chunks of the batch questions that are no longer produced (the question
+            # got shorter) are deleted, the others are updated or inserted. Rows of
+            # questions outside the batch are left untouched.
+            columns = list(df.columns)
+            update_set = ", ".join(f"{column} = S.{column}" for column in columns)
+            insert_columns = ", ".join(columns)
+            insert_values = ", ".join(f"S.{column}" for column in columns)
+            if export_mode == "incremental":
+                # Record what the upsert changes before it runs, for the export.
+                # A retry keeps the table of the first attempt, whose input is the
+                # same, since the deduplicated table may already be updated.
+                run_query(f"""
+                    CREATE TABLE IF NOT EXISTS `{changes_table_id}` AS
+                    SELECT T.chunk_id, TRUE AS deleted
+                    FROM `{deduped_table_ref}` T
+                    WHERE T.question_id IN (
+                            SELECT DISTINCT question_id FROM `{chunks_table_id}`
+                        )
+                        AND T.chunk_id NOT IN (
+                            SELECT chunk_id FROM `{chunks_table_id}`
+                            WHERE chunk_id IS NOT NULL
+                        )
+                    UNION ALL
+                    SELECT S.chunk_id, FALSE AS deleted
+                    FROM `{chunks_table_id}` S
+                    LEFT JOIN `{deduped_table_ref}` T USING (chunk_id)
+                    WHERE S.chunk_id IS NOT NULL
+                        AND (
+                            T.chunk_id IS NULL
+                            OR T.content_hash IS DISTINCT FROM S.content_hash
+                            OR T.last_edit_date IS DISTINCT FROM S.last_edit_date
+                        )
+                """)
+                expire_work_table(changes_table_id)
+            upsert_script = f"""
+            BEGIN TRANSACTION;
+            DELETE FROM `{deduped_table_ref}`
+            WHERE question_id IN (SELECT DISTINCT question_id FROM `{chunks_table_id}`)
+                AND chunk_id NOT IN (
+                    SELECT chunk_id FROM `{chunks_table_id}` WHERE chunk_id IS NOT NULL
+                );
+            MERGE `{deduped_table_ref}` T
+            USING `{chunks_table_id}` S
+            ON T.chunk_id = S.chunk_id
+            WHEN MATCHED THEN UPDATE SET {update_set}
+            WHEN NOT MATCHED THEN INSERT ({insert_columns}) VALUES ({insert_values});
+            COMMIT TRANSACTION;
+            """
+            bq_client.query(upsert_script).result()
+        else:
+            df.to_gbq(destination_table=deduped_table_ref, if_exists="replace")
+        logging.info("Deduplicated table created and populated.")
+
+        if incremental_retention_days > 0:
+            # The deduplicated table holds the latest chunks, so history older than
+            # the retention window can go. Whole-partition deletes are free.
+            logging.info(
+                f"Pruning partitions older than {incremental_retention_days} days..."
+            )
+            column_type = partition_column_type(incremental_table_ref)
+            bq_client.query(f"""
+                DELETE FROM `{incremental_table_ref}`
+                WHERE {PARTITION_DATE_COLUMN} < {column_type}_TRUNC(
+                    {column_type}_SUB(
+                        CURRENT_{column_type}(),
+                        INTERVAL {incremental_retention_days} DAY
+                    ),
+                    DAY
+                )
+            """).result()
+        mark_stage("stored")
+
+    # Export for ingestion
+    if "exported" in checkpoints:
+        output_files.uri = checkpoints["exported"]["uri"]
+        output_files.metadata.update(checkpoints["exported"]["metadata"])
+        logging.info(f"Already exported to {output_files.uri}.")
+        return
+    logging.info(f"Exporting to {export_format}...")
+
+    # In incremental mode, only the chunks added or changed by this run are
+    # exported, and the IDs of the removed ones are extracted alongside as CSV
+    # (kept out of the documents wildcard by their extension).
+    output_files.metadata["import_mode"] = export_mode
+    changed_filter = ""
+    if export_mode == "incremental" and checkpoints["embedded"]["chunks"] == 0:
+        changed_filter = "\n            AND FALSE"
+        output_files.metadata.update(deleted=0, deleted_uri="")
+    elif export_mode == "incremental":
+        counts = next(
+            iter(
+                run_query(
+                    f"SELECT COUNTIF(deleted) AS deleted FROM `{changes_table_id}`"
+                )
+            )
+        )
+        output_files.metadata["deleted"] = counts.deleted
+        changed_filter = f"""
+            AND chunk_id IN (
+                SELECT chunk_id FROM `{changes_table_id}` WHERE NOT deleted
+            )"""
+        deleted_uri = output_files.uri + "-deleted-*.csv"
+        deleted_df_id = bpd.read_gbq(
+            f"SELECT chunk_id FROM `{changes_table_id}` WHERE deleted"
+        ).to_gbq()
+        bq_client.extract_table(
+            deleted_df_id,
+            deleted_uri,
+            job_config=bigquery.ExtractJobConfig(
+                destination_format=bigquery.DestinationFormat.CSV, print_header=False
+            ),
+        ).result()
+        output_files.metadata["deleted_uri"] = deleted_uri
+
+    if export_format == "jsonl":
+        export_query = f"""
+        SELECT
+            chunk_id as id,
+            TO_JSON_STRING(STRUCT(
+                chunk_id as id,
+                embedding as {embedding_column},
+                text_chunk as content,
+                question_id,
+                CAST(creation_timestamp AS STRING) as creation_timestamp,
+                CAST(last_edit_date AS STRING) as last_edit_date,
+                question_text,
+                full_text_md
+            )) as json_data
+        FROM
+            `{project_id}.{destination_dataset}.{deduped_table}`
+        WHERE
+            chunk_id IS NOT NULL
+            AND embedding IS NOT NULL{changed_filter}
+        """
+    else:
+        # Columnar hand-off: the embedding stays a float list instead of JSON text,
+        # and the full question text, repeated for every chunk, is left out.
+        export_query = f"""
+        SELECT
             chunk_id as id,
             embedding as {embedding_column},
             text_chunk as content,
             question_id,
             CAST(creation_timestamp AS STRING) as creation_timestamp,
             CAST(last_edit_date AS STRING) as last_edit_date,
-            question_text,
-            full_text_md
-        )) as json_data
-    FROM
-        `{project_id}.{destination_dataset}.{deduped_table}`
-    WHERE
-        chunk_id IS NOT NULL
-        AND embedding IS NOT NULL
-    """
-    export_df_id = bpd.read_gbq(export_query).to_gbq()
-
-    output_files.uri = output_files.uri + "*.jsonl"
-
-    job_config = bigquery.ExtractJobConfig()
-    job_config.destination_format = bigquery.DestinationFormat.NEWLINE_DELIMITED_JSON
-
-    extract_job = bq_client.extract_table(
-        export_df_id, output_files.uri, job_config=job_config
+            question_text
+        FROM
+            `{project_id}.{destination_dataset}.{deduped_table}`
+        WHERE
+            chunk_id IS NOT NULL
+            AND embedding IS NOT NULL{changed_filter}
+        """
+    # Number the documents so that each exported file holds a bounded slice.
+    # Clustering by shard lets each per-shard export prune the blocks of the
+    # other shards instead of scanning the whole table.
+    run_query(f"""
+        CREATE OR REPLACE TABLE `{export_table_id}`
+        CLUSTER BY shard
+        AS
+        SELECT
+            *,
+            DIV(ROW_NUMBER() OVER (ORDER BY id) - 1, {int(export_max_rows_per_shard)})
+                AS shard
+        FROM ({export_query})
+    """)
+    expire_work_table(export_table_id)
+    # Chunks without an embedding are left out, count what is actually exported
+    exported_documents = bq_client.get_table(export_table_id).num_rows
+    output_files.metadata["documents"] = exported_documents
+    shard_count = max(1, math.ceil(exported_documents / export_max_rows_per_shard))
+
+    export_options = (
+        "format = 'JSON'"
+        if export_format == "jsonl"
+        else "format = 'PARQUET', compression = 'SNAPPY'"
+    )
+    for shard in range(shard_count):
+        # BigQuery may still split a slice into several files, never merge them
+        run_query(f"""
+            EXPORT DATA OPTIONS (
+                uri = '{output_files.uri}{shard:05d}-*.{export_format}',
+                {export_options},
+                overwrite = true
+            ) AS
+            SELECT * EXCEPT (shard) FROM `{export_table_id}` WHERE shard = {shard}
+        """)
+    logging.info(
+        f"Exported {exported_documents} documents in {shard_count} shards of at "
+        f"most {export_max_rows_per_shard}."
     )
-    extract_job.result()
-    logging.info("Exported to JSONL.")
+    output_files.uri = output_files.uri + f"*.{export_format}"
+    mark_stage("exported", uri=output_files.uri, metadata=output_files.metadata)
+    logging.info(f"Exported to {export_format}.")
+
+    # The run is complete, its work tables are no longer needed
+    for table_id in (
+        source_table_id,
+        chunks_table_id,
+        changes_table_id,
+        export_table_id,
+    ):
+        bq_client.delete_table(table_id, not_found_ok=True)
@@ -0,0 +1,123 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ruff: noqa
+
+"""
+Markdown conversion and chunking shared by `process_data`, the local runner and
+the benchmarks.
+
+The functions are embedded into the `process_data` component through
+`additional_funcs`, so each of them must be self-contained: imports go inside
+the function, they may only call each other, and their annotations may only use
+builtins and `typing` names, which is all the component script imports.
+"""
+
+from concurrent.futures import Executor
+from typing import Any, Callable, Optional
+
+
+def create_text_splitter(
+    chunk_size: int = 1500,
+    chunk_overlap: int = 20,
+    chunk_length_unit: str = "characters",
+) -> Any:
+    """Create the text splitter, measuring chunks in `chunk_length_unit`.
+
+    Args:
+        chunk_size: Maximum size of a chunk
+        chunk_overlap: Overlap between consecutive chunks
+        chunk_length_unit: Unit of chunk_size and chunk_overlap, "characters" or
+            "tokens" (requires tiktoken)
+    """
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+    except ImportError:  # langchain < 0.1, as in older processing images
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    if chunk_length_unit == "characters":
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+        )
+    if chunk_length_unit == "tokens":
+        # Requires tiktoken. Its token counts are an approximation of the
+        # embedding model tokenizer, close enough to stay below its input limit.
+        return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            encoding_name="cl100k_base",
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+        )
+    raise ValueError(
+        f"Unsupported chunk_length_unit {chunk_length_unit!r}, "
+        "expected 'characters' or 'tokens'"
+    )
+
+
+def convert_html_to_markdown(
+    html: list[str],
+    pool: Optional["Executor"] = None,
+    workers: int = 1,
+    batch_size: int = 256,
+) -> list[str]:
+    """Convert HTML into Markdown for easier parsing and rendering after LLM response.
+
+    markdownify is pure Python and bound by the GIL: with a process pool, the
+    documents are sharded across its `workers` processes in chunks of at most
+    `batch_size`.
+    """
+    import math
+
+    from markdownify import markdownify
+
+    if pool is None or len(html) <= batch_size:
+        return [markdownify(doc).strip() for doc in html]
+    chunksize = min(batch_size, math.ceil(len(html) / workers))
+    return [doc.strip() for doc in pool.map(markdownify, html, chunksize=chunksize)]
+
+
+def convert_questions_to_markdown(
+    questions_html: list[str],
+    answers_html: list[list[str]],
+    convert: Callable[[list[str]], list[str]],
+) -> list[str]:
+    """Build the markdown of each question followed by its answers.
+
+    Questions and answers are converted by `convert` in a single pass over a
+    flat list of HTML documents, so that questions with many answers do not
+    skew the batches.
+
+    Args:
+        questions_html: HTML body of each question
+        answers_html: HTML bodies of the answers of each question
+        convert: Converts a list of HTML documents to markdown, e.g.
+            `convert_html_to_markdown` bound to a pool
+    """
+    import itertools
+
+    markdown = convert(
+        list(questions_html)
+        + [answer for answers in answers_html for answer in answers]
+    )
+    answers_md = iter(markdown[len(questions_html) :])
+    return [
+        f"{question_md}\n"
+        + "".join(
+            f"\n\n## Answer {index}:\n{answer_md}"  # Answer number is H2 heading size
+            for index, answer_md in enumerate(
+                itertools.islice(answers_md, len(answers)), start=1
+            )
+        )
+        for question_md, answers in zip(markdown[: len(questions_html)], answers_html)
+    ]
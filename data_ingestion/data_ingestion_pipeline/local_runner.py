@@ -0,0 +1,476 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Local ingestion runner for course material.
+
+Runs the chunk -> embed -> export stages of `process_data` on one machine, over
+a directory of Markdown, HTML, plain text and PDF files instead of the
+StackOverflow BigQuery table. The output is the same JSONL as the pipeline
+export (one `{"id", "json_data"}` document per chunk), or the same columns as
+its Parquet export, so it can be imported into the Vertex AI Search datastore
+by `ingest_data`. Usage:
+
+    uv run --with markdownify --with langchain-text-splitters \\
+        python -m data_ingestion_pipeline.local_runner \\
+        --input-dir ./cours --output ./cours.jsonl --embedder hash
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import struct
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Protocol
+
+from data_ingestion_pipeline.components.text_processing import create_text_splitter
+
+MARKDOWN_SUFFIXES = {".md", ".markdown", ".txt"}
+HTML_SUFFIXES = {".html", ".htm"}
+PDF_SUFFIXES = {".pdf"}
+SUPPORTED_SUFFIXES = MARKDOWN_SUFFIXES | HTML_SUFFIXES | PDF_SUFFIXES
+
+
+@dataclass
+class Chunk:
+    """A chunk of a document, with the fields exported to the datastore."""
+
+    chunk_id: str
+    question_id: int
+    title: str
+    text: str
+    full_text_md: str
+    last_edit_date: str
+
+
+class Embedder(Protocol):
+    """Computes the embeddings of a batch of texts."""
+
+    dimension: int
+
+    def embed(self, texts: list[str]) -> list[list[float]]: ...
+
+
+class HashEmbedder:
+    """Deterministic embedder deriving unit vectors from a hash of each text.
+
+    Vectors carry no meaning, but identical texts always get identical
+    embeddings and no network access is needed, which suits tests and
+    benchmarks.
+    """
+
+    def __init__(self, dimension: int = 768) -> None:
+        self.dimension = dimension
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed_one(text) for text in texts]
+
+    def _embed_one(self, text: str) -> list[float]:
+        values: list[float] = []
+        counter = 0
+        while len(values) < self.dimension:
+            digest = hashlib.sha512(f"{counter}:{text}".encode()).digest()
+            values.extend(v / 2**31 for v in struct.unpack("<16i", digest))
+            counter += 1
+        vector = values[: self.dimension]
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+
+class VertexAIEmbedder:
+    """Embedder calling a Vertex AI text embedding model, as the pipeline does."""
+
+    def __init__(
+        self,
+        model_name: str = "text-embedding-005",
+        project_id: str | None = None,
+        location: str = "us-central1",
+        dimension: int = 768,
+        batch_size: int = 100,
+    ) -> None:
+        import vertexai
+        from vertexai.language_models import TextEmbeddingModel
+
+        vertexai.init(project=project_id, location=location)
+        self.model = TextEmbeddingModel.from_pretrained(model_name)
+        self.dimension = dimension
+        self.batch_size = batch_size
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        from vertexai.language_models import TextEmbeddingInput
+
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            inputs = [
+                TextEmbeddingInput(text, "RETRIEVAL_DOCUMENT")
+                for text in texts[start : start + self.batch_size]
+            ]
+            embeddings.extend(
+                embedding.values
+                for embedding in self.model.get_embeddings(
+                    inputs, output_dimensionality=self.dimension
+                )
+            )
+        return embeddings
+
+
+def create_embedder(name: str, **kwargs: Any) -> Embedder:
+    """Create an embedder by name, "hash" or "vertexai"."""
+    if name == "hash":
+        return HashEmbedder(dimension=kwargs.get("dimension", 768))
+    if name == "vertexai":
+        return VertexAIEmbedder(**kwargs)
+    raise ValueError(f"Unknown embedder {name!r}, expected 'hash' or 'vertexai'")
+
+
+def read_markdown(path: Path) -> str:
+    """Read a supported file as markdown text."""
+    suffix = path.suffix.lower()
+    if suffix in MARKDOWN_SUFFIXES:
+        return path.read_text(encoding="utf-8", errors="replace")
+    if suffix in HTML_SUFFIXES:
+        from markdownify import markdownify
+
+        return markdownify(path.read_text(encoding="utf-8", errors="replace"))
+    if suffix in PDF_SUFFIXES:
+        from pypdf import PdfReader
+
+        pages = PdfReader(path).pages
+        return "\n\n".join(page.extract_text() or "" for page in pages)
+    raise ValueError(f"Unsupported file type: {path}")
+
+
+def find_documents(input_dir: Path) -> list[Path]:
+    """List the supported files under `input_dir`, in a stable order."""
+    return sorted(
+        path
+        for path in input_dir.rglob("*")
+        if path.is_file() and path.suffix.lower() in SUPPORTED_SUFFIXES
+    )
+
+
+def chunk_document(path: Path, input_dir: Path, text_splitter: Any) -> list[Chunk]:
+    """Convert a document to markdown and split it into chunks."""
+    text = read_markdown(path).strip()
+    if not text:
+        return []
+    relative = path.relative_to(input_dir).as_posix()
+    # An INT64 like the question_id exported by the pipeline, stable across runs
+    question_id = int(hashlib.sha1(relative.encode()).hexdigest()[:15], 16)
+    title = next(
+        (
+            line.lstrip("#").strip()
+            for line in text.splitlines()
+            if line.startswith("# ")
+        ),
+        path.stem,
+    )
+    last_edit_date = datetime.fromtimestamp(
+        path.stat().st_mtime, tz=timezone.utc
+    ).isoformat()
+    return [
+        Chunk(
+            chunk_id=f"{question_id}__{index}",
+            question_id=question_id,
+            title=title,
+            text=chunk,
+            full_text_md=text,
+            last_edit_date=last_edit_date,
+        )
+        for index, chunk in enumerate(text_splitter.split_text(text))
+    ]
+
+
+# Per-process state of the worker pool, set by `_init_worker`.
+_worker_splitter: Any = None
+_worker_input_dir: Path | None = None
+
+
+def _init_worker(input_dir: Path, splitter_kwargs: dict[str, Any]) -> None:
+    global _worker_splitter, _worker_input_dir
+    _worker_splitter = create_text_splitter(**splitter_kwargs)
+    _worker_input_dir = input_dir
+
+
+def _chunk_in_worker(path: Path) -> list[Chunk]:
+    assert _worker_input_dir is not None
+    try:
+        return chunk_document(path, _worker_input_dir, _worker_splitter)
+    except Exception as e:
+        logging.warning(f"Skipping {path}: {type(e).__name__}: {e}")
+        return []
+
+
+def iter_chunks(
+    input_dir: Path,
+    workers: int | None = None,
+    files_per_task: int = 8,
+    **splitter_kwargs: Any,
+) -> Iterator[Chunk]:
+    """Convert and chunk the documents of `input_dir` across a process pool.
+
+    Chunks are yielded in a deterministic order (by file path, then position).
+    """
+    paths = find_documents(input_dir)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(input_dir, splitter_kwargs)
+        for path in paths:
+            yield from _chunk_in_worker(path)
+        return
+    with multiprocessing.Pool(
+        workers, initializer=_init_worker, initargs=(input_dir, splitter_kwargs)
+    ) as pool:
+        for chunks in pool.imap(_chunk_in_worker, paths, chunksize=files_per_task):
+            yield from chunks
+
+
+def iter_batches(chunks: Iterable[Chunk], batch_size: int) -> Iterator[list[Chunk]]:
+    """Group chunks into lists of at most `batch_size`."""
+    batch: list[Chunk] = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def to_document(
+    chunk: Chunk,
+    embedding: list[float],
+    creation_timestamp: str,
+    embedding_column: str = "embedding",
+) -> dict[str, str]:
+    """Build the `{"id", "json_data"}` record exported by `process_data`."""
+    return {
+        "id": chunk.chunk_id,
+        "json_data": json.dumps(
+            {
+                "id": chunk.chunk_id,
+                embedding_column: embedding,
+                "content": chunk.text,
+                "question_id": chunk.question_id,
+                "creation_timestamp": creation_timestamp,
+                "last_edit_date": chunk.last_edit_date,
+                "question_text": chunk.title,
+                "full_text_md": chunk.full_text_md,
+            },
+            ensure_ascii=False,
+        ),
+    }
+
+
+class JsonlWriter:
+    """Writes the chunks as the JSONL documents of the pipeline export."""
+
+    def __init__(
+        self, output: Path, creation_timestamp: str, embedding_column: str
+    ) -> None:
+        self.output = output
+        self.creation_timestamp = creation_timestamp
+        self.embedding_column = embedding_column
+        self._tmp_output = output.with_name(output.name + ".tmp")
+        self._file = self._tmp_output.open("w", encoding="utf-8")
+
+    def write(self, chunks: list[Chunk], embeddings: list[list[float]]) -> None:
+        for chunk, embedding in zip(chunks, embeddings, strict=True):
+            document = to_document(
+                chunk, embedding, self.creation_timestamp, self.embedding_column
+            )
+            self._file.write(json.dumps(document, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+        self._tmp_output.replace(self.output)
+
+
+class ParquetShardWriter:
+    """Writes the chunks as size-bounded Parquet shards in the output directory.
+
+    Embeddings are stored as float64 lists, like the ARRAY<FLOAT64> column that
+    BigQuery exports, and the full document text is not repeated for every
+    chunk, so the files match the Parquet export of `process_data`.
+    """
+
+    def __init__(
+        self,
+        output: Path,
+        creation_timestamp: str,
+        embedding_column: str,
+        max_shard_bytes: int = 256 * 1024 * 1024,
+    ) -> None:
+        import pyarrow as pa
+
+        self.output = output
+        self.creation_timestamp = creation_timestamp
+        self.max_shard_bytes = max_shard_bytes
+        self.schema = pa.schema(
+            [
+                ("id", pa.string()),
+                (embedding_column, pa.list_(pa.float64())),
+                ("content", pa.string()),
+                ("question_id", pa.int64()),
+                ("creation_timestamp", pa.string()),
+                ("last_edit_date", pa.string()),
+                ("question_text", pa.string()),
+            ]
+        )
+        self.shards: list[Path] = []
+        self._writer: Any = None
+        self._shard_bytes = 0
+        output.mkdir(parents=True, exist_ok=True)
+        for stale in output.glob("part-*.parquet"):
+            stale.unlink()
+
+    def write(self, chunks: list[Chunk], embeddings: list[list[float]]) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_arrays(
+            [
+                pa.array([chunk.chunk_id for chunk in chunks]),
+                pa.array(embeddings, type=self.schema.field(1).type),
+                pa.array([chunk.text for chunk in chunks]),
+                pa.array([chunk.question_id for chunk in chunks], type=pa.int64()),
+                pa.array([self.creation_timestamp] * len(chunks)),
+                pa.array([chunk.last_edit_date for chunk in chunks]),
+                pa.array([chunk.title for chunk in chunks]),
+            ],
+            schema=self.schema,
+        )
+        # Shard sizes are bounded on the uncompressed Arrow size, so the files
+        # stay below the limit once compressed.
+        if self._writer is not None and (
+            self._shard_bytes + table.nbytes > self.max_shard_bytes
+        ):
+            self._writer.close()
+            self._writer = None
+        if self._writer is None:
+            path = self.output / f"part-{len(self.shards):05d}.parquet"
+            self.shards.append(path)
+            self._writer = pq.ParquetWriter(path, self.schema, compression="snappy")
+            self._shard_bytes = 0
+        self._writer.write_table(table)
+        self._shard_bytes += table.nbytes
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+def run(
+    input_dir: Path,
+    output: Path,
+    embedder: Embedder,
+    workers: int | None = None,
+    embed_batch_size: int = 250,
+    embedding_column: str = "embedding",
+    output_format: str = "jsonl",
+    max_shard_bytes: int = 256 * 1024 * 1024,
+    **splitter_kwargs: Any,
+) -> int:
+    """Ingest a directory of documents into JSONL or Parquet files.
+
+    Args:
+        input_dir: Directory of course material, searched recursively
+        output: Path of the JSONL file, or directory of the Parquet shards
+        embedder: Embedder computing the chunk embeddings
+        workers: Number of conversion and chunking processes, defaults to the
+            number of CPUs
+        embed_batch_size: Number of chunks embedded at once
+        embedding_column: Name of the embedding field, as in `process_data`
+        output_format: "jsonl" or "parquet"
+        max_shard_bytes: Maximum size of a Parquet shard
+        **splitter_kwargs: chunk_size, chunk_overlap and chunk_length_unit
+
+    Returns:
+        The number of chunks written
+    """
+    creation_timestamp = datetime.now(timezone.utc).isoformat()
+    writer: JsonlWriter | ParquetShardWriter
+    if output_format == "jsonl":
+        writer = JsonlWriter(output, creation_timestamp, embedding_column)
+    elif output_format == "parquet":
+        writer = ParquetShardWriter(
+            output,
+            creation_timestamp,
+            embedding_column,
+            max_shard_bytes=max_shard_bytes,
+        )
+    else:
+        raise ValueError(
+            f"Unsupported output_format {output_format!r}, expected 'jsonl' or 'parquet'"
+        )
+
+    count = 0
+    for batch in iter_batches(
+        iter_chunks(input_dir, workers=workers, **splitter_kwargs),
+        embed_batch_size,
+    ):
+        writer.write(batch, embedder.embed([chunk.text for chunk in batch]))
+        count += len(batch)
+        logging.info(f"{count} chunks written.")
+    writer.close()
+    return count
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Local ingestion runner")
+    parser.add_argument("--input-dir", type=Path, required=True)
+    parser.add_argument("--output", type=Path, required=True)
+    parser.add_argument("--embedder", choices=["hash", "vertexai"], default="hash")
+    parser.add_argument("--project-id", default=os.getenv("PROJECT_ID"))
+    parser.add_argument("--location", default="us-central1")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=1500)
+    parser.add_argument("--chunk-overlap", type=int, default=20)
+    parser.add_argument(
+        "--chunk-length-unit", choices=["characters", "tokens"], default="characters"
+    )
+    parser.add_argument("--embed-batch-size", type=int, default=250)
+    parser.add_argument(
+        "--output-format", choices=["jsonl", "parquet"], default="jsonl"
+    )
+    parser.add_argument("--max-shard-mb", type=int, default=256)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    embedder_kwargs = (
+        {"project_id": args.project_id, "location": args.location}
+        if args.embedder == "vertexai"
+        else {}
+    )
+    written = run(
+        input_dir=args.input_dir,
+        output=args.output,
+        embedder=create_embedder(args.embedder, **embedder_kwargs),
+        workers=args.workers,
+        embed_batch_size=args.embed_batch_size,
+        output_format=args.output_format,
+        max_shard_bytes=args.max_shard_mb * 1024 * 1024,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        chunk_length_unit=args.chunk_length_unit,
+    )
+    logging.info(f"Wrote {written} chunks to {args.output}")
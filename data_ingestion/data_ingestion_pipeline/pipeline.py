@@ -27,9 +27,14 @@ def pipeline(
     chunk_overlap: int = 20,
     destination_table: str = "incremental_questions_embeddings",
     deduped_table: str = "questions_embeddings",
+    incremental_retention_days: int = 0,
+    export_format: str = "jsonl",
+    import_mode: str = "full",
     destination_dataset: str = "mon_agent_scolaire_stackoverflow_data",
     data_store_region: str = "",
     data_store_id: str = "",
+    readiness_timeout_seconds: int = 600,
+    readiness_search_check: bool = True,
 ) -> None:
     """Processes data and ingests it into a datastore for RAG Retrieval"""
 
@@ -44,8 +49,12 @@ def pipeline(
         destination_dataset=destination_dataset,
         destination_table=destination_table,
         deduped_table=deduped_table,
+        incremental_retention_days=incremental_retention_days,
         location=location,
         embedding_column="embedding",
+        export_format=export_format,
+        export_mode=import_mode,
+        run_id=dsl.PIPELINE_JOB_ID_PLACEHOLDER,
     ).set_retry(num_retries=2)
 
     # Ingest the processed data into Vertex AI Search datastore
@@ -55,4 +64,8 @@ def pipeline(
         input_files=processed_data.output,
         data_store_id=data_store_id,
         embedding_column="embedding",
+        staging_dataset=destination_dataset,
+        run_id=dsl.PIPELINE_JOB_ID_PLACEHOLDER,
+        readiness_timeout_seconds=readiness_timeout_seconds,
+        readiness_search_check=readiness_search_check,
     ).set_retry(num_retries=2)
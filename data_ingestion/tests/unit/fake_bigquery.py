@@ -0,0 +1,431 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""In-memory stand-ins for BigQuery and BigQuery DataFrames.
+
+Tables are pandas DataFrames keyed by table ID. Only the statements that
+`process_data` issues are understood, each matched by a pattern: any other
+statement fails the test.
+"""
+
+import re
+import sys
+import types
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any
+
+import pandas as pd
+import pytest
+from google.api_core.exceptions import BadRequest, NotFound
+from google.cloud import bigquery
+
+SOURCE_TABLE = "stackoverflow_python_questions_and_answers"
+
+
+@dataclass
+class FakeTable:
+    table_id: str
+    schema: list[bigquery.SchemaField]
+    num_rows: int
+    expires: datetime | None = None
+
+
+@dataclass
+class FakeDataset:
+    """The `Output[Dataset]` artifact of the component."""
+
+    uri: str = "gs://bucket/pipeline/process_data/output_files"
+    metadata: dict[str, Any] = field(default_factory=dict)
+
+
+class FakeFrame(pd.DataFrame):
+    """A BigQuery DataFrame backed by pandas, written back to the fake."""
+
+    @property
+    def _constructor(self) -> type["FakeFrame"]:
+        return FakeFrame
+
+    def to_gbq(
+        self, destination_table: str | None = None, if_exists: str = "fail"
+    ) -> str:
+        return FakeBigQuery.current.write(
+            pd.DataFrame(self), destination_table, if_exists
+        )
+
+    def to_pandas_batches(self, page_size: int) -> Iterator[pd.DataFrame]:
+        frame = pd.DataFrame(self).reset_index(drop=True)
+        for start in range(0, len(frame), page_size):
+            yield frame.iloc[start : start + page_size]
+
+
+class FakeEmbedder:
+    def __init__(self, model_name: str) -> None:
+        self.model_name = model_name
+
+    def predict(self, texts: pd.Series) -> FakeFrame:
+        fake = FakeBigQuery.current
+        fake.maybe_fail("predict")
+        fake.embedded_texts.extend(texts)
+        failed = [
+            fake.unembeddable is not None and fake.unembeddable in text
+            for text in texts
+        ]
+        return FakeFrame(
+            {
+                "ml_generate_embedding_result": [
+                    None if fail else [float(len(text)), 1.0]
+                    for text, fail in zip(texts, failed, strict=True)
+                ],
+                "ml_generate_embedding_statistics": ["{}"] * len(texts),
+                "ml_generate_embedding_status": [
+                    "error" if fail else "" for fail in failed
+                ],
+            },
+            index=texts.index,
+        )
+
+
+class FakeJob:
+    def __init__(self, rows: list[Any]) -> None:
+        self.rows = rows
+
+    def result(self) -> list[Any]:
+        return self.rows
+
+
+class FakeBigQuery:
+    """BigQuery, BigQuery DataFrames and the embedding model, in memory.
+
+    `fail_once(pattern, skip)` makes a statement or operation matching
+    `pattern` raise once, after `skip` matching ones went through, to interrupt
+    a run at a given point.
+    """
+
+    current: "FakeBigQuery"
+
+    def __init__(self, source: pd.DataFrame, project: str = "test-project") -> None:
+        self.source = source
+        self.project = project
+        self.tables: dict[str, pd.DataFrame] = {}
+        self.schemas: dict[str, list[bigquery.SchemaField]] = {}
+        self.statements: list[str] = []
+        self.fetches = 0
+        self.embedded_texts: list[str] = []
+        self.exports: dict[str, list[str]] = {}
+        self.extracts: dict[str, list[str]] = {}
+        self.unembeddable: str | None = None  # Texts containing it get no embedding
+        self.failures: list[list[Any]] = []
+        self._anonymous = 0
+
+    def install(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Route `bigquery.Client` and the `bigframes` modules to this fake."""
+        FakeBigQuery.current = self
+        bpd = types.ModuleType("bigframes.pandas")
+        bpd.DataFrame = FakeFrame
+        bpd.options = types.SimpleNamespace(bigquery=types.SimpleNamespace())
+        bpd.read_gbq = self.read_gbq
+        bpd.read_pandas = FakeFrame
+        bpd.concat = lambda frames: FakeFrame(pd.concat(frames))
+        llm = types.ModuleType("bigframes.ml.llm")
+        llm.TextEmbeddingGenerator = FakeEmbedder
+        ml = types.ModuleType("bigframes.ml")
+        ml.llm = llm
+        bigframes = types.ModuleType("bigframes")
+        bigframes.pandas = bpd
+        bigframes.ml = ml
+        for name, module in {
+            "bigframes": bigframes,
+            "bigframes.pandas": bpd,
+            "bigframes.ml": ml,
+            "bigframes.ml.llm": llm,
+        }.items():
+            monkeypatch.setitem(sys.modules, name, module)
+        monkeypatch.setattr(bigquery, "Client", lambda **kwargs: self)
+
+    def fail_once(self, pattern: str, skip: int = 0) -> None:
+        self.failures.append([pattern, skip])
+
+    def maybe_fail(self, operation: str) -> None:
+        for failure in self.failures:
+            if re.search(failure[0], operation):
+                if failure[1]:
+                    failure[1] -= 1
+                    continue
+                self.failures.remove(failure)
+                raise RuntimeError(f"Injected failure of {operation[:80]!r}")
+
+    def table_id(self, table_id: str) -> str:
+        return table_id if table_id.count(".") == 2 else f"{self.project}.{table_id}"
+
+    def stages(self, run_key_prefix: str = "") -> dict[str, Any]:
+        checkpoints = self.tables.get(
+            f"{self.project}.so.process_data_checkpoints", pd.DataFrame()
+        )
+        return {
+            row.stage: row.payload
+            for row in checkpoints.itertuples()
+            if row.run_key.startswith(run_key_prefix)
+        }
+
+    # BigQuery DataFrames
+
+    def write(
+        self, frame: pd.DataFrame, destination_table: str | None, if_exists: str
+    ) -> str:
+        if destination_table is None:
+            self._anonymous += 1
+            destination_table = f"{self.project}._anonymous.table_{self._anonymous}"
+        table_id = self.table_id(destination_table)
+        self.maybe_fail(f"to_gbq {table_id}")
+        existing = self.tables.get(table_id)
+        if if_exists == "append" and existing is not None:
+            frame = _concat(existing, frame)
+        else:
+            self.schemas.pop(table_id, None)
+        self.tables[table_id] = frame.reset_index(drop=True)
+        return table_id
+
+    def read_gbq(self, query_or_table: str) -> FakeFrame:
+        statement = " ".join(query_or_table.split())
+        if " " not in statement:
+            return FakeFrame(self.tables[self.table_id(statement)].copy())
+        if SOURCE_TABLE in statement:
+            self.fetches += 1
+            return FakeFrame(self.source.copy())
+        if match := re.fullmatch(
+            r"SELECT chunk_id FROM `([^`]+)` WHERE deleted", statement
+        ):
+            changes = self.tables[match[1]]
+            return FakeFrame(changes.loc[changes["deleted"], ["chunk_id"]])
+        if "TRUE AS is_reused" in statement:
+            table = self.tables[re.search(r"FROM `([^`]+)`", statement)[1]]
+            reusable = (
+                table[table["content_hash"].notna() & (table["embedding_status"] == "")]
+                .sort_values("creation_timestamp", ascending=False)
+                .drop_duplicates("content_hash")
+            )
+            return FakeFrame(
+                reusable[
+                    [
+                        "content_hash",
+                        "embedding",
+                        "embedding_statistics",
+                        "embedding_status",
+                    ]
+                ].assign(is_reused=pd.array([True] * len(reusable), dtype="boolean"))
+            )
+        raise AssertionError(f"Unexpected read_gbq: {query_or_table}")
+
+    # BigQuery client
+
+    def create_dataset(self, dataset: Any, exists_ok: bool = False) -> None:
+        pass
+
+    def get_table(self, table_id: str) -> FakeTable:
+        table_id = self.table_id(table_id)
+        if table_id not in self.tables:
+            raise NotFound(table_id)
+        frame = self.tables[table_id]
+        schema = self.schemas.get(table_id) or [
+            bigquery.SchemaField(name, _field_type(frame[name])) for name in frame
+        ]
+        return FakeTable(table_id, schema, len(frame))
+
+    def create_table(self, table: bigquery.Table, exists_ok: bool = False) -> FakeTable:
+        table_id = f"{table.project}.{table.dataset_id}.{table.table_id}"
+        if table_id not in self.tables:
+            self.tables[table_id] = pd.DataFrame(
+                columns=[field.name for field in table.schema]
+            )
+            self.schemas[table_id] = list(table.schema)
+        return self.get_table(table_id)
+
+    def update_table(self, table: FakeTable, fields: list[str]) -> None:
+        pass
+
+    def delete_table(self, table_id: str, not_found_ok: bool = False) -> None:
+        table_id = self.table_id(table_id)
+        self.maybe_fail(f"delete_table {table_id}")
+        if self.tables.pop(table_id, None) is None and not not_found_ok:
+            raise NotFound(table_id)
+
+    def extract_table(self, table_id: str, uri: str, job_config: Any) -> FakeJob:
+        self.extracts[uri] = list(self.tables[self.table_id(table_id)]["chunk_id"])
+        return FakeJob([])
+
+    def query(
+        self, query: str, job_config: bigquery.QueryJobConfig | None = None
+    ) -> FakeJob:
+        statement = " ".join(query.split())
+        self.statements.append(statement)
+        self.maybe_fail(statement)
+        params = {
+            parameter.name: parameter.value
+            for parameter in (job_config.query_parameters if job_config else [])
+        }
+        return FakeJob(self._execute(statement, params))
+
+    def _execute(self, statement: str, params: dict[str, str]) -> list[Any]:
+        tables = self.tables
+        if match := re.match(r"CREATE TABLE IF NOT EXISTS `([^`]+)` \(", statement):
+            tables.setdefault(
+                match[1],
+                pd.DataFrame(columns=["run_key", "stage", "payload", "completed_at"]),
+            )
+            return []
+        if match := re.match(
+            r"SELECT stage, payload FROM `([^`]+)` WHERE run_key = @run_key", statement
+        ):
+            table = tables[match[1]]
+            rows = table[table["run_key"] == params["run_key"]]
+            return [types.SimpleNamespace(**row) for row in rows.to_dict("records")]
+        if match := re.match(r"MERGE `([^`]+)` T USING \(SELECT @run_key", statement):
+            table = tables[match[1]]
+            same = (table["run_key"] == params["run_key"]) & (
+                table["stage"] == params["stage"]
+            )
+            row = {**params, "completed_at": datetime.now()}
+            tables[match[1]] = _concat(table[~same], pd.DataFrame([row]))
+            return []
+        if match := re.match(
+            r"DELETE FROM `([^`]+)` WHERE question_id > (\d+)$", statement
+        ):
+            table = tables[match[1]]
+            tables[match[1]] = table[table["question_id"] <= int(match[2])]
+            return []
+        if match := re.match(
+            r"DELETE FROM `([^`]+)` WHERE creation_timestamp = "
+            r"(TIMESTAMP|DATETIME)\(@creation_timestamp\)$",
+            statement,
+        ):
+            self._check_column_type(match[1], "creation_timestamp", match[2])
+            table = tables[match[1]]
+            created = pd.Timestamp(params["creation_timestamp"])
+            tables[match[1]] = table[table["creation_timestamp"] != created]
+            return []
+        if match := re.match(
+            r"DELETE FROM `([^`]+)` WHERE creation_timestamp < (TIMESTAMP|DATETIME)"
+            r"_TRUNC\( \2_SUB\( CURRENT_\2\(\), INTERVAL (\d+) DAY \), DAY \)$",
+            statement,
+        ):
+            self._check_column_type(match[1], "creation_timestamp", match[2])
+            table = tables[match[1]]
+            # CURRENT_TIMESTAMP() and CURRENT_DATETIME() are both in UTC
+            now = pd.Timestamp(datetime.now(timezone.utc).replace(tzinfo=None))
+            cutoff = (now - pd.Timedelta(days=int(match[3]))).floor("D")
+            created = pd.to_datetime(table["creation_timestamp"])
+            tables[match[1]] = table[created >= cutoff].reset_index(drop=True)
+            return []
+        if match := re.match(
+            r"BEGIN TRANSACTION; .* MERGE `([^`]+)` T USING `([^`]+)` S", statement
+        ):
+            deduped, chunks = tables[match[1]], tables[match[2]]
+            replaced = deduped["question_id"].isin(chunks["question_id"]) | deduped[
+                "chunk_id"
+            ].isin(chunks["chunk_id"])
+            tables[match[1]] = _concat(deduped[~replaced], chunks)
+            return []
+        if match := re.match(
+            r"CREATE TABLE IF NOT EXISTS `([^`]+)` AS SELECT T.chunk_id, TRUE AS "
+            r"deleted FROM `([^`]+)` T .* FROM `([^`]+)` S LEFT JOIN",
+            statement,
+        ):
+            if match[1] not in tables:
+                deduped, chunks = tables[match[2]], tables[match[3]]
+                removed = deduped[
+                    deduped["question_id"].isin(chunks["question_id"])
+                    & ~deduped["chunk_id"].isin(chunks["chunk_id"])
+                ]
+                previous = chunks.merge(
+                    deduped, on="chunk_id", how="left", suffixes=("", "_t")
+                )
+                changed = previous[
+                    previous["content_hash_t"].isna()
+                    | (previous["content_hash"] != previous["content_hash_t"])
+                    | (previous["last_edit_date"] != previous["last_edit_date_t"])
+                ]
+                tables[match[1]] = pd.DataFrame(
+                    {
+                        "chunk_id": [*removed["chunk_id"], *changed["chunk_id"]],
+                        "deleted": [True] * len(removed) + [False] * len(changed),
+                    }
+                )
+            return []
+        if match := re.fullmatch(
+            r"SELECT COUNTIF\(deleted\) AS deleted FROM `([^`]+)`", statement
+        ):
+            deleted = int(tables[match[1]]["deleted"].sum())
+            return [types.SimpleNamespace(deleted=deleted)]
+        if match := re.match(
+            r"CREATE OR REPLACE TABLE `([^`]+)` CLUSTER BY shard AS SELECT \*, "
+            r"DIV\(ROW_NUMBER\(\) OVER \(ORDER BY id\) - 1, (\d+)\) AS shard "
+            r"FROM \(.* FROM `([^`]+)` "
+            r"WHERE chunk_id IS NOT NULL AND embedding IS NOT NULL"
+            r"(?: AND chunk_id IN \( SELECT chunk_id FROM `([^`]+)` WHERE NOT "
+            r"deleted \))? \)$",
+            statement,
+        ):
+            source = tables[match[3]]
+            exported = source["chunk_id"].notna() & source["embedding"].notna()
+            if match[4]:
+                changes = tables[match[4]]
+                changed = changes.loc[~changes["deleted"].astype(bool), "chunk_id"]
+                exported &= source["chunk_id"].isin(changed)
+            ids = sorted(source.loc[exported, "chunk_id"])
+            tables[match[1]] = pd.DataFrame(
+                {"id": ids, "shard": [i // int(match[2]) for i in range(len(ids))]}
+            )
+            return []
+        if match := re.match(
+            r"EXPORT DATA OPTIONS \( uri = '([^']+)', .* FROM `([^`]+)` "
+            r"WHERE shard = (\d+)$",
+            statement,
+        ):
+            table = tables[match[2]]
+            self.exports[match[1]] = list(
+                table.loc[table["shard"] == int(match[3]), "id"]
+            )
+            return []
+        raise AssertionError(f"Unexpected statement: {statement}")
+
+    def _check_column_type(self, table_id: str, column: str, expected: str) -> None:
+        """Fail like BigQuery when a column is compared with another type."""
+        (field_type,) = [
+            field.field_type
+            for field in self.get_table(table_id).schema
+            if field.name == column
+        ]
+        if field_type != expected:
+            raise BadRequest(f"Cannot compare {column} ({field_type}) with {expected}")
+
+
+def _concat(*frames: pd.DataFrame) -> pd.DataFrame:
+    non_empty = [frame for frame in frames if len(frame)] or frames[-1:]
+    return pd.concat(non_empty, ignore_index=True)
+
+
+def _field_type(column: pd.Series) -> str:
+    # Like `to_gbq`: naive datetimes are written as DATETIME
+    if isinstance(column.dtype, pd.DatetimeTZDtype):
+        return "TIMESTAMP"
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return "DATETIME"
+    if pd.api.types.is_bool_dtype(column):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(column):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(column):
+        return "FLOAT"
+    return "STRING"
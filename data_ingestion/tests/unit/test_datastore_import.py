@@ -0,0 +1,306 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+from data_ingestion_pipeline.components.datastore_import import (
+    import_shards,
+    purge_documents,
+    wait_until_indexed,
+)
+from google.api_core.exceptions import NotFound, ServiceUnavailable
+
+BRANCH = "projects/p/locations/global/collections/default_collection/dataStores/d/branches/default_branch"
+CANARIES = [("1__0", "How do I sort a list"), ("2__0", "Use sorted with a key")]
+
+
+class FakeClock:
+    """Replaces `time.monotonic` and `time.sleep`: sleeping advances the clock."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+        self._lock = threading.Lock()
+
+    def monotonic(self) -> float:
+        with self._lock:
+            return self.now
+
+    def sleep(self, seconds: float) -> None:
+        with self._lock:
+            self.sleeps.append(seconds)
+            self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(time, "sleep", clock.sleep)
+    return clock
+
+
+class FakeOperation:
+    """A long-running operation that is done after `polls` checks."""
+
+    def __init__(self, response: Any, metadata: Any, polls: int = 1) -> None:
+        self.operation = SimpleNamespace(name="operations/1")
+        self.response = response
+        self.metadata = metadata
+        self.polls = polls
+
+    def done(self) -> bool:
+        self.polls -= 1
+        return self.polls < 0
+
+    def result(self) -> Any:
+        return self.response
+
+
+class FakeDocumentService:
+    """Documents become readable `visible_after` seconds of the clock."""
+
+    def __init__(self, clock: FakeClock, visible_after: float = 0.0) -> None:
+        self.clock = clock
+        self.visible_after = visible_after
+        self.documents: set[str] = set()
+        self.reads: list[str] = []
+        self.requests: list[Any] = []
+        self.listed_ids: list[str] = []  # Content of the GCS files of IDs
+        self.undeletable: set[str] = set()
+
+    def purge_documents(self, request: Any) -> FakeOperation:
+        self.requests.append(request)
+        purged = ignored = failed = 0
+        for document_id in self.listed_ids:
+            name = f"{request.parent}/documents/{document_id}"
+            if document_id in self.undeletable:
+                failed += 1
+            elif name in self.documents:
+                self.documents.remove(name)
+                purged += 1
+            else:
+                ignored += 1
+        return FakeOperation(
+            SimpleNamespace(purge_count=purged),
+            SimpleNamespace(ignored_count=ignored, failure_count=failed),
+        )
+
+    def get_document(self, request: Any) -> SimpleNamespace:
+        self.reads.append(request.name)
+        if request.name not in self.documents or self.clock.now < self.visible_after:
+            raise NotFound(request.name)
+        return SimpleNamespace(name=request.name)
+
+
+class FakeImportService:
+    """Imports shards by the outcomes scripted for each of their attempts.
+
+    An outcome is "ok", "raise" (the call fails) or "partial" (the operation
+    reports failed documents). A shard without a script always succeeds.
+    """
+
+    def __init__(self, clock: FakeClock, outcomes: dict[str, list[str]]) -> None:
+        self.clock = clock
+        self.outcomes = outcomes
+        self.submitted: list[tuple[float, str]] = []
+
+    def import_documents(self, request: Any) -> FakeOperation:
+        (uri,) = request.gcs_source.input_uris
+        self.submitted.append((self.clock.now, uri))
+        outcomes = self.outcomes.get(uri, [])
+        outcome = outcomes.pop(0) if outcomes else "ok"
+        if outcome == "raise":
+            raise ServiceUnavailable("import quota exceeded")
+        failed = 2 if outcome == "partial" else 0
+        return FakeOperation(
+            SimpleNamespace(
+                error_samples=[SimpleNamespace(message="bad document")] * failed
+            ),
+            SimpleNamespace(success_count=10 - failed, failure_count=failed),
+            polls=0,
+        )
+
+
+class FakeSearchService:
+    """Search serves the documents `visible_after` seconds of the clock."""
+
+    def __init__(self, clock: FakeClock, visible_after: float, count: int) -> None:
+        self.clock = clock
+        self.visible_after = visible_after
+        self.count = count
+        self.queries: list[str] = []
+
+    def search(self, request: Any) -> SimpleNamespace:
+        self.queries.append(request.query)
+        visible = self.clock.now >= self.visible_after
+        results = [
+            SimpleNamespace(id=document_id)
+            for document_id, text in CANARIES
+            if visible and request.query == text
+        ]
+        page = SimpleNamespace(total_size=self.count if visible else 0, results=results)
+        return SimpleNamespace(pages=[page])
+
+
+def stored(clock: FakeClock, visible_after: float = 0.0) -> FakeDocumentService:
+    documents = FakeDocumentService(clock, visible_after)
+    documents.documents = {f"{BRANCH}/documents/{id_}" for id_, _ in CANARIES}
+    return documents
+
+
+def test_canaries_are_read_by_id(clock: FakeClock) -> None:
+    documents = stored(clock, visible_after=12)
+
+    elapsed = wait_until_indexed(documents, BRANCH, CANARIES, timeout_seconds=180)
+
+    assert elapsed == 15
+    assert clock.sleeps == [5, 10]
+    assert documents.reads[-1] == f"{BRANCH}/documents/2__0"
+
+
+def test_times_out_when_a_canary_is_missing(clock: FakeClock) -> None:
+    documents = stored(clock)
+    documents.documents.pop()
+
+    assert wait_until_indexed(documents, BRANCH, CANARIES, 180, max_delay=40) is None
+    assert clock.sleeps == [5, 10, 20, 40, 40, 40]
+
+
+def test_search_is_an_optional_check(clock: FakeClock) -> None:
+    search = FakeSearchService(clock, visible_after=30, count=10)
+
+    elapsed = wait_until_indexed(
+        stored(clock),
+        BRANCH,
+        CANARIES,
+        timeout_seconds=180,
+        search_client=search,
+        serving_config="serving_config",
+        expected_documents=10,
+    )
+
+    assert elapsed == 35
+    assert search.queries[:3] == ["", *(text for _, text in CANARIES)]
+
+
+def test_keeps_polling_until_search_returns_the_canaries(clock: FakeClock) -> None:
+    # The documents are readable by ID right after the import, before the
+    # search serves them
+    documents = stored(clock)
+    search = FakeSearchService(clock, visible_after=100, count=10)
+
+    elapsed = wait_until_indexed(
+        documents,
+        BRANCH,
+        CANARIES,
+        timeout_seconds=600,
+        search_client=search,
+        serving_config="serving_config",
+    )
+
+    assert elapsed == 135
+    assert clock.sleeps == [5, 10, 20, 40, 60]
+    assert len(documents.reads) == len(CANARIES)
+    assert len(search.queries) == 6 * (1 + len(CANARIES))
+
+
+def test_search_starts_once_the_canaries_are_readable(clock: FakeClock) -> None:
+    search = FakeSearchService(clock, visible_after=0, count=10)
+
+    elapsed = wait_until_indexed(
+        stored(clock, visible_after=12),
+        BRANCH,
+        CANARIES,
+        timeout_seconds=180,
+        search_client=search,
+    )
+
+    assert elapsed == 15
+    assert len(search.queries) == 1 + len(CANARIES)
+
+
+def test_search_must_count_the_expected_documents(clock: FakeClock) -> None:
+    search = FakeSearchService(clock, visible_after=0, count=9)
+
+    assert (
+        wait_until_indexed(
+            stored(clock),
+            BRANCH,
+            CANARIES,
+            timeout_seconds=60,
+            search_client=search,
+            expected_documents=10,
+        )
+        is None
+    )
+
+
+def test_purge_reads_the_ids_from_gcs(clock: FakeClock) -> None:
+    documents = stored(clock)
+    documents.listed_ids = ["1__0", "2__0", "3__0"]
+
+    assert purge_documents(documents, BRANCH, "gs://bucket/deleted-*.csv") == 2
+    (request,) = documents.requests
+    assert request.parent == BRANCH
+    assert list(request.gcs_source.input_uris) == ["gs://bucket/deleted-*.csv"]
+    assert request.gcs_source.data_schema == "document_id"
+    assert (request.filter, request.force) == ("*", True)
+    assert clock.sleeps == [30]
+    assert not documents.documents
+
+    # A retry ignores the documents that are already gone
+    assert purge_documents(documents, BRANCH, "gs://bucket/deleted-*.csv") == 0
+
+
+def test_purge_fails_when_documents_are_left(clock: FakeClock) -> None:
+    documents = stored(clock)
+    documents.listed_ids = ["1__0", "2__0"]
+    documents.undeletable = {"2__0"}
+
+    with pytest.raises(RuntimeError, match="1 documents listed in"):
+        purge_documents(documents, BRANCH, "gs://bucket/deleted-*.csv")
+
+
+SHARDS = [f"gs://bucket/export/{shard:05d}-0.jsonl" for shard in range(4)]
+
+
+def test_import_shards_retries_failed_and_partial_shards(clock: FakeClock) -> None:
+    service = FakeImportService(
+        clock, {SHARDS[0]: ["raise", "ok"], SHARDS[1]: ["partial", "ok"]}
+    )
+
+    imported = import_shards(
+        service, BRANCH, SHARDS, parallelism=3, requests_per_minute=30
+    )
+
+    assert imported == 40
+    times = [at for at, _ in service.submitted]
+    assert all(later - earlier >= 2 for earlier, later in itertools.pairwise(times))
+    assert sorted(uri for _, uri in service.submitted[4:]) == SHARDS[:2]
+    assert 30 in clock.sleeps
+
+
+def test_import_shards_gives_up_after_max_retries(clock: FakeClock) -> None:
+    service = FakeImportService(clock, {SHARDS[2]: ["partial"] * 3})
+
+    with pytest.raises(RuntimeError, match="1 of 4 shards failed to import after 2"):
+        import_shards(service, BRANCH, SHARDS, max_retries=2)
+    assert [uri for _, uri in service.submitted[4:]] == [SHARDS[2]] * 2
+    assert clock.sleeps.count(30) == clock.sleeps.count(60) == 1
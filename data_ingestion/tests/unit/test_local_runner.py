@@ -0,0 +1,131 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from pathlib import Path
+
+import pyarrow.parquet as pq
+import pytest
+from data_ingestion_pipeline.local_runner import (
+    HashEmbedder,
+    JsonlWriter,
+    ParquetShardWriter,
+    iter_chunks,
+    run,
+)
+
+PARAGRAPH = "La photosynthèse transforme l'énergie lumineuse en énergie chimique. "
+
+
+@pytest.fixture
+def corpus(tmp_path: Path) -> Path:
+    root = tmp_path / "cours"
+    (root / "biologie").mkdir(parents=True)
+    (root / "biologie" / "photosynthese.md").write_text(
+        "# Photosynthèse\n\n" + PARAGRAPH * 40, encoding="utf-8"
+    )
+    (root / "biologie" / "cellule.html").write_text(
+        "<h1>La cellule</h1><p>" + PARAGRAPH * 5 + "</p>", encoding="utf-8"
+    )
+    (root / "notes.txt").write_text(PARAGRAPH, encoding="utf-8")
+    (root / "vide.md").write_text("  \n", encoding="utf-8")
+    (root / "image.png").write_bytes(b"\x89PNG")
+    return root
+
+
+def test_hash_embedder_is_deterministic_and_normalized() -> None:
+    embedder = HashEmbedder(dimension=48)
+    first, second, again = embedder.embed(["cellule", "atome", "cellule"])
+
+    assert len(first) == 48
+    assert first == again
+    assert first != second
+    assert sum(v * v for v in first) == pytest.approx(1.0)
+
+
+def test_iter_chunks_is_ordered_and_independent_of_workers(corpus: Path) -> None:
+    chunks = list(iter_chunks(corpus, workers=1, chunk_size=500, chunk_overlap=0))
+    pooled = list(iter_chunks(corpus, workers=2, chunk_size=500, chunk_overlap=0))
+
+    assert chunks == pooled
+    titles = [chunk.title for chunk in chunks]
+    assert titles[0] == "cellule"
+    assert titles.count("Photosynthèse") > 1
+    assert titles[-1] == "notes"
+    assert all(len(chunk.text) <= 500 for chunk in chunks)
+    for chunk in chunks:
+        assert isinstance(chunk.question_id, int)
+        assert 0 <= chunk.question_id < 2**63
+        assert chunk.chunk_id.startswith(f"{chunk.question_id}__")
+
+
+def test_jsonl_writer_matches_pipeline_export(tmp_path: Path, corpus: Path) -> None:
+    chunks = list(iter_chunks(corpus, workers=1))
+    output = tmp_path / "out.jsonl"
+    writer = JsonlWriter(output, "2025-01-01T00:00:00+00:00", "embedding")
+    writer.write(chunks, HashEmbedder(dimension=8).embed([c.text for c in chunks]))
+    assert not output.exists()
+    writer.close()
+
+    documents = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [document["id"] for document in documents] == [c.chunk_id for c in chunks]
+    data = json.loads(documents[0]["json_data"])
+    assert set(data) == {
+        "id",
+        "embedding",
+        "content",
+        "question_id",
+        "creation_timestamp",
+        "last_edit_date",
+        "question_text",
+        "full_text_md",
+    }
+    assert data["question_id"] == chunks[0].question_id
+    assert len(data["embedding"]) == 8
+    assert not output.with_name("out.jsonl.tmp").exists()
+
+
+def test_parquet_shard_writer_bounds_shards(tmp_path: Path, corpus: Path) -> None:
+    chunks = list(iter_chunks(corpus, workers=1, chunk_size=200, chunk_overlap=0))
+    output = tmp_path / "shards"
+    output.mkdir()
+    (output / "part-00042.parquet").write_bytes(b"stale")
+    embedder = HashEmbedder(dimension=16)
+    writer = ParquetShardWriter(
+        output,
+        "2025-01-01T00:00:00+00:00",
+        "embedding",
+        max_shard_bytes=4096,
+    )
+    for start in range(0, len(chunks), 4):
+        batch = chunks[start : start + 4]
+        writer.write(batch, embedder.embed([chunk.text for chunk in batch]))
+    writer.close()
+
+    assert len(writer.shards) > 1
+    assert sorted(output.glob("*.parquet")) == writer.shards
+    table = pq.read_table(output)
+    assert table.num_rows == len(chunks)
+    assert str(table.schema.field("question_id").type) == "int64"
+    # Same type as the ARRAY<FLOAT64> column exported by BigQuery
+    assert str(table.schema.field("embedding").type) == "list<element: double>"
+    assert table.column("id").to_pylist() == [chunk.chunk_id for chunk in chunks]
+
+
+def test_run_writes_every_chunk(tmp_path: Path, corpus: Path) -> None:
+    output = tmp_path / "out.jsonl"
+    written = run(corpus, output, HashEmbedder(dimension=8), workers=1)
+
+    assert written == len(output.read_text().splitlines())
+    assert written == len(list(iter_chunks(corpus, workers=1)))
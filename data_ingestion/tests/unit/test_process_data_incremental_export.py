@@ -0,0 +1,103 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""With export_mode="incremental", `process_data` exports only the chunks a run
+added or changed, and the IDs of the chunks it removed."""
+
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from data_ingestion_pipeline.components.process_data import process_data
+from fake_bigquery import FakeBigQuery, FakeDataset
+
+DEDUPED_TABLE = "test-project.so.questions_embeddings"
+
+
+def question(
+    question_id: int, sentences: int, answer: str = "", edited: int = 1
+) -> dict:
+    return {
+        "creation_date": datetime(2020, 1, 1),
+        "last_edit_date": datetime(2020, 1, edited),
+        "question_id": question_id,
+        "question_title": f"Question {question_id}",
+        "question_text": f"<p>{f'How do I write loop {question_id}? ' * sentences}</p>",
+        "answers": [{"body": f"<p>Use a for statement. {answer}</p>"}],
+    }
+
+
+def run(run_id: str) -> FakeDataset:
+    output_files = FakeDataset()
+    process_data.python_func(
+        project_id="test-project",
+        schedule_time="2025-06-01T00:00:00Z",
+        output_files=output_files,
+        destination_dataset="so",
+        chunk_size=200,
+        chunk_overlap=0,
+        run_id=run_id,
+        export_mode="incremental",
+    )
+    return output_files
+
+
+def chunk_ids(fake: FakeBigQuery, question_id: int) -> set[str]:
+    deduped = fake.tables[DEDUPED_TABLE]
+    return set(deduped.loc[deduped["question_id"] == question_id, "chunk_id"])
+
+
+@pytest.fixture
+def fake(monkeypatch: pytest.MonkeyPatch) -> FakeBigQuery:
+    fake = FakeBigQuery(
+        pd.DataFrame([question(100, 20), question(101, 20), question(102, 2)])
+    )
+    fake.install(monkeypatch)
+    run("run-1")
+    return fake
+
+
+def test_first_run_exports_every_chunk(fake: FakeBigQuery) -> None:
+    exported = [id_ for ids in fake.exports.values() for id_ in ids]
+
+    assert sorted(exported) == sorted(fake.tables[DEDUPED_TABLE]["chunk_id"])
+
+
+def test_only_changes_are_exported(fake: FakeBigQuery) -> None:
+    before = {question_id: chunk_ids(fake, question_id) for question_id in (100, 101)}
+    fake.exports.clear()
+    fake.unembeddable = "UNEMBEDDABLE"
+    fake.source = pd.DataFrame(
+        [
+            question(100, 8, edited=2),  # Shorter, its last chunks are removed
+            question(101, 20),  # Unchanged
+            question(102, 2, "UNEMBEDDABLE", edited=2),  # Its embedding fails
+            question(103, 2),  # New
+        ]
+    )
+
+    output_files = run("run-2")
+
+    exported = {id_ for ids in fake.exports.values() for id_ in ids}
+    removed = before[100] - chunk_ids(fake, 100)
+    assert removed
+    assert exported == chunk_ids(fake, 100) | chunk_ids(fake, 103)
+    assert list(fake.extracts.values()) == [sorted(removed)]
+    assert output_files.metadata == {
+        "import_mode": "incremental",
+        "documents": len(exported),
+        "deleted": len(removed),
+        "deleted_uri": FakeDataset().uri + "-deleted-*.csv",
+    }
+    assert chunk_ids(fake, 101) == before[101]
+    assert chunk_ids(fake, 102).isdisjoint(exported)
@@ -0,0 +1,197 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A retried run of `process_data` resumes after its last checkpoint and ends
+with the same tables and export as an uninterrupted run."""
+
+import concurrent.futures
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from data_ingestion_pipeline.components.process_data import process_data
+from fake_bigquery import FakeBigQuery, FakeDataset
+
+PROJECT = "test-project"
+INCREMENTAL_TABLE = f"{PROJECT}.so.incremental_questions_embeddings"
+DEDUPED_TABLE = f"{PROJECT}.so.questions_embeddings"
+
+
+def make_source(questions: int = 8) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "creation_date": [datetime(2020, 1, 1)] * questions,
+            "last_edit_date": [datetime(2020, 1, i + 1) for i in range(questions)],
+            "question_id": [100 + i for i in range(questions)],
+            "question_title": [f"Question {i}" for i in range(questions)],
+            "question_text": [
+                f"<p>{f'How do I write loop {i} in Python? ' * 8}</p>"
+                for i in range(questions)
+            ],
+            "answers": [
+                [{"body": f"<p>{f'Use a for statement {i}. ' * 10}</p>"}]
+                for i in range(questions)
+            ],
+        }
+    )
+
+
+def run(fake: FakeBigQuery, output_files: FakeDataset | None = None) -> FakeDataset:
+    output_files = output_files or FakeDataset()
+    process_data.python_func(
+        project_id=PROJECT,
+        schedule_time="2025-06-01T00:00:00Z",
+        output_files=output_files,
+        destination_dataset="so",
+        chunk_size=200,
+        chunk_overlap=0,
+        chunk_batch_size=4,
+        run_id="run-1",
+        export_max_rows_per_shard=10,
+    )
+    return output_files
+
+
+def run_interrupted(fake: FakeBigQuery) -> None:
+    with pytest.raises(RuntimeError, match="Injected failure"):
+        run(fake)
+    assert not fake.failures
+
+
+def chunk_ids(fake: FakeBigQuery, table_id: str) -> list[str]:
+    return sorted(fake.tables[table_id]["chunk_id"])
+
+
+@pytest.fixture
+def reference(monkeypatch: pytest.MonkeyPatch) -> FakeBigQuery:
+    fake = FakeBigQuery(make_source(), project=PROJECT)
+    fake.install(monkeypatch)
+    run(fake)
+    return fake
+
+
+@pytest.fixture
+def fake(monkeypatch: pytest.MonkeyPatch, reference: FakeBigQuery) -> FakeBigQuery:
+    fake = FakeBigQuery(make_source(), project=PROJECT)
+    fake.install(monkeypatch)
+    return fake
+
+
+def assert_same_result(fake: FakeBigQuery, reference: FakeBigQuery) -> None:
+    assert chunk_ids(fake, INCREMENTAL_TABLE) == chunk_ids(reference, INCREMENTAL_TABLE)
+    assert chunk_ids(fake, DEDUPED_TABLE) == chunk_ids(reference, DEDUPED_TABLE)
+    assert fake.exports == reference.exports
+    assert not [table for table in fake.tables if "._process_data_" in table]
+
+
+def test_uninterrupted_run(reference: FakeBigQuery) -> None:
+    chunks = chunk_ids(reference, INCREMENTAL_TABLE)
+    assert len(chunks) == len(set(chunks)) > 10
+    assert sorted(reference.embedded_texts) == sorted(
+        reference.tables[INCREMENTAL_TABLE]["text_chunk"]
+    )
+    assert list(reference.exports.values()) == [
+        chunks[start : start + 10] for start in range(0, len(chunks), 10)
+    ]
+    assert set(reference.stages()) == {
+        "fetched",
+        "chunked",
+        "embedded",
+        "stored",
+        "exported",
+    }
+
+
+def test_resume_after_fetched(fake: FakeBigQuery, reference: FakeBigQuery) -> None:
+    fake.fail_once("predict")
+    run_interrupted(fake)
+    assert set(fake.stages()) == {"fetched"}
+
+    run(fake)
+
+    assert fake.fetches == 1
+    assert len(fake.embedded_texts) == len(reference.embedded_texts)
+    assert_same_result(fake, reference)
+
+
+def test_resume_partway_through_chunked(
+    fake: FakeBigQuery, reference: FakeBigQuery
+) -> None:
+    fake.fail_once("predict", skip=2)
+    run_interrupted(fake)
+    progress = json.loads(fake.stages()["chunked"])
+    embedded_before = len(fake.embedded_texts)
+
+    run(fake)
+
+    resumed = fake.tables[INCREMENTAL_TABLE]
+    assert fake.fetches == 1
+    assert (
+        len(fake.embedded_texts) - embedded_before
+        == (resumed["question_id"] > progress["question_id"]).sum()
+    )
+    assert_same_result(fake, reference)
+
+
+def test_resume_after_embedded(fake: FakeBigQuery, reference: FakeBigQuery) -> None:
+    # The incremental table is appended to before the upsert fails
+    fake.fail_once("^BEGIN TRANSACTION")
+    run_interrupted(fake)
+    assert "stored" not in fake.stages()
+    assert len(fake.tables[INCREMENTAL_TABLE]) == len(
+        reference.tables[INCREMENTAL_TABLE]
+    )
+    embedded_before = len(fake.embedded_texts)
+
+    run(fake)
+
+    assert len(fake.embedded_texts) == embedded_before
+    assert any(
+        "WHERE creation_timestamp = DATETIME(@creation_timestamp)" in statement
+        for statement in fake.statements
+    )
+    assert_same_result(fake, reference)
+
+
+def test_resume_after_embedded_starts_no_markdown_pool(
+    monkeypatch: pytest.MonkeyPatch, fake: FakeBigQuery
+) -> None:
+    fake.fail_once("^BEGIN TRANSACTION")
+    run_interrupted(fake)
+
+    def no_pool(*args: object, **kwargs: object) -> None:
+        raise AssertionError("The markdown pool is only needed to chunk")
+
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", no_pool)
+    run(fake)
+
+    assert "exported" in fake.stages()
+
+
+def test_resume_after_exported(fake: FakeBigQuery, reference: FakeBigQuery) -> None:
+    # The work tables are deleted after the "exported" checkpoint
+    fake.fail_once(r"delete_table .*_export$")
+    first = FakeDataset()
+    with pytest.raises(RuntimeError, match="Injected failure"):
+        run(fake, first)
+    exports = len([s for s in fake.statements if s.startswith("EXPORT DATA")])
+
+    second = run(fake)
+
+    assert len([s for s in fake.statements if s.startswith("EXPORT DATA")]) == exports
+    assert (second.uri, second.metadata) == (first.uri, first.metadata)
+    assert second.uri.endswith("*.jsonl")
+    assert fake.exports == reference.exports
@@ -0,0 +1,86 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""The incremental table keeps `incremental_retention_days` of history, whether
+its partition column is a DATETIME or a TIMESTAMP."""
+
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from data_ingestion_pipeline.components.process_data import process_data
+from fake_bigquery import FakeBigQuery, FakeDataset
+from google.cloud import bigquery
+
+INCREMENTAL_TABLE = "test-project.so.incremental_questions_embeddings"
+
+
+def make_source(questions: int = 3) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "creation_date": [datetime(2020, 1, 1)] * questions,
+            "last_edit_date": [datetime(2020, 1, 1)] * questions,
+            "question_id": [100 + i for i in range(questions)],
+            "question_title": [f"Question {i}" for i in range(questions)],
+            "question_text": [
+                f"<p>How do I write loop {i} in Python?</p>" for i in range(questions)
+            ],
+            "answers": [[{"body": "<p>Use a for statement.</p>"}]] * questions,
+        }
+    )
+
+
+def run(run_id: str, retention_days: int = 0) -> None:
+    process_data.python_func(
+        project_id="test-project",
+        schedule_time="2025-06-01T00:00:00Z",
+        output_files=FakeDataset(),
+        destination_dataset="so",
+        chunk_size=200,
+        chunk_overlap=0,
+        run_id=run_id,
+        incremental_retention_days=retention_days,
+    )
+
+
+@pytest.mark.parametrize("column_type", ["DATETIME", "TIMESTAMP"])
+def test_history_older_than_the_retention_is_pruned(
+    monkeypatch: pytest.MonkeyPatch, column_type: str
+) -> None:
+    fake = FakeBigQuery(make_source())
+    fake.install(monkeypatch)
+    run("run-1")
+    table = fake.tables[INCREMENTAL_TABLE]
+    # Backdate the rows of the first question by a month
+    old = table["question_id"] == 100
+    table.loc[old, "creation_timestamp"] -= pd.Timedelta(days=30)
+    fake.schemas[INCREMENTAL_TABLE] = [
+        bigquery.SchemaField(field.name, column_type)
+        if field.name == "creation_timestamp"
+        else field
+        for field in fake.get_table(INCREMENTAL_TABLE).schema
+    ]
+    kept = len(table) - old.sum()
+
+    run("run-2", retention_days=7)
+
+    pruned = fake.tables[INCREMENTAL_TABLE]
+    assert any(
+        f"< {column_type}_TRUNC( {column_type}_SUB( CURRENT_{column_type}()"
+        in statement
+        for statement in fake.statements
+    )
+    # The recent rows of the first run are kept, and the second run appended
+    # every chunk again
+    assert len(pruned) == kept + len(table)
+    assert pruned["creation_timestamp"].min() > datetime.now() - pd.Timedelta(days=1)
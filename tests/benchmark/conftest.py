@@ -0,0 +1,161 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Stubbed backends shared by the hot path benchmarks."""
+
+from collections.abc import AsyncGenerator, Iterator
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.auth.credentials import AnonymousCredentials
+from google.genai import types
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+
+class FakeEmbeddings(Embeddings):
+    """Stands in for VertexAIEmbeddings, which calls Vertex AI when created."""
+
+    def __init__(self, **kwargs: Any) -> None:
+        pass
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return [0.0] * 768
+
+
+# Importing `app` builds the agents, which needs credentials: stub them out.
+with (
+    patch(
+        "google.auth.default",
+        return_value=(AnonymousCredentials(), "benchmark-project"),
+    ),
+    patch("vertexai.init"),
+    patch("langchain_google_vertexai.VertexAIEmbeddings", FakeEmbeddings),
+):
+    from app import multi_agents
+
+
+def make_documents(count: int, content_chars: int = 1500) -> list[Document]:
+    """Build chunks shaped like the structured data store results."""
+    return [
+        Document(
+            page_content=f"Question {i}\n"
+            + "Le cours explique la notion. " * (content_chars // 29),
+            metadata={
+                "id": f"{i}__0",
+                "question_id": i,
+                "relevance_score": 1 / (i + 1),
+            },
+        )
+        for i in range(count)
+    ]
+
+
+class FakeRetriever:
+    def __init__(self, documents: list[Document]) -> None:
+        self.documents = documents
+
+    def invoke(self, query: str) -> list[Document]:
+        return list(self.documents)
+
+
+class FakeCompressor:
+    def __init__(self, top_n: int = 5) -> None:
+        self.top_n = top_n
+
+    def compress_documents(
+        self, documents: list[Document], query: str
+    ) -> list[Document]:
+        ranked = sorted(
+            documents, key=lambda doc: doc.metadata["relevance_score"], reverse=True
+        )
+        return ranked[: self.top_n]
+
+
+class FakeLlm(BaseLlm):
+    """Model delegating to the first declared tool, then answering in text.
+
+    Drives a full orchestrator turn: orchestrator -> search_agent ->
+    retrieve_docs -> answer, without calling Gemini.
+    """
+
+    model: str = "fake-llm"
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        last = llm_request.contents[-1] if llm_request.contents else None
+        parts = (last.parts if last else None) or []
+        answered = any(part.function_response for part in parts)
+        declarations = [
+            declaration
+            for tool in llm_request.config.tools or []
+            for declaration in tool.function_declarations or []
+        ]
+        if declarations and not answered:
+            declaration = next(
+                (d for d in declarations if d.name == "search_agent"), declarations[0]
+            )
+            properties = (
+                declaration.parameters.properties if declaration.parameters else {}
+            )
+            argument = next(iter(properties or {}), "request")
+            part = types.Part.from_function_call(
+                name=declaration.name,
+                args={argument: "Que dit le cours sur la photosynthèse ?"},
+            )
+        else:
+            part = types.Part.from_text(
+                text="La photosynthèse transforme la lumière. " * 20
+            )
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[part]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=1200, candidates_token_count=80
+            ),
+        )
+
+
+@pytest.fixture
+def fake_search_backends() -> Iterator[None]:
+    """Replace the Vertex AI Search retriever and the ranking API."""
+    with (
+        patch.object(multi_agents, "retriever", FakeRetriever(make_documents(10))),
+        patch.object(multi_agents, "compressor", FakeCompressor()),
+    ):
+        yield
+
+
+@pytest.fixture
+def fake_model(fake_search_backends: None) -> Iterator[None]:
+    """Run every agent of the orchestrator on FakeLlm."""
+    agents = [
+        multi_agents.orchestrator_agent,
+        multi_agents.search_agent,
+        multi_agents.pedagogical_agent,
+        multi_agents.assessment_agent,
+        multi_agents.planning_agent,
+    ]
+    models = [agent.model for agent in agents]
+    for agent in agents:
+        agent.model = FakeLlm()
+    yield
+    for agent, model in zip(agents, models, strict=True):
+        agent.model = model
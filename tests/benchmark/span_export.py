@@ -0,0 +1,166 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Local throughput benchmark for CloudTraceLoggingSpanExporter.
+
+Uses fake Cloud Logging, Cloud Storage and Cloud Trace clients that simulate a
+fixed per-request latency, so the numbers reflect the exporter's own overhead
+plus the number of round trips it makes. Usage:
+
+    uv run python tests/benchmark/span_export.py --spans 512 --rpc-latency-ms 2
+"""
+
+import argparse
+import time
+from typing import Any
+from unittest.mock import patch
+
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.trace import SpanContext, SpanKind, TraceFlags
+
+
+class FakeLogBatch:
+    def __init__(self, logger: "FakeLogger") -> None:
+        self.logger = logger
+        self.entries: list[dict[str, Any]] = []
+
+    def log_struct(self, info: dict[str, Any], **kw: Any) -> None:
+        self.entries.append(info)
+
+    def commit(self, **kw: Any) -> None:
+        self.logger.write(len(self.entries))
+
+
+class FakeLogger:
+    def __init__(self, rpc_latency: float) -> None:
+        self.rpc_latency = rpc_latency
+        self.requests = 0
+        self.entries = 0
+
+    def write(self, entries: int) -> None:
+        time.sleep(self.rpc_latency)
+        self.requests += 1
+        self.entries += entries
+
+    def log_struct(self, info: dict[str, Any], **kw: Any) -> None:
+        self.write(1)
+
+    def batch(self) -> FakeLogBatch:
+        return FakeLogBatch(self)
+
+
+class FakeLoggingClient:
+    def __init__(self, rpc_latency: float) -> None:
+        self._logger = FakeLogger(rpc_latency)
+
+    def logger(self, name: str) -> FakeLogger:
+        return self._logger
+
+
+class FakeTraceClient:
+    def __init__(self, rpc_latency: float) -> None:
+        self.rpc_latency = rpc_latency
+
+    def batch_write_spans(self, **kw: Any) -> None:
+        time.sleep(self.rpc_latency)
+
+
+class FakeBlob:
+    def upload_from_string(self, *args: Any, **kw: Any) -> None:
+        pass
+
+
+class FakeBucket:
+    def exists(self) -> bool:
+        return True
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob()
+
+
+class FakeStorageClient:
+    def bucket(self, name: str) -> FakeBucket:
+        return FakeBucket()
+
+
+RESOURCE = Resource.create({"service.name": "mon-agent-scolaire"})
+
+
+def make_span(i: int, payload_bytes: int) -> ReadableSpan:
+    """Build a finished span shaped like an ADK `call_llm` span."""
+    context = SpanContext(
+        trace_id=0x5B8EFFF798038103D269B633813FC60C + i // 16,
+        span_id=0xEEE19B7EC3C1B174 + i,
+        is_remote=False,
+        trace_flags=TraceFlags(TraceFlags.SAMPLED),
+    )
+    return ReadableSpan(
+        name="call_llm",
+        context=context,
+        kind=SpanKind.INTERNAL,
+        resource=RESOURCE,
+        attributes={
+            "gen_ai.system": "gcp.vertex.agent",
+            "gen_ai.request.model": "gemini-2.0-flash",
+            "gcp.vertex.agent.invocation_id": f"e-{i // 16}",
+            "gcp.vertex.agent.llm_request": "x" * payload_bytes,
+            "gen_ai.usage.input_tokens": 1200,
+        },
+        start_time=1_700_000_000_000_000_000 + i * 1_000_000,
+        end_time=1_700_000_000_000_000_000 + i * 1_000_000 + 750_000,
+    )
+
+
+def run(spans: int, batch_size: int, payload_bytes: int, rpc_latency: float) -> None:
+    # Importing `app` builds the agents, which needs credentials: stub them out.
+    with (
+        patch("google.auth.default", return_value=(None, "benchmark-project")),
+        patch("vertexai.init"),
+        patch("langchain_google_vertexai.VertexAIEmbeddings"),
+    ):
+        from app.utils.tracing import CloudTraceLoggingSpanExporter
+
+    logging_client = FakeLoggingClient(rpc_latency)
+    exporter = CloudTraceLoggingSpanExporter(
+        project_id="benchmark-project",
+        client=FakeTraceClient(rpc_latency),
+        logging_client=logging_client,
+        storage_client=FakeStorageClient(),
+    )
+    all_spans = [make_span(i, payload_bytes) for i in range(spans)]
+
+    start = time.perf_counter()
+    for offset in range(0, spans, batch_size):
+        exporter.export(all_spans[offset : offset + batch_size])
+    elapsed = time.perf_counter() - start
+    exporter.shutdown()
+
+    fake_logger = logging_client.logger(__name__)
+    print(
+        f"spans={spans} batch_size={batch_size} payload={payload_bytes}B "
+        f"rpc_latency={rpc_latency * 1000:.1f}ms -> "
+        f"{spans / elapsed:,.0f} spans/sec, "
+        f"{fake_logger.requests} log write request(s)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--spans", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--payload-bytes", type=int, default=2048)
+    parser.add_argument("--rpc-latency-ms", type=float, default=2.0)
+    args = parser.parse_args()
+    run(args.spans, args.batch_size, args.payload_bytes, args.rpc_latency_ms / 1000)
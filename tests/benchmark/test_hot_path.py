@@ -0,0 +1,119 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Micro-benchmarks of the request hot path, against stubbed backends.
+
+Run with `make benchmark`: results are saved under .benchmarks/ and compared
+with the previous run.
+"""
+
+import asyncio
+from typing import Any
+
+import pytest
+from conftest import make_documents
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+from langchain_core.prompts import PromptTemplate
+from span_export import (
+    FakeLoggingClient,
+    FakeStorageClient,
+    FakeTraceClient,
+    make_span,
+)
+
+from app.agent import root_agent
+from app.multi_agents import retrieve_docs
+from app.templates import CONTEXT_TEMPLATE, format_docs
+from app.utils.tracing import CloudTraceLoggingSpanExporter
+from app.utils.typing import Feedback
+
+
+@pytest.mark.usefixtures("fake_search_backends")
+def test_retrieve_docs(benchmark: Any) -> None:
+    loop = asyncio.new_event_loop()
+    try:
+        result = benchmark(
+            lambda: loop.run_until_complete(
+                retrieve_docs("Que dit le cours sur la photosynthèse ?")
+            )
+        )
+    finally:
+        loop.close()
+    assert result.count("</Document") == 5
+
+
+@pytest.mark.benchmark(group="format_docs")
+@pytest.mark.parametrize("documents", [5, 10, 20, 50])
+def test_format_docs(benchmark: Any, documents: int) -> None:
+    docs = make_documents(documents)
+    result = benchmark(format_docs.format, docs=docs)
+    assert f"<Document {documents - 1}>" in result
+
+
+@pytest.mark.benchmark(group="format_docs")
+@pytest.mark.parametrize("documents", [5, 10, 20, 50])
+def test_format_docs_jinja_prompt_template(benchmark: Any, documents: int) -> None:
+    """Baseline: the LangChain jinja PromptTemplate format_docs used to be."""
+    template = PromptTemplate.from_template(CONTEXT_TEMPLATE, template_format="jinja2")
+    docs = make_documents(documents)
+    result = benchmark(template.format, docs=docs)
+    assert result == format_docs.format(docs=docs)
+
+
+def test_feedback_validation(benchmark: Any) -> None:
+    payload = {
+        "score": 4,
+        "text": "Très clair, merci !",
+        "invocation_id": "e-5b8efff7-9803-8103-d269-b633813fc60c",
+        "user_id": "student-42",
+    }
+    feedback = benchmark(Feedback.model_validate, payload)
+    assert feedback.log_type == "feedback"
+
+
+@pytest.mark.parametrize("payload_bytes", [2_048, 65_536])
+def test_span_export(benchmark: Any, payload_bytes: int) -> None:
+    exporter = CloudTraceLoggingSpanExporter(
+        project_id="benchmark-project",
+        client=FakeTraceClient(rpc_latency=0),
+        logging_client=FakeLoggingClient(rpc_latency=0),
+        storage_client=FakeStorageClient(),
+    )
+    spans = [make_span(i, payload_bytes) for i in range(64)]
+    benchmark(exporter.export, spans)
+    exporter.shutdown()
+
+
+@pytest.mark.usefixtures("fake_model")
+def test_orchestrator_turn(benchmark: Any) -> None:
+    session_service = InMemorySessionService()
+    runner = Runner(
+        agent=root_agent, session_service=session_service, app_name="benchmark"
+    )
+    message = types.Content(
+        role="user",
+        parts=[types.Part.from_text(text="Que dit le cours sur la photosynthèse ?")],
+    )
+
+    def run_turn() -> list[Any]:
+        session = session_service.create_session_sync(
+            app_name="benchmark", user_id="student"
+        )
+        return list(
+            runner.run(new_message=message, user_id="student", session_id=session.id)
+        )
+
+    events = benchmark(run_turn)
+    assert events[-1].content.parts[0].text
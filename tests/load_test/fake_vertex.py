@@ -0,0 +1,394 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Local stand-in for the Vertex AI endpoints called by the agent.
+
+Serves, over REST, the Gemini generateContent and streamGenerateContent
+methods, the text embeddings predict method, Vertex AI Search search and the
+ranking API rank, with configurable latency distributions, error rates and 429
+injection. Answers are synthetic: the model calls a declared tool for substantial
+user messages (picking the specialized agent from keywords) and answers in text
+otherwise or once a tool has responded, so the delegation and retrieval paths
+of the agent are exercised. Usage:
+
+    uv run python tests/load_test/fake_vertex.py --port 8090 \\
+        --latency llm=800:0.5 --latency search=150 --rate-limit-rate llm=0.02
+
+Serve the agent against it with local_engine.py --backend-url http://127.0.0.1:8090.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+from collections import Counter
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from typing import Any
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+ENDPOINTS = ("llm", "embed", "search", "rank")
+EMBEDDING_INSTANCE_SCHEMA = (
+    "gs://google-cloud-aiplatform/schema/predict/instance/text_embedding_1.0.0.yaml"
+)
+WORDS = (
+    "le la les un une des et est sont pour dans avec sur par cours leçon exemple "
+    "fraction équation théorème chapitre exercice réponse question méthode élève "
+    "nombre calcul histoire révolution cellule énergie planète verbe phrase"
+).split()
+# Keywords routing a user message to a specialized agent, by tool name fragment
+TOOL_KEYWORDS = {
+    "assessment": ("quiz", "qcm", "exercice", "entraîner", "vrai/faux", "vérifie"),
+    "planning": ("planning", "organis", "réviser", "débordé", "temps"),
+    "pedagogical": ("explique", "comprend", "pourquoi", "comment", "c'est quoi"),
+}
+
+
+@dataclass
+class EndpointProfile:
+    """Latency distribution and failure injection of an endpoint."""
+
+    median_ms: float
+    sigma: float = 0.5
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+
+    def latency(self) -> float:
+        """Draw a log-normal latency, in seconds."""
+        if self.median_ms <= 0:
+            return 0.0
+        return random.lognormvariate(math.log(self.median_ms / 1000), self.sigma)
+
+
+class FakeVertex:
+    """Request handlers of the fake backend, with their injected behavior."""
+
+    def __init__(
+        self,
+        profiles: dict[str, EndpointProfile],
+        tokens_per_second: float = 60,
+        answer_tokens: int = 120,
+    ) -> None:
+        self.profiles = profiles
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.stats: Counter[str] = Counter()
+
+    def injected_failure(self, endpoint: str) -> Response | None:
+        """Return an error response if one is injected for this request."""
+        profile = self.profiles[endpoint]
+        self.stats[f"{endpoint}.requests"] += 1
+        draw = random.random()
+        if draw < profile.rate_limit_rate:
+            self.stats[f"{endpoint}.429"] += 1
+            return error_response(429, "RESOURCE_EXHAUSTED", "Quota exceeded (fake)")
+        if draw < profile.rate_limit_rate + profile.error_rate:
+            self.stats[f"{endpoint}.errors"] += 1
+            return error_response(500, "INTERNAL", "Internal error (fake)")
+        return None
+
+    async def generate_content(self, body: dict[str, Any], stream: bool) -> Response:
+        if failure := self.injected_failure("llm"):
+            return failure
+        prompt_tokens = len(json.dumps(body.get("contents", []))) // 4
+        part = self.next_part(body)
+        await asyncio.sleep(self.profiles["llm"].latency())
+        if "functionCall" in part or not stream:
+            if "text" in part:
+                await asyncio.sleep(len(part["text"].split()) / self.tokens_per_second)
+            response = model_response(part, prompt_tokens, count_tokens(part))
+            if not stream:
+                return JSONResponse(response)
+            return StreamingResponse(sse([response]), media_type="text/event-stream")
+        return StreamingResponse(
+            self.stream_text(part["text"], prompt_tokens),
+            media_type="text/event-stream",
+        )
+
+    async def stream_text(self, text: str, prompt_tokens: int) -> AsyncIterator[str]:
+        words = text.split(" ")
+        chunk_size = 8
+        for start in range(0, len(words), chunk_size):
+            if start:
+                await asyncio.sleep(chunk_size / self.tokens_per_second)
+            chunk = " ".join(words[start : start + chunk_size])
+            last = start + chunk_size >= len(words)
+            response = model_response(
+                {"text": chunk if not start else " " + chunk},
+                prompt_tokens,
+                len(words) if last else None,
+            )
+            if not last:
+                del response["candidates"][0]["finishReason"]
+            yield f"data: {json.dumps(response)}\r\n\r\n"
+
+    def next_part(self, body: dict[str, Any]) -> dict[str, Any]:
+        """Pick the model turn: a tool call for a new request, text otherwise."""
+        contents = body.get("contents") or [{}]
+        parts = contents[-1].get("parts") or []
+        text = " ".join(part.get("text", "") for part in parts).strip()
+        answered = any("functionResponse" in part for part in parts)
+        declarations = [
+            declaration
+            for tool in body.get("tools") or []
+            for declaration in tool.get("functionDeclarations") or []
+        ]
+        if declarations and not answered and len(text.split()) >= 4:
+            declaration = pick_tool(declarations, text)
+            properties = (declaration.get("parameters") or {}).get("properties") or {}
+            required = (declaration.get("parameters") or {}).get("required") or []
+            argument = next(iter(required or properties), "request")
+            return {
+                "functionCall": {"name": declaration["name"], "args": {argument: text}}
+            }
+        length = max(5, int(random.lognormvariate(math.log(self.answer_tokens), 0.5)))
+        return {"text": " ".join(random.choices(WORDS, k=length))}
+
+    async def predict(self, body: dict[str, Any]) -> Response:
+        if failure := self.injected_failure("embed"):
+            return failure
+        await asyncio.sleep(self.profiles["embed"].latency())
+        parameters = body.get("parameters") or {}
+        dimension = int(parameters.get("outputDimensionality") or 768)
+        predictions = [
+            {
+                "embeddings": {
+                    "values": embed(str(instance.get("content", "")), dimension),
+                    "statistics": {
+                        "token_count": len(str(instance.get("content", "")).split()),
+                        "truncated": False,
+                    },
+                }
+            }
+            for instance in body.get("instances") or []
+        ]
+        return JSONResponse({"predictions": predictions})
+
+    async def search(self, body: dict[str, Any], path: str) -> Response:
+        if failure := self.injected_failure("search"):
+            return failure
+        await asyncio.sleep(self.profiles["search"].latency())
+        data_store = path.split("/servingConfigs/")[0]
+        seed = int(hashlib.sha1(body.get("query", "").encode()).hexdigest()[:8], 16)
+        rng = random.Random(seed)
+        results = []
+        for _ in range(int(body.get("pageSize") or 10)):
+            question_id = rng.randrange(1_000_000)
+            chunk_id = f"{question_id}__{rng.randrange(4)}"
+            results.append(
+                {
+                    "id": chunk_id,
+                    "document": {
+                        "name": f"{data_store}/branches/0/documents/{chunk_id}",
+                        "id": chunk_id,
+                        "structData": {
+                            "id": chunk_id,
+                            "question_id": question_id,
+                            "content": " ".join(rng.choices(WORDS, k=120)),
+                            "question_text": " ".join(rng.choices(WORDS, k=12)),
+                        },
+                    },
+                }
+            )
+        return JSONResponse(
+            {"results": results, "totalSize": 1000, "attributionToken": "fake"}
+        )
+
+    async def rank(self, body: dict[str, Any]) -> Response:
+        if failure := self.injected_failure("rank"):
+            return failure
+        await asyncio.sleep(self.profiles["rank"].latency())
+        records = [
+            {**record, "score": round(random.random(), 4)}
+            for record in body.get("records") or []
+        ]
+        records.sort(key=lambda record: record["score"], reverse=True)
+        top_n = int(body.get("topN") or len(records))
+        return JSONResponse({"records": records[:top_n]})
+
+
+def pick_tool(declarations: list[dict[str, Any]], text: str) -> dict[str, Any]:
+    """Route the message to the tool whose keywords it contains, search by default."""
+    lowered = text.lower()
+    for fragment, keywords in TOOL_KEYWORDS.items():
+        if any(keyword in lowered for keyword in keywords):
+            for declaration in declarations:
+                if fragment in declaration["name"]:
+                    return declaration
+    for declaration in declarations:
+        if "search" in declaration["name"] or "retrieve" in declaration["name"]:
+            return declaration
+    return declarations[0]
+
+
+def embed(text: str, dimension: int) -> list[float]:
+    """Deterministic unit vector derived from the text."""
+    rng = random.Random(hashlib.sha1(text.encode()).digest())
+    values = [rng.gauss(0, 1) for _ in range(dimension)]
+    norm = math.sqrt(sum(value * value for value in values)) or 1.0
+    return [round(value / norm, 6) for value in values]
+
+
+def count_tokens(part: dict[str, Any]) -> int:
+    return len(json.dumps(part).split())
+
+
+def model_response(
+    part: dict[str, Any], prompt_tokens: int, candidates_tokens: int | None
+) -> dict[str, Any]:
+    response: dict[str, Any] = {
+        "candidates": [
+            {"content": {"role": "model", "parts": [part]}, "finishReason": "STOP"}
+        ],
+        "modelVersion": "fake",
+    }
+    if candidates_tokens is not None:
+        response["usageMetadata"] = {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": candidates_tokens,
+            "totalTokenCount": prompt_tokens + candidates_tokens,
+        }
+    return response
+
+
+async def sse(responses: list[dict[str, Any]]) -> AsyncIterator[str]:
+    for response in responses:
+        yield f"data: {json.dumps(response)}\r\n\r\n"
+
+
+def error_response(code: int, status: str, message: str) -> Response:
+    return JSONResponse(
+        {"error": {"code": code, "message": message, "status": status}},
+        status_code=code,
+    )
+
+
+def create_app(backend: FakeVertex) -> FastAPI:
+    """Route the REST methods of the fake endpoints to `backend`."""
+    app = FastAPI()
+
+    @app.get("/stats")
+    async def stats() -> dict[str, int]:
+        return dict(backend.stats)
+
+    @app.get("/{path:path}")
+    async def publisher_model(path: str) -> Response:
+        # Model Garden metadata, fetched once when the embedding model is loaded
+        if "/publishers/" not in path:
+            return error_response(404, "NOT_FOUND", f"Resource {path} not faked")
+        name = path.split("/", 1)[1]
+        return JSONResponse(
+            {
+                "name": name,
+                "versionId": "001",
+                "openSourceCategory": "PROPRIETARY",
+                "launchStage": "GA",
+                "publisherModelTemplate": (
+                    "projects/{user-project}/locations/{location}/" + name
+                ),
+                "predictSchemata": {"instanceSchemaUri": EMBEDDING_INSTANCE_SCHEMA},
+            }
+        )
+
+    @app.post("/{path:path}")
+    async def dispatch(path: str, request: Request) -> Response:
+        body = await request.json()
+        method = path.rsplit(":", 1)[-1]
+        if method == "generateContent":
+            return await backend.generate_content(body, stream=False)
+        if method == "streamGenerateContent":
+            return await backend.generate_content(body, stream=True)
+        if method == "predict":
+            return await backend.predict(body)
+        if method == "search":
+            return await backend.search(body, path)
+        if method == "rank":
+            return await backend.rank(body)
+        return error_response(404, "NOT_FOUND", f"Method {method} not faked")
+
+    return app
+
+
+def parse_profiles(
+    latencies: list[str], error_rates: list[str], rate_limit_rates: list[str]
+) -> dict[str, EndpointProfile]:
+    """Build endpoint profiles from "endpoint=value" options ("all" for every one)."""
+    profiles = {
+        "llm": EndpointProfile(median_ms=600),
+        "embed": EndpointProfile(median_ms=40, sigma=0.3),
+        "search": EndpointProfile(median_ms=120, sigma=0.4),
+        "rank": EndpointProfile(median_ms=60, sigma=0.3),
+    }
+
+    def targets(spec: str) -> tuple[list[str], str]:
+        endpoint, value = spec.split("=", 1)
+        if endpoint != "all" and endpoint not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint {endpoint!r}, expected {ENDPOINTS}")
+        return (list(ENDPOINTS) if endpoint == "all" else [endpoint]), value
+
+    for spec in latencies:
+        endpoints, value = targets(spec)
+        median, _, sigma = value.partition(":")
+        for endpoint in endpoints:
+            profiles[endpoint].median_ms = float(median)
+            if sigma:
+                profiles[endpoint].sigma = float(sigma)
+    for spec in error_rates:
+        endpoints, value = targets(spec)
+        for endpoint in endpoints:
+            profiles[endpoint].error_rate = float(value)
+    for spec in rate_limit_rates:
+        endpoints, value = targets(spec)
+        for endpoint in endpoints:
+            profiles[endpoint].rate_limit_rate = float(value)
+    return profiles
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument(
+        "--latency",
+        action="append",
+        default=[],
+        metavar="ENDPOINT=MEDIAN_MS[:SIGMA]",
+        help="Log-normal latency of llm (to first token), embed, search, rank or all",
+    )
+    parser.add_argument(
+        "--error-rate", action="append", default=[], metavar="ENDPOINT=RATE"
+    )
+    parser.add_argument(
+        "--rate-limit-rate", action="append", default=[], metavar="ENDPOINT=RATE"
+    )
+    parser.add_argument("--tokens-per-second", type=float, default=60)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    args = parser.parse_args()
+
+    profiles = parse_profiles(args.latency, args.error_rate, args.rate_limit_rate)
+    logging.basicConfig(level=logging.INFO)
+    logging.info(f"Endpoint profiles: {profiles}")
+    backend = FakeVertex(profiles, args.tokens_per_second, args.answer_tokens)
+    uvicorn.run(
+        create_app(backend), host=args.host, port=args.port, log_level="warning"
+    )
+
+
+if __name__ == "__main__":
+    main()
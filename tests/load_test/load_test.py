@@ -14,10 +14,16 @@
 
 import json
 import logging
+import math
 import os
+import random
 import time
+import uuid
+from pathlib import Path
+from typing import Any
 
-from locust import HttpUser, between, task
+from locust import HttpUser, events, task
+from locust.env import Environment
 
 # Configure logging
 logging.basicConfig(
@@ -25,9 +31,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize Vertex AI and load agent config
-with open("deployment_metadata.json") as f:
-    remote_agent_engine_id = json.load(f)["remote_agent_engine_id"]
+# Initialize Vertex AI and load agent config. LOAD_TEST_AGENT_ENGINE_ID skips the
+# deployment metadata, e.g. to target local_engine.py with --host.
+remote_agent_engine_id = os.environ.get("LOAD_TEST_AGENT_ENGINE_ID")
+if not remote_agent_engine_id:
+    with open("deployment_metadata.json") as f:
+        remote_agent_engine_id = json.load(f)["remote_agent_engine_id"]
 
 parts = remote_agent_engine_id.split("/")
 project_id = parts[1]
@@ -36,47 +45,189 @@ engine_id = parts[5]
 
 # Convert remote agent engine ID to streaming URL.
 base_url = f"https://{location}-aiplatform.googleapis.com"
-url_path = f"/v1/projects/{project_id}/locations/{location}/reasoningEngines/{engine_id}:streamQuery"
+engine_path = (
+    f"/v1/projects/{project_id}/locations/{location}/reasoningEngines/{engine_id}"
+)
+url_path = f"{engine_path}:streamQuery"
 
 logger.info("Using remote agent engine ID: %s", remote_agent_engine_id)
 logger.info("Using base URL: %s", base_url)
 logger.info("Using URL path: %s", url_path)
 
+# Workload mix: share of new sessions opened with a query of each intent. Override
+# with e.g. LOAD_TEST_MIX="search=50,quiz=50".
+DEFAULT_MIX = {
+    "search": 35,
+    "explanation": 30,
+    "quiz": 15,
+    "planning": 10,
+    "greeting": 10,
+}
+QUERIES_FILE = Path(
+    os.environ.get("LOAD_TEST_QUERIES", Path(__file__).with_name("queries.jsonl"))
+)
+# Think time between two turns of a session, and gap between two sessions of a
+# user, are log-normal: mostly short, with a long tail of slow readers.
+THINK_TIME_MEDIAN_S = float(os.environ.get("LOAD_TEST_THINK_TIME_MEDIAN_S", "8"))
+SESSION_GAP_MEDIAN_S = float(os.environ.get("LOAD_TEST_SESSION_GAP_MEDIAN_S", "30"))
+
+# Streaming metrics, reported per intent as "<metric> [<intent>]". Tokens are
+# reported in the response time columns, as counts rather than milliseconds.
+METRICS = {
+    "end": "/streamQuery end",
+    "ttft": "/streamQuery time to first token",
+    "tool": "/streamQuery time to first tool call",
+    "gap": "/streamQuery inter-event gap",
+    "tokens": "/streamQuery tokens streamed",
+}
+# p95 gate: the run fails when the p95 of a metric exceeds its threshold, e.g.
+# LOAD_TEST_P95_THRESHOLDS="ttft=3000,gap=2000,end=20000" (milliseconds).
+DEFAULT_P95_THRESHOLDS = "ttft=5000,end=30000"
+
+
+def load_queries(path: Path) -> dict[str, list[dict[str, Any]]]:
+    """Load the query corpus, grouped by intent."""
+    queries: dict[str, list[dict[str, Any]]] = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                query = json.loads(line)
+                queries.setdefault(query["intent"], []).append(query)
+    return queries
+
+
+def parse_pairs(spec: str) -> dict[str, float]:
+    """Parse "name=value,name=value" pairs, as in LOAD_TEST_MIX."""
+    pairs = {}
+    for item in filter(None, spec.split(",")):
+        name, value = item.split("=")
+        pairs[name.strip()] = float(value)
+    return pairs
+
+
+def parse_event(line: str) -> dict[str, Any] | None:
+    """Parse a streamed event, with or without its SSE "data:" prefix."""
+    try:
+        event = json.loads(line.removeprefix("data:").strip())
+    except json.JSONDecodeError:
+        return None
+    return event if isinstance(event, dict) else None
+
+
+def lognormal(median: float, sigma: float, maximum: float) -> float:
+    """Draw a log-normal duration with the given median, capped at `maximum`."""
+    return min(random.lognormvariate(math.log(median), sigma), maximum)
+
+
+QUERIES = load_queries(QUERIES_FILE)
+MIX = (
+    parse_pairs(os.environ["LOAD_TEST_MIX"])
+    if "LOAD_TEST_MIX" in os.environ
+    else DEFAULT_MIX
+)
+for intent in set(MIX) - set(QUERIES):
+    logger.warning("No query for intent %r in %s, ignoring it", intent, QUERIES_FILE)
+MIX = {intent: weight for intent, weight in MIX.items() if intent in QUERIES}
+logger.info("Using workload mix: %s", MIX)
+P95_THRESHOLDS = parse_pairs(
+    os.environ.get("LOAD_TEST_P95_THRESHOLDS", DEFAULT_P95_THRESHOLDS)
+)
+if set(P95_THRESHOLDS) - set(METRICS):
+    raise ValueError(
+        f"Unknown metrics in LOAD_TEST_P95_THRESHOLDS, expected some of {list(METRICS)}"
+    )
+
 
 class ChatStreamUser(HttpUser):
-    """Simulates a user interacting with the chat stream API."""
+    """Simulates a student holding multi-turn sessions with the chat stream API.
+
+    Each user has its own user_id. A session opens with a query drawn from the
+    corpus according to the workload mix, followed by some of its follow-ups.
+    """
 
-    wait_time = between(1, 3)  # Wait 1-3 seconds between tasks
     host = base_url  # Set the base host URL for Locust
 
+    def on_start(self) -> None:
+        self.user_id = f"student-{uuid.uuid4().hex[:12]}"
+        self.session_id: str | None = None
+        self.intent = ""
+        self.follow_ups: list[str] = []
+
+    def wait_time(self) -> float:
+        if self.follow_ups:
+            return lognormal(THINK_TIME_MEDIAN_S, 0.6, maximum=120)
+        return lognormal(SESSION_GAP_MEDIAN_S, 1.0, maximum=600)
+
     @task
     def chat_stream(self) -> None:
-        """Simulates a chat stream interaction."""
-        headers = {"Content-Type": "application/json"}
-        headers["Authorization"] = f"Bearer {os.environ['_AUTH_TOKEN']}"
+        """Sends the next turn of the current session, or opens a new one."""
+        if self.follow_ups:
+            message = self.follow_ups.pop(0)
+        else:
+            self.intent = random.choices(list(MIX), weights=list(MIX.values()))[0]
+            query = random.choice(QUERIES[self.intent])
+            message = query["query"]
+            follow_ups = query.get("follow_ups", [])
+            self.follow_ups = follow_ups[: random.randint(0, len(follow_ups))]
+            self.session_id = self.create_session()
+            if self.session_id is None:
+                self.follow_ups = []
+                return
+        self.stream_query(message)
 
+    def headers(self) -> dict[str, str]:
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {os.environ['_AUTH_TOKEN']}",
+        }
+
+    def create_session(self) -> str | None:
+        """Creates a session for this user and returns its ID."""
+        data = {
+            "class_method": "async_create_session",
+            "input": {"user_id": self.user_id},
+        }
+        with self.client.post(
+            f"{engine_path}:query",
+            headers=self.headers(),
+            json=data,
+            catch_response=True,
+            name="/query async_create_session",
+        ) as response:
+            if response.status_code != 200:
+                response.failure(f"Unexpected status code: {response.status_code}")
+                return None
+            return response.json()["output"]["id"]
+
+    def stream_query(self, message: str) -> None:
+        """Streams one turn of the current session."""
         data = {
             "class_method": "async_stream_query",
             "input": {
-                "user_id": "test",
-                "message": "What's the weather in San Francisco?",
+                "user_id": self.user_id,
+                "session_id": self.session_id,
+                "message": message,
             },
         }
 
-        start_time = time.time()
+        start_time = time.perf_counter()
         with self.client.post(
             url_path,
-            headers=headers,
+            headers=self.headers(),
             json=data,
             catch_response=True,
-            name="/streamQuery async_stream_query",
+            name=f"/streamQuery async_stream_query [{self.intent}]",
             stream=True,
             params={"alt": "sse"},
         ) as response:
             if response.status_code == 200:
                 events = []
-                for line in response.iter_lines():
+                first_token_time = first_tool_time = last_event_time = None
+                tokens = 0
+                # Read events as they arrive rather than in fixed-size blocks
+                for line in response.iter_lines(chunk_size=None):
                     if line:
+                        event_time = time.perf_counter()
                         line_str = line.decode("utf-8")
                         events.append(line_str)
 
@@ -89,15 +240,76 @@ class ChatStreamUser(HttpUser):
                                 response=response,
                                 context={},
                             )
-                end_time = time.time()
+
+                        if last_event_time is not None:
+                            self.fire_metric("gap", event_time - last_event_time)
+                        last_event_time = event_time
+                        event = parse_event(line_str)
+                        if event is None:
+                            continue
+                        content_parts = (event.get("content") or {}).get("parts") or []
+                        if first_token_time is None and any(
+                            part.get("text") and not part.get("thought")
+                            for part in content_parts
+                        ):
+                            first_token_time = event_time
+                            self.fire_metric("ttft", event_time - start_time)
+                        if first_tool_time is None and any(
+                            part.get("function_call") for part in content_parts
+                        ):
+                            first_tool_time = event_time
+                            self.fire_metric("tool", event_time - start_time)
+                        usage = event.get("usage_metadata") or {}
+                        tokens += usage.get("candidates_token_count") or 0
+                end_time = time.perf_counter()
                 total_time = end_time - start_time
                 self.environment.events.request.fire(
                     request_type="POST",
-                    name="/streamQuery end",
+                    name=f"{METRICS['end']} [{self.intent}]",
                     response_time=total_time * 1000,  # Convert to milliseconds
                     response_length=len(events),
                     response=response,
                     context={},
                 )
+                self.environment.events.request.fire(
+                    request_type="POST",
+                    name=f"{METRICS['tokens']} [{self.intent}]",
+                    response_time=tokens,
+                    response_length=tokens,
+                    response=response,
+                    context={},
+                )
             else:
                 response.failure(f"Unexpected status code: {response.status_code}")
+
+    def fire_metric(self, metric: str, seconds: float) -> None:
+        """Reports a streaming latency of the current turn."""
+        self.environment.events.request.fire(
+            request_type="POST",
+            name=f"{METRICS[metric]} [{self.intent}]",
+            response_time=seconds * 1000,
+            response_length=0,
+            response=None,
+            context={},
+        )
+
+
+@events.quitting.add_listener
+def check_p95_thresholds(environment: Environment, **kwargs: Any) -> None:
+    """Fails the run when the p95 of a metric, for any intent, exceeds its threshold."""
+    failures = []
+    for metric, threshold in P95_THRESHOLDS.items():
+        for entry in environment.stats.entries.values():
+            if (
+                not entry.name.startswith(f"{METRICS[metric]} [")
+                or not entry.num_requests
+            ):
+                continue
+            p95 = entry.get_response_time_percentile(0.95)
+            if p95 > threshold:
+                failures.append(f"{entry.name}: p95 {p95:.0f} > {threshold:.0f}")
+    if failures:
+        logger.error("p95 thresholds exceeded:\n%s", "\n".join(failures))
+        environment.process_exit_code = 1
+    else:
+        logger.info("p95 thresholds met: %s", P95_THRESHOLDS)
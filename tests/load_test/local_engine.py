@@ -0,0 +1,227 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Serve AgentEngineApp locally behind the Agent Engine REST API.
+
+Exposes the `:query` and `:streamQuery` methods of a reasoning engine so that
+tests/load_test/load_test.py can drive the app in-process on one machine, with
+the Vertex AI endpoints served by fake_vertex.py. Run from the repository root:
+
+    uv run python tests/load_test/local_engine.py --port 8080 \\
+        --backend-url http://127.0.0.1:8090
+
+The app modules are left untouched: this script swaps their Google Cloud clients
+for clients of the fake backend. Gemini is called with an API key (express mode),
+the other services over REST with anonymous credentials, and the spans are not
+exported to Cloud Trace. No Google Cloud credentials are needed.
+"""
+
+import argparse
+import inspect
+import json
+import sys
+from collections.abc import AsyncIterator, Iterator, Sequence
+from functools import cached_property
+from pathlib import Path
+from typing import Any
+
+import google.auth
+import uvicorn
+import vertexai
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from google.adk.agents import BaseAgent
+from google.adk.models import Gemini
+from google.api_core.client_options import ClientOptions
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import discoveryengine_v1alpha, discoveryengine_v1beta
+from google.genai import Client, types
+from langchain_google_community import VertexAISearchRetriever
+from langchain_google_community.vertex_rank import VertexAIRank
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+LOCAL_PROJECT = "local-project"
+
+
+class RestVertexAISearchRetriever(VertexAISearchRetriever):
+    """Vertex AI Search retriever calling the REST API of `api_endpoint`."""
+
+    api_endpoint: str
+
+    def _initialize_client(self) -> None:
+        self._client = discoveryengine_v1beta.SearchServiceClient(
+            credentials=self.credentials,
+            client_options=ClientOptions(api_endpoint=self.api_endpoint),
+            transport="rest",
+        )
+        self._serving_config = self._client.serving_config_path(
+            project=self.project_id,
+            location=self.location_id,
+            data_store=self.data_store_id,
+            serving_config=self.serving_config_id,
+        )
+
+
+class FakeBackendGemini(Gemini):
+    """Gemini called in express mode, with a fake API key, at `base_url`."""
+
+    @cached_property
+    def api_client(self) -> Client:
+        return Client(
+            vertexai=True,
+            api_key="fake",
+            http_options=types.HttpOptions(base_url=self.base_url),
+        )
+
+
+class DiscardingSpanExporter(SpanExporter):
+    """Stands in for the Cloud Trace exporter: the spans are dropped."""
+
+    def __init__(self, **kwargs: Any) -> None:
+        pass
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        return SpanExportResult.SUCCESS
+
+
+def walk_agents(agent: BaseAgent) -> Iterator[BaseAgent]:
+    """Yield `agent` and the agents it calls, as sub-agents or as tools."""
+    yield agent
+    for tool in getattr(agent, "tools", []):
+        if isinstance(getattr(tool, "agent", None), BaseAgent):
+            yield from walk_agents(tool.agent)
+    for sub_agent in agent.sub_agents:
+        yield from walk_agents(sub_agent)
+
+
+def use_fake_backend(backend_url: str) -> None:
+    """Point the models and the retrieval clients of the app at `backend_url`.
+
+    The embeddings are already served by the backend, through the Vertex AI SDK
+    configuration set up in `main` before the app is imported.
+    """
+    import app.agent_engine_app
+    from app import multi_agents
+    from app.agent import root_agent
+
+    credentials = AnonymousCredentials()
+    project_id = multi_agents.project_id
+    retriever = multi_agents.retriever
+    multi_agents.retriever = RestVertexAISearchRetriever(
+        project_id=project_id,
+        data_store_id=retriever.data_store_id,
+        location_id=retriever.location_id,
+        engine_data_type=retriever.engine_data_type,
+        custom_embedding_ratio=retriever.custom_embedding_ratio,
+        custom_embedding=retriever.custom_embedding,
+        custom_embedding_field_path=retriever.custom_embedding_field_path,
+        max_documents=retriever.max_documents,
+        beta=True,
+        credentials=credentials,
+        api_endpoint=backend_url,
+    )
+    compressor = multi_agents.compressor
+    multi_agents.compressor = VertexAIRank(
+        project_id=project_id,
+        location_id=compressor.location_id,
+        ranking_config=compressor.ranking_config,
+        title_field=compressor.title_field,
+        top_n=compressor.top_n,
+        credentials=credentials,
+        client=discoveryengine_v1alpha.RankServiceClient(
+            credentials=credentials,
+            client_options=ClientOptions(api_endpoint=backend_url),
+            transport="rest",
+        ),
+    )
+    for agent in walk_agents(root_agent):
+        if isinstance(agent.model, str):
+            agent.model = FakeBackendGemini(model=agent.model, base_url=backend_url)
+    app.agent_engine_app.CloudTraceLoggingSpanExporter = DiscardingSpanExporter
+
+
+def to_json(value: Any) -> Any:
+    """Convert the pydantic objects returned by the app to JSON-ready values."""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    return value
+
+
+def create_app(agent_engine: Any) -> FastAPI:
+    """Route the reasoning engine REST methods to `agent_engine`."""
+    app = FastAPI(on_startup=[agent_engine.set_up])
+
+    @app.post("/{path:path}")
+    async def dispatch(path: str, request: Request) -> Response:
+        body = await request.json()
+        method = getattr(agent_engine, body["class_method"], None)
+        if method is None:
+            return JSONResponse(
+                {"error": f"Unknown class_method {body['class_method']}"},
+                status_code=400,
+            )
+        kwargs = body.get("input") or {}
+        if path.endswith(":streamQuery"):
+
+            async def events() -> AsyncIterator[str]:
+                async for event in method(**kwargs):
+                    yield json.dumps(to_json(event)) + "\n"
+
+            return StreamingResponse(events(), media_type="application/json")
+        output = method(**kwargs)
+        if inspect.isawaitable(output):
+            output = await output
+        return JSONResponse({"output": to_json(output)})
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--backend-url",
+        default="http://127.0.0.1:8090",
+        help="URL of the fake Vertex AI backend (fake_vertex.py)",
+    )
+    args = parser.parse_args()
+
+    # The app modules look up the default credentials and load the embedding
+    # model when they are imported
+    google.auth.default = lambda *args, **kwargs: (
+        AnonymousCredentials(),
+        LOCAL_PROJECT,
+    )
+    vertexai.init(
+        project=LOCAL_PROJECT,
+        credentials=AnonymousCredentials(),
+        api_endpoint=args.backend_url,
+        api_transport="rest",
+    )
+    use_fake_backend(args.backend_url)
+
+    from app.agent import root_agent
+    from app.agent_engine_app import AgentEngineApp
+
+    agent_engine = AgentEngineApp(agent=root_agent)
+    uvicorn.run(
+        create_app(agent_engine), host=args.host, port=args.port, log_level="warning"
+    )
+
+
+if __name__ == "__main__":
+    main()
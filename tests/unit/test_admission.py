@@ -0,0 +1,112 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+
+import pytest
+
+from app.utils.admission import AdmissionController, AdmissionRejected, TokenBucket
+
+
+def test_token_bucket_refills_over_time() -> None:
+    bucket = TokenBucket(rate=1.0, capacity=2.0, now=0.0)
+    assert bucket.try_acquire(0.0) == 0.0
+    assert bucket.try_acquire(0.0) == 0.0
+    assert bucket.try_acquire(0.0) == pytest.approx(1.0)
+    assert bucket.try_acquire(1.0) == 0.0
+
+
+def test_rate_limit_is_per_user() -> None:
+    now = [0.0]
+    controller = AdmissionController(
+        user_rate=1.0, user_burst=1.0, clock=lambda: now[0]
+    )
+    controller.check_rate("alice")
+    with pytest.raises(AdmissionRejected) as exc_info:
+        controller.check_rate("alice")
+    assert exc_info.value.reason == "rate_limited"
+    controller.check_rate("bob")
+    now[0] = 1.0
+    controller.check_rate("alice")
+
+
+@pytest.mark.asyncio
+async def test_queue_full_is_shed_immediately() -> None:
+    controller = AdmissionController(max_in_flight=1, max_queue=1, user_rate=0)
+    await controller.acquire_slot()
+    waiter = asyncio.create_task(controller.acquire_slot())
+    await asyncio.sleep(0)
+    assert controller.queued == 1
+
+    with pytest.raises(AdmissionRejected) as exc_info:
+        await controller.acquire_slot()
+    assert exc_info.value.reason == "queue_full"
+
+    controller.release_slot()
+    await waiter
+    assert controller.in_flight == 1
+    controller.release_slot()
+    assert controller.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout_frees_the_queue() -> None:
+    controller = AdmissionController(
+        max_in_flight=1, max_queue=4, queue_timeout=0.01, user_rate=0
+    )
+    await controller.acquire_slot()
+    with pytest.raises(AdmissionRejected) as exc_info:
+        await controller.acquire_slot()
+    assert exc_info.value.reason == "queue_timeout"
+    assert controller.queued == 0
+    controller.release_slot()
+    assert controller.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_sync_waiter_is_granted_by_an_async_release() -> None:
+    controller = AdmissionController(max_in_flight=1, max_queue=4, user_rate=0)
+    await controller.acquire_slot()
+    granted = threading.Event()
+
+    def wait_for_slot() -> None:
+        controller.acquire_slot_blocking()
+        granted.set()
+
+    thread = threading.Thread(target=wait_for_slot)
+    thread.start()
+    while not controller.queued:
+        await asyncio.sleep(0.01)
+    assert not granted.is_set()
+
+    controller.release_slot()
+    thread.join(timeout=5)
+    assert granted.is_set()
+    assert controller.in_flight == 1
+    controller.release_slot()
+    assert controller.in_flight == 0
+
+
+def test_sync_queue_timeout_frees_the_queue() -> None:
+    controller = AdmissionController(
+        max_in_flight=1, max_queue=4, queue_timeout=0.01, user_rate=0
+    )
+    controller.acquire_slot_blocking()
+    with pytest.raises(AdmissionRejected) as exc_info:
+        controller.acquire_slot_blocking()
+    assert exc_info.value.reason == "queue_timeout"
+    assert controller.queued == 0
+    controller.release_slot()
+    assert controller.in_flight == 0
@@ -0,0 +1,188 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+from collections.abc import Hashable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from app.utils.coalescing import (
+    Broadcast,
+    SingleFlight,
+    StreamFlight,
+    normalize_query,
+)
+
+
+def test_normalize_query() -> None:
+    assert normalize_query("  Qu'est-ce que la\tPhotosynthèse ?\n") == (
+        "qu'est-ce que la photosynthèse ?"
+    )
+
+
+def test_concurrent_calls_share_one_execution() -> None:
+    joined = threading.Semaphore(0)
+
+    class CountingFlight(SingleFlight[str]):
+        def begin(self, key: Hashable) -> tuple[Future[str], bool]:
+            result = super().begin(key)
+            joined.release()
+            return result
+
+    flight = CountingFlight()
+    release = threading.Event()
+    calls = []
+
+    def work() -> str:
+        calls.append(1)
+        release.wait(timeout=5)
+        return "docs"
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(flight.do, "key", work) for _ in range(8)]
+        for _ in range(8):
+            joined.acquire(timeout=5)
+        release.set()
+        results = [f.result() for f in futures]
+
+    assert results == ["docs"] * 8
+    assert len(calls) == 1
+    assert len(flight) == 0
+
+
+def test_failure_fans_out_and_key_is_forgotten() -> None:
+    flight: SingleFlight[str] = SingleFlight()
+    future, leader = flight.begin("key")
+    follower, is_leader = flight.begin("key")
+    assert leader and not is_leader and follower is future
+
+    flight.fail("key", future, ValueError("boom"))
+    with pytest.raises(ValueError):
+        follower.result()
+    assert flight.do("key", lambda: "fresh") == "fresh"
+
+
+@pytest.mark.asyncio
+async def test_async_waiters_receive_the_leader_result() -> None:
+    flight: SingleFlight[list[str]] = SingleFlight()
+    future, _ = flight.begin("key")
+    flight.resolve("key", future, ["event"])
+    assert await SingleFlight.wait(future) == ["event"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_async_leader_still_serves_its_followers() -> None:
+    flight: SingleFlight[str] = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def work() -> str:
+        started.set()
+        release.wait(timeout=5)
+        return "docs"
+
+    leader = asyncio.create_task(flight.do_async("key", work))
+    await asyncio.to_thread(started.wait, 5)
+    follower = asyncio.create_task(flight.do_async("key", work))
+    await asyncio.sleep(0)
+    leader.cancel()
+    release.set()
+
+    assert await asyncio.wait_for(follower, timeout=5) == "docs"
+    assert leader.cancelled()
+    assert not len(flight)
+
+
+def test_late_leader_does_not_forget_the_next_call() -> None:
+    flight: SingleFlight[str] = SingleFlight()
+    first, _ = flight.begin("key")
+    flight.resolve("key", first, "first")
+    second, leader = flight.begin("key")
+    assert leader and second is not first
+
+    flight.fail("key", first, RuntimeError("did not complete"))
+    assert first.result() == "first"
+    joined, is_leader = flight.begin("key")
+    assert joined is second and not is_leader
+
+
+@pytest.mark.asyncio
+async def test_followers_receive_items_as_they_are_published() -> None:
+    flights: StreamFlight[str] = StreamFlight()
+    stream, leader = flights.begin("key")
+    joined, is_leader = flights.begin("key")
+    assert leader and not is_leader and joined is stream
+
+    stream.publish("first")
+    received: list[str] = []
+    first_received = asyncio.Event()
+
+    async def follow() -> None:
+        async for item in joined.subscribe():
+            received.append(item)
+            first_received.set()
+
+    follower = asyncio.create_task(follow())
+    await asyncio.wait_for(first_received.wait(), timeout=5)
+    assert received == ["first"] and not follower.done()
+
+    stream.publish("second")
+    flights.finish("key", stream)
+    await asyncio.wait_for(follower, timeout=5)
+    assert received == ["first", "second"]
+    assert len(flights) == 0
+
+
+@pytest.mark.asyncio
+async def test_followers_on_another_thread_are_woken() -> None:
+    stream: Broadcast[int] = Broadcast()
+
+    def produce() -> None:
+        for i in range(3):
+            stream.publish(i)
+        stream.close()
+
+    items = []
+    producer = threading.Timer(0.05, produce)
+    producer.start()
+    async for item in stream.subscribe():
+        items.append(item)
+    producer.join()
+    assert items == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_leader_failure_is_raised_after_published_items() -> None:
+    flights: StreamFlight[str] = StreamFlight()
+    stream, _ = flights.begin("key")
+    stream.publish("partial")
+    flights.finish("key", stream, ValueError("boom"))
+
+    received = []
+    with pytest.raises(ValueError):
+        async for item in stream.subscribe():
+            received.append(item)
+    assert received == ["partial"]
+
+
+def test_finishing_a_stale_stream_keeps_the_new_one() -> None:
+    flights: StreamFlight[str] = StreamFlight()
+    first, _ = flights.begin("key")
+    flights.finish("key", first)
+    second, leader = flights.begin("key")
+    assert leader
+
+    flights.finish("key", first, RuntimeError("did not complete"))
+    assert flights.begin("key") == (second, False)
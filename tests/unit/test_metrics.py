@@ -0,0 +1,107 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections.abc import Iterator
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from google.adk.models import LlmResponse
+from google.genai import types
+from opentelemetry import metrics
+from opentelemetry.sdk.metrics import MeterProvider
+
+from app.utils.metrics import (
+    PrometheusTextFileExporter,
+    _CallbackTimings,
+    _estimate_quantile,
+    after_model,
+    before_model,
+    set_up_metrics,
+    stage_timer,
+)
+
+
+@pytest.fixture(scope="module")
+def metrics_file(tmp_path_factory: pytest.TempPathFactory) -> Iterator[Path]:
+    path = tmp_path_factory.mktemp("metrics") / "metrics.prom"
+    provider = set_up_metrics(
+        PrometheusTextFileExporter(str(path)), export_interval_ms=3_600_000
+    )
+    assert isinstance(provider, MeterProvider)
+    yield path
+    provider.shutdown()
+
+
+def read_metrics(path: Path) -> dict[str, float]:
+    lines = path.read_text().splitlines()
+    return {
+        name: float(value)
+        for name, value in (line.rsplit(" ", 1) for line in lines)
+        if not name.startswith("#")
+    }
+
+
+def test_estimate_quantile_interpolates_within_bucket() -> None:
+    bounds = [10, 100]
+    assert _estimate_quantile(bounds, [0, 10, 0], 0.5) == 55
+    assert _estimate_quantile(bounds, [0, 0, 4], 0.99) == 100
+    assert _estimate_quantile(bounds, [0, 0, 0], 0.5) == 0
+
+
+def test_nested_stages_record_exclusive_time(metrics_file: Path) -> None:
+    with pytest.raises(ValueError):
+        with stage_timer("test", "outer"):
+            with stage_timer("test", "inner"):
+                pass
+            raise ValueError("boom")
+
+    metrics.get_meter_provider().force_flush()
+    values = read_metrics(metrics_file)
+    labels = '{component="test",stage="outer"}'
+    assert values[f"agent_latency_ms_count{labels}"] == 1
+    assert f"agent_latency_ms_p95{labels}" in values
+    assert values[f"agent_errors_total{labels}"] == 1
+    assert 'agent_errors_total{component="test",stage="inner"}' not in values
+
+
+def test_llm_callbacks_count_tokens(metrics_file: Path) -> None:
+    context = MagicMock(invocation_id="inv-1", agent_name="search_agent")
+    before_model(context, MagicMock())
+    after_model(
+        context,
+        LlmResponse(
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=120, candidates_token_count=30
+            )
+        ),
+    )
+
+    metrics.get_meter_provider().force_flush()
+    values = read_metrics(metrics_file)
+    labels = '{component="search_agent",stage="llm"}'
+    assert values[f"agent_latency_ms_count{labels}"] == 1
+    prefix = 'agent_tokens_total{component="search_agent",direction='
+    assert values[f'{prefix}"in",stage="llm"}}'] == 120
+    assert values[f'{prefix}"out",stage="llm"}}'] == 30
+
+
+def test_abandoned_callback_timings_are_bounded() -> None:
+    timings = _CallbackTimings(max_entries=3)
+    for i in range(10):
+        timings.start("tool", f"call-{i}")
+    assert len(timings) == 3
+    assert timings.stop("tool", "call-0") is None
+    assert timings.stop("tool", "call-9") is not None
+    assert len(timings) == 2
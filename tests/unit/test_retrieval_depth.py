@@ -0,0 +1,101 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import pytest
+from langchain_core.documents import Document
+
+from app.utils.retrieval_depth import (
+    DEEP,
+    DEFAULT,
+    SHALLOW,
+    AdaptiveDepth,
+    first_stage_scores,
+)
+
+
+def chunk(embedding: list[float] | None) -> Document:
+    data = {"id": "1__0", "content": "La photosynthèse"}
+    if embedding is not None:
+        data["embedding"] = embedding
+    return Document(page_content=json.dumps(data))
+
+
+@pytest.mark.parametrize(
+    ("query", "depth"),
+    [
+        ("photosynthèse", SHALLOW),
+        ("définition de métaphore", SHALLOW),
+        ("Que dit le cours sur la photosynthèse ?", DEFAULT),
+        ("C'est quoi la différence entre un atome et une molécule ?", DEEP),
+        (
+            "Pour le contrôle de demain je dois savoir expliquer comment les "
+            "plantes fabriquent leur matière organique à partir de la lumière",
+            DEEP,
+        ),
+    ],
+)
+def test_choose_depth_from_query(query: str, depth: object) -> None:
+    assert AdaptiveDepth().choose(query) == depth
+
+
+def test_disabled_policy_uses_default_depth_and_always_reranks() -> None:
+    policy = AdaptiveDepth(enabled=False)
+    assert policy.choose("photosynthèse") == DEFAULT
+    assert policy.separated_count([0.9, 0.2, 0.1], top_n=5) is None
+
+
+def test_separated_count_cuts_at_the_widest_gap() -> None:
+    policy = AdaptiveDepth(skip_rerank_margin=0.1)
+    assert policy.separated_count([0.5, 0.91, 0.88, 0.55, 0.5], top_n=5) == 2
+    assert policy.separated_count([0.9, 0.3, 0.28, 0.1], top_n=1) == 1
+
+
+def test_close_scores_are_reranked() -> None:
+    policy = AdaptiveDepth(skip_rerank_margin=0.1)
+    assert policy.separated_count([0.82, 0.8, 0.79, 0.75], top_n=3) is None
+    # A gap below the top_n best does not make them separated
+    assert policy.separated_count([0.82, 0.8, 0.3], top_n=1) is None
+
+
+def test_skipped_rerank_keeps_top_n_documents() -> None:
+    policy = AdaptiveDepth(skip_rerank_margin=0.1)
+    scores = [0.5, 0.91, 0.88, 0.55, 0.45, 0.2]
+    documents = [Document(page_content=str(score)) for score in scores]
+
+    # Only two results are separated, the next best candidates fill up to top_n
+    kept = policy.keep_without_rerank(scores, documents, top_n=4)
+
+    assert [document.page_content for document in kept or []] == [
+        "0.91",
+        "0.88",
+        "0.55",
+        "0.5",
+    ]
+    assert len(policy.keep_without_rerank(scores[:3], documents[:3], 5) or []) == 3
+    assert policy.keep_without_rerank([0.82, 0.8, 0.79], documents[:3], 2) is None
+
+
+def test_first_stage_scores_is_cosine_similarity() -> None:
+    scores = first_stage_scores([1.0, 0.0], [chunk([2.0, 0.0]), chunk([1.0, 1.0])])
+    assert scores == pytest.approx([1.0, 2**-0.5])
+
+
+@pytest.mark.parametrize(
+    "document",
+    [chunk(None), chunk([1.0]), chunk([0.0, 0.0]), Document(page_content="texte")],
+)
+def test_first_stage_scores_needs_every_embedding(document: Document) -> None:
+    assert first_stage_scores([1.0, 0.0], [chunk([1.0, 0.0]), document]) is None
@@ -0,0 +1,92 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from google.auth.credentials import AnonymousCredentials
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, **kwargs: Any) -> None:
+        pass
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return [1.0] * 8
+
+
+# Importing the agents needs credentials: stub them out.
+with (
+    patch(
+        "google.auth.default",
+        return_value=(AnonymousCredentials(), "test-project"),
+    ),
+    patch("vertexai.init"),
+    patch("langchain_google_vertexai.VertexAIEmbeddings", FakeEmbeddings),
+):
+    from app import multi_agents
+
+
+class BlockingRetriever:
+    """Retriever whose searches block until released, counting them."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.release = threading.Event()
+
+    def invoke(self, query: str) -> list[Document]:
+        self.calls += 1
+        assert self.release.wait(timeout=5)
+        return [Document(page_content=f"Document {i}") for i in range(3)]
+
+
+class PassThroughCompressor:
+    def compress_documents(
+        self, documents: list[Document], query: str
+    ) -> list[Document]:
+        return documents
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_queries_share_one_search() -> None:
+    retriever = BlockingRetriever()
+    with (
+        patch.object(multi_agents, "retriever", retriever),
+        patch.object(multi_agents, "compressor", PassThroughCompressor()),
+    ):
+        leader = asyncio.create_task(
+            multi_agents.retrieve_docs("Qu'est-ce que la photosynthèse ?")
+        )
+        # The search runs in a thread: the event loop is free meanwhile
+        while not retriever.calls:
+            await asyncio.sleep(0.01)
+        follower = asyncio.create_task(
+            multi_agents.retrieve_docs("qu'est-ce que la  Photosynthèse ?")
+        )
+        await asyncio.sleep(0.05)
+        retriever.release.set()
+        results = await asyncio.wait_for(asyncio.gather(leader, follower), 5)
+
+    assert retriever.calls == 1
+    assert results[0] == results[1]
+    assert "Document 2" in results[0]
+    assert not len(multi_agents.retrieval_flight)
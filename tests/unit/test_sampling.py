@@ -0,0 +1,74 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+from opentelemetry.trace import Status, StatusCode
+
+from app.utils.sampling import TailSamplingSpanProcessor
+
+
+def make_tracer(
+    sample_rate: float, slow_threshold_ms: float = 10_000
+) -> tuple[TracerProvider, InMemorySpanExporter]:
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(
+        TailSamplingSpanProcessor(
+            SimpleSpanProcessor(exporter),
+            sample_rate=sample_rate,
+            slow_threshold_ms=slow_threshold_ms,
+        )
+    )
+    return provider, exporter
+
+
+def test_boring_traces_are_dropped() -> None:
+    provider, exporter = make_tracer(sample_rate=0.0)
+    tracer = provider.get_tracer(__name__)
+    with tracer.start_as_current_span("invocation"):
+        with tracer.start_as_current_span("execute_tool retrieve_docs"):
+            pass
+    assert exporter.get_finished_spans() == ()
+
+
+def test_failed_traces_are_kept_whole() -> None:
+    provider, exporter = make_tracer(sample_rate=0.0)
+    tracer = provider.get_tracer(__name__)
+    with tracer.start_as_current_span("invocation"):
+        with tracer.start_as_current_span("execute_tool retrieve_docs") as span:
+            span.set_status(Status(StatusCode.ERROR, "Retriever not available"))
+        with tracer.start_as_current_span("call_llm"):
+            pass
+    names = [span.name for span in exporter.get_finished_spans()]
+    assert names == ["execute_tool retrieve_docs", "call_llm", "invocation"]
+
+
+def test_slow_traces_are_kept() -> None:
+    provider, exporter = make_tracer(sample_rate=0.0, slow_threshold_ms=0)
+    tracer = provider.get_tracer(__name__)
+    with tracer.start_as_current_span("invocation"):
+        pass
+    assert len(exporter.get_finished_spans()) == 1
+
+
+def test_sampled_traces_are_kept() -> None:
+    provider, exporter = make_tracer(sample_rate=1.0)
+    tracer = provider.get_tracer(__name__)
+    with tracer.start_as_current_span("invocation"):
+        pass
+    assert len(exporter.get_finished_spans()) == 1
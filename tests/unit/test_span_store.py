@@ -0,0 +1,77 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+
+from app.utils.span_store import LocalSpanStore
+
+MS = 1_000_000
+
+
+def record_invocation(
+    provider: TracerProvider, start: int, llm_ms: int, tool_ms: int
+) -> None:
+    """Record an orchestrator turn: one LLM call followed by one tool call."""
+    tracer = provider.get_tracer(__name__)
+    root = tracer.start_span("invocation", start_time=start)
+    with trace.use_span(root, end_on_exit=False):
+        llm = tracer.start_span(
+            "call_llm",
+            start_time=start,
+            attributes={"gcp.vertex.agent.invocation_id": f"e-{start}"},
+        )
+        llm.end(end_time=start + llm_ms * MS)
+        tool = tracer.start_span("execute_tool retrieve_docs", start_time=llm.end_time)
+        tool.end(end_time=llm.end_time + tool_ms * MS)
+    root.end(end_time=tool.end_time)
+
+
+def make_store(max_spans: int = 100) -> tuple[TracerProvider, LocalSpanStore]:
+    store = LocalSpanStore(max_spans)
+    provider = TracerProvider()
+    provider.add_span_processor(store)
+    return provider, store
+
+
+def test_slowest_traces_and_critical_path() -> None:
+    provider, store = make_store()
+    record_invocation(provider, start=1 * 10**9, llm_ms=100, tool_ms=50)
+    record_invocation(provider, start=2 * 10**9, llm_ms=100, tool_ms=900)
+
+    slowest = store.slowest_traces(1)
+    assert len(slowest) == 1
+    assert slowest[0]["duration_ms"] == 1000
+    assert slowest[0]["invocation_id"] == f"e-{2 * 10**9}"
+
+    path = store.critical_path(slowest[0]["invocation_id"])
+    assert [span.name for span in path] == ["invocation", "execute_tool retrieve_docs"]
+    assert store.critical_path("unknown") == []
+
+
+def test_latency_percentiles_per_span_name() -> None:
+    provider, store = make_store(max_spans=300)
+    for i in range(1, 101):
+        record_invocation(provider, start=i * 10**9, llm_ms=i, tool_ms=1)
+
+    stats = store.latency_percentiles()["call_llm"]
+    assert stats == {"count": 100, "p50": 50, "p95": 95, "p99": 99}
+
+
+def test_ring_buffer_keeps_the_latest_spans() -> None:
+    provider, store = make_store(max_spans=3)
+    record_invocation(provider, start=1 * 10**9, llm_ms=1, tool_ms=1)
+    record_invocation(provider, start=2 * 10**9, llm_ms=1, tool_ms=1)
+    assert len(store.records()) == 3
+    assert {span.start_ns for span in store.records()} == {2 * 10**9, 2 * 10**9 + MS}
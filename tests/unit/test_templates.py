@@ -0,0 +1,41 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from jinja2.sandbox import SandboxedEnvironment
+from langchain_core.documents import Document
+
+from app.templates import CONTEXT_TEMPLATE, format_docs
+
+DOCS = [
+    Document(page_content="La photosynthèse\n\nSe produit dans les chloroplastes."),
+    Document(page_content="<b>2 < 3 & 3 > 2</b> {{ pas un gabarit }} {% raw %}"),
+    Document(page_content="Se termine par des sauts de ligne\n\n"),
+    Document(page_content=""),
+]
+
+
+@pytest.mark.parametrize("count", [0, 1, len(DOCS)])
+def test_format_matches_jinja_template(count: int) -> None:
+    expected = (
+        SandboxedEnvironment().from_string(CONTEXT_TEMPLATE).render(docs=DOCS[:count])
+    )
+    assert format_docs.format(docs=DOCS[:count]) == expected
+
+
+def test_iter_format_yields_header_then_one_piece_per_document() -> None:
+    pieces = list(format_docs.iter_format(docs=DOCS))
+    assert len(pieces) == len(DOCS) + 1
+    assert pieces[0] == "## Context provided:\n"
+    assert "".join(pieces) == format_docs.format(docs=DOCS)
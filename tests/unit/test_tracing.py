@@ -0,0 +1,149 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import json
+from unittest.mock import MagicMock
+
+import pytest
+from google.api_core.exceptions import InvalidArgument
+from google.rpc.error_details_pb2 import DebugInfo
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExportResult
+from opentelemetry.trace import SpanContext, TraceFlags
+
+from app.utils.tracing import MAX_LOG_ATTRIBUTES_BYTES, CloudTraceLoggingSpanExporter
+
+
+def make_span(span_id: int, attributes: dict) -> ReadableSpan:
+    context = SpanContext(
+        trace_id=0x5B8EFFF798038103D269B633813FC60C,
+        span_id=span_id,
+        is_remote=False,
+        trace_flags=TraceFlags(TraceFlags.SAMPLED),
+    )
+    return ReadableSpan(
+        name="call_llm",
+        context=context,
+        resource=Resource.create({"service.name": "test"}),
+        attributes=attributes,
+        start_time=1_000,
+        end_time=2_000,
+    )
+
+
+@pytest.fixture
+def exporter() -> CloudTraceLoggingSpanExporter:
+    return CloudTraceLoggingSpanExporter(
+        project_id="test-project",
+        client=MagicMock(),
+        logging_client=MagicMock(),
+        storage_client=MagicMock(),
+    )
+
+
+def test_span_dict_matches_to_json(exporter: CloudTraceLoggingSpanExporter) -> None:
+    span = make_span(0xEEE19B7EC3C1B174, {"tokens": 12, "models": ("a", "b")})
+    span_dict = exporter._span_to_dict(span)
+
+    expected = json.loads(span.to_json())
+    assert {k: span_dict[k] for k in expected} == expected
+    assert span_dict["trace"] == (
+        "projects/test-project/traces/5b8efff798038103d269b633813fc60c"
+    )
+    assert span_dict["span_id"] == "eee19b7ec3c1b174"
+
+
+def test_export_writes_one_log_batch(exporter: CloudTraceLoggingSpanExporter) -> None:
+    spans = [make_span(i + 1, {"i": i}) for i in range(5)]
+    exporter.export(spans)
+    exporter.shutdown()
+
+    log_batch = exporter.logger.batch.return_value
+    assert log_batch.log_struct.call_count == 5
+    log_batch.commit.assert_called_once()
+    exporter.logger.log_struct.assert_not_called()
+
+
+def test_rejected_entries_do_not_fail_the_batch(
+    exporter: CloudTraceLoggingSpanExporter, caplog: pytest.LogCaptureFixture
+) -> None:
+    log_batch = exporter.logger.batch.return_value
+    log_batch.commit.side_effect = InvalidArgument(
+        "Log entry too large",
+        details=[DebugInfo(detail="log_entry_errors { key: 1 value { code: 3 } }")],
+    )
+    spans = [make_span(i + 1, {"i": i}) for i in range(3)]
+
+    result = exporter.export(spans)
+    exporter.shutdown()
+
+    log_batch.commit.assert_called_once_with(partial_success=True)
+    assert result != SpanExportResult.FAILURE
+    assert "['0000000000000002']" in caplog.text
+
+
+def test_only_oversized_attributes_are_offloaded(
+    exporter: CloudTraceLoggingSpanExporter,
+) -> None:
+    large = "x" * (300 * 1024)
+    spans = [
+        make_span(1, {"llm_request": large, "model": "gemini"}),
+        make_span(2, {"llm_response": large}),
+    ]
+    exporter.export(spans)
+    exporter.shutdown()
+
+    entries = exporter.logger.batch.return_value.log_struct.call_args_list
+    attributes = entries[0].args[0]["attributes"]
+    assert attributes["model"] == "gemini"
+    assert attributes["offloaded_attributes"] == ["llm_request"]
+
+    # Both spans share one uploaded object, each value has its own byte range.
+    blob = exporter.bucket.blob.return_value
+    blob.upload_from_string.assert_called_once()
+    content = blob.upload_from_string.call_args.args[0]
+    reference = attributes["llm_request"]
+    assert reference.startswith(f"gs://{exporter.bucket_name}/spans/batch-")
+    first, last = map(int, reference.split("#bytes=")[1].split("-"))
+    record = json.loads(gzip.decompress(content[first : last + 1]))
+    assert record == {
+        "span_id": "0000000000000001",
+        "attribute": "llm_request",
+        "value": large,
+    }
+    assert len(gzip.decompress(content).splitlines()) == 2
+
+
+def test_json_escaping_counts_towards_the_limit(
+    exporter: CloudTraceLoggingSpanExporter,
+) -> None:
+    # 200 KB of text, but above 255 KB once its quotes and newlines are escaped
+    request = '{"role":"user",\n"text":"a"}' * (200 * 1024 // 27)
+    assert len(request.encode()) < MAX_LOG_ATTRIBUTES_BYTES < len(json.dumps(request))
+    spans = [make_span(1, {"llm_request": request, "model": "gemini"})]
+
+    exporter.export(spans)
+    exporter.shutdown()
+
+    entry = exporter.logger.batch.return_value.log_struct.call_args.args[0]
+    assert entry["attributes"]["offloaded_attributes"] == ["llm_request"]
+    assert len(json.dumps(entry["attributes"])) <= MAX_LOG_ATTRIBUTES_BYTES
+
+
+def test_bucket_existence_is_cached(exporter: CloudTraceLoggingSpanExporter) -> None:
+    for _ in range(3):
+        assert exporter._bucket_exists()
+    exporter.bucket.exists.assert_called_once()